@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Delivery Priority Load Test
+
+This script floods the asynchronous delivery queue with 1,000 low-severity
+notifications, submits an emergency notification after every 50 of them, and
+reports the queue wait of each severity with:
+
+- fifo: notifications delivered in submission order
+- priority: notifications delivered most severe first, with aging
+
+Each service call is simulated with a short sleep standing in for a Home
+Assistant round trip.
+"""
+
+import sys
+import os
+import time
+
+# Add parent directory to path to import from smart_notification_router
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from smart_notification_router.tag_routing.delivery import DeliveryQueue
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+from smart_notification_router.tag_routing.severity import SeverityModel
+
+
+STORM = 1_000
+EMERGENCY_EVERY = 50
+WORKERS = 4
+CALL_SECONDS = 0.005
+
+
+def deliver(services, payload):
+    """Simulate delivering a notification to its services."""
+    time.sleep(CALL_SECONDS)
+    return {service: {"result": "ok"} for service in services}
+
+
+def run_storm(rank):
+    """Run the storm through a delivery queue.
+
+    Args:
+        rank (callable): Severity rank function, None for FIFO delivery
+
+    Returns:
+        dict: Latency statistics per severity
+    """
+    delivery_queue = DeliveryQueue(deliver, workers=WORKERS, rank=rank)
+    payload = NotificationPayload("Power restored", "Automation triggered")
+
+    for n in range(STORM):
+        delivery_queue.submit(["notify.phone"], payload, severity="low")
+        if n % EMERGENCY_EVERY == EMERGENCY_EVERY - 1:
+            delivery_queue.submit(["notify.phone"], payload, severity="emergency")
+    delivery_queue.join()
+
+    latency = delivery_queue.stats()["latency"]
+    delivery_queue.shutdown()
+    return latency
+
+
+def main():
+    """Main function to run the load test."""
+    model = SeverityModel()
+
+    print(f"\n===== Delivery Priority Load Test ({STORM} low, {STORM // EMERGENCY_EVERY} emergency, "
+          f"{WORKERS} workers) =====\n")
+    print(f"{'scheduler':<10} {'severity':<10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    for name, rank in (("fifo", None), ("priority", model.rank)):
+        latency = run_storm(rank)
+        for severity in ("emergency", "low"):
+            stats = latency[severity]
+            print(f"{name:<10} {severity:<10} {stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f} "
+                  f"{stats['max_ms']:>9.1f}")
+
+    print()
+
+
+if __name__ == "__main__":
+    main()
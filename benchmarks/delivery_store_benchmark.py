@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Delivery Store Benchmark
+
+This script measures sustained rates of the durable delivery queue on the
+storage it is pointed at (run it on the SD card or disk the add-on uses):
+
+- enqueue: durable DeliveryStore.add() calls per second from concurrent
+  producers, and how many writes each group commit carried
+- end-to-end: notifications per second submitted to a store-backed
+  DeliveryQueue, delivered by a no-op deliver function and written back
+
+Usage: python benchmarks/delivery_store_benchmark.py [directory]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Add parent directory to path to import from smart_notification_router
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from smart_notification_router.tag_routing.delivery import DeliveryQueue, DeliveryRecord
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+from smart_notification_router.tag_routing.store import DeliveryStore
+
+
+NOTIFICATIONS = 2_000
+SERVICES = ["notify.phone", "notify.watch", "persistent_notification.create"]
+PAYLOAD = NotificationPayload("Front door", "The front door was opened", {"priority": "high"})
+
+
+def enqueue_rate(path, producers, commit_delay):
+    """Measure durable enqueues per second.
+
+    Args:
+        path (str): Database file path
+        producers (int): Number of concurrent producer threads
+        commit_delay (float): Writer batching delay in seconds
+
+    Returns:
+        tuple: (enqueues per second, writes per commit)
+    """
+    store = DeliveryStore(path, commit_delay=commit_delay)
+    per_producer = NOTIFICATIONS // producers
+
+    def produce(worker):
+        for n in range(per_producer):
+            store.add(DeliveryRecord(f"{worker}-{n}", SERVICES, PAYLOAD))
+
+    threads = [threading.Thread(target=produce, args=(worker,)) for worker in range(producers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = store.stats()
+    store.close()
+    return per_producer * producers / elapsed, stats["writes"] / max(1, stats["commits"])
+
+
+def end_to_end_rate(path, workers):
+    """Measure notifications per second through a store-backed queue.
+
+    Args:
+        path (str): Database file path
+        workers (int): Number of delivery worker threads
+
+    Returns:
+        float: Notifications submitted, delivered and recorded per second
+    """
+    store = DeliveryStore(path)
+    delivery_queue = DeliveryQueue(lambda services, payload: {service: {} for service in services},
+                                   workers=workers, store=store)
+
+    started = time.perf_counter()
+    for _ in range(NOTIFICATIONS):
+        delivery_queue.submit(SERVICES, PAYLOAD)
+    delivery_queue.join()
+    store.flush()
+    elapsed = time.perf_counter() - started
+
+    delivery_queue.shutdown()
+    store.close()
+    return NOTIFICATIONS / elapsed
+
+
+def main():
+    """Main function to run the benchmark."""
+    base = sys.argv[1] if len(sys.argv) > 1 else None
+    directory = tempfile.mkdtemp(prefix="delivery-store-", dir=base)
+
+    try:
+        print(f"\n===== Delivery Store Benchmark ({directory}) =====\n")
+        print(f"{'producers':>9} {'delay ms':>9} {'enqueue/s':>11} {'writes/commit':>14}")
+        for producers in (1, 4, 16):
+            for commit_delay in (0.0, 0.005):
+                path = os.path.join(directory, f"enqueue-{producers}-{commit_delay}.db")
+                rate, batch = enqueue_rate(path, producers, commit_delay)
+                print(f"{producers:>9} {commit_delay * 1000:>9.0f} {rate:>11.0f} {batch:>14.1f}")
+
+        print(f"\n{'workers':>9} {'notifications/s':>16}")
+        for workers in (1, 4):
+            path = os.path.join(directory, f"end-to-end-{workers}.db")
+            print(f"{workers:>9} {end_to_end_rate(path, workers):>16.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tag Expression Parser Benchmark
+
+This script measures how parsing time grows with the number of terms in a
+tag expression. With the single-pass tokenizer the time per term should stay
+roughly constant as expressions get longer.
+"""
+
+import sys
+import os
+import random
+import timeit
+
+# Add parent directory to path to import from smart_notification_router
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from smart_notification_router.tag_routing.parser import TagExpressionParser
+
+
+OPERATORS = ["+", "|", "-"]
+
+
+def generate_expression(terms, nesting=0, seed=42):
+    """Generate a random expression with the given number of terms.
+    
+    Args:
+        terms (int): Number of tags in the expression
+        nesting (int): Wrap every group of this many terms in parentheses (0 for none)
+        seed (int): Random seed
+        
+    Returns:
+        str: Generated tag expression
+    """
+    rng = random.Random(seed)
+    parts = []
+    for i in range(terms):
+        tag = f"tag{rng.randint(0, 50)}:value{rng.randint(0, 50)}"
+        if nesting and i % nesting == 0 and i + nesting <= terms:
+            tag = "(" + tag
+        if nesting and i % nesting == nesting - 1 and i >= nesting - 1:
+            tag = tag + ")"
+        parts.append(tag)
+        if i < terms - 1:
+            parts.append(rng.choice(OPERATORS))
+    return "".join(parts)
+
+
+def benchmark(parser, expression, repeat=5):
+    """Measure the best time to parse an expression.
+    
+    Args:
+        parser (TagExpressionParser): Parser instance
+        expression (str): Expression to parse
+        repeat (int): Number of timing runs
+        
+    Returns:
+        float: Best time in seconds for a single parse
+    """
+    number = 20
+    timings = timeit.repeat(lambda: parser.parse(expression), number=number, repeat=repeat)
+    return min(timings) / number
+
+
+def main():
+    """Main function to run the benchmark."""
+    parser = TagExpressionParser(max_length=1_000_000)
+    
+    print("\n===== Tag Expression Parser Benchmark =====\n")
+    print(f"{'terms':>8} {'nesting':>8} {'length':>8} {'time (ms)':>12} {'us/term':>10}")
+    
+    for nesting in (0, 4):
+        for terms in (100, 200, 400, 800, 1600, 3200):
+            expression = generate_expression(terms, nesting=nesting)
+            elapsed = benchmark(parser, expression)
+            print(
+                f"{terms:>8} {nesting:>8} {len(expression):>8} "
+                f"{elapsed * 1000:>12.3f} {elapsed * 1e6 / terms:>10.2f}"
+            )
+    
+    print("\nA flat us/term column indicates linear scaling.\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Retry Timer Benchmark
+
+This script compares the structures that can hold pending retries:
+
+- heap: a binary heap of (due, sequence, item) entries (O(log n) insert)
+- wheel: the hashed timing wheel used by the retry scheduler (O(1) insert)
+
+For several numbers of pending retries it reports the cost of scheduling one
+more retry and of expiring everything due within the first minute.
+"""
+
+import sys
+import os
+import heapq
+import itertools
+import random
+import time
+
+# Add parent directory to path to import from smart_notification_router
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from smart_notification_router.tag_routing.retry import RetryPolicy, TimingWheel
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def generate_delays(count, seed=42):
+    """Generate backoff delays of retries at random attempts.
+
+    Args:
+        count (int): Number of delays
+        seed (int): Random seed
+
+    Returns:
+        list: Delays in seconds
+    """
+    rng = random.Random(seed)
+    policy = RetryPolicy(max_retries=5, retry_interval=5, max_interval=300, rng=rng)
+    return [policy.delay(rng.randint(1, 5)) for _ in range(count)]
+
+
+def heap_run(delays):
+    """Schedule and expire the delays with a heap; return (insert us, expire ms)."""
+    heap = []
+    sequence = itertools.count()
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        heapq.heappush(heap, (delay, next(sequence), index))
+    insert_us = (time.perf_counter() - started) / len(delays) * 1e6
+
+    started = time.perf_counter()
+    for now in range(1, 61):
+        while heap and heap[0][0] <= now:
+            heapq.heappop(heap)
+    return insert_us, (time.perf_counter() - started) * 1000
+
+
+def wheel_run(delays):
+    """Schedule and expire the delays with a timing wheel; return (insert us, expire ms)."""
+    clock = FakeClock()
+    wheel = TimingWheel(clock=clock)
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        wheel.schedule(delay, index)
+    insert_us = (time.perf_counter() - started) / len(delays) * 1e6
+
+    started = time.perf_counter()
+    for now in range(1, 61):
+        clock.now = now
+        wheel.advance()
+    return insert_us, (time.perf_counter() - started) * 1000
+
+
+def main():
+    """Main function to run the benchmark."""
+    print("\n===== Retry Timer Benchmark =====\n")
+    print(f"{'pending':>9} {'heap insert us':>15} {'wheel insert us':>16} "
+          f"{'heap expire ms':>15} {'wheel expire ms':>16}")
+
+    for count in (1_000, 10_000, 100_000):
+        delays = generate_delays(count)
+        heap_insert, heap_expire = heap_run(delays)
+        wheel_insert, wheel_expire = wheel_run(delays)
+        print(f"{count:>9} {heap_insert:>15.3f} {wheel_insert:>16.3f} "
+              f"{heap_expire:>15.3f} {wheel_expire:>16.3f}")
+
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tag Resolution Benchmark
+
+This script compares ways of evaluating a tag expression against every entity
+in the registry:
+
+- tree: the reference per-entity TagNode.evaluate() loop
+- compiled: the per-entity loop with a compiled evaluator
+- sets: set algebra over the inverted tag index
+- bitset: bitwise operations over the interned tag bitmaps
+"""
+
+import sys
+import os
+import random
+import timeit
+
+# Add parent directory to path to import from smart_notification_router
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from smart_notification_router.tag_routing.parser import TagExpressionParser
+from smart_notification_router.tag_routing.compiler import compile_tree
+from smart_notification_router.tag_routing.tag_index import TagIndex
+
+
+EXPRESSIONS = [
+    "user:u1+device:mobile",
+    "device:mobile|device:speaker",
+    "area:a1|area:a2|area:a3-device:speaker",
+]
+
+
+def generate_entities(count, seed=42):
+    """Generate random entity tags.
+    
+    Args:
+        count (int): Number of entities
+        seed (int): Random seed
+        
+    Returns:
+        dict: Mapping of entity IDs to lists of tags
+    """
+    rng = random.Random(seed)
+    devices = ["mobile", "speaker", "display", "light", "sensor"]
+    entity_tags = {}
+    for i in range(count):
+        entity_tags[f"sensor.entity_{i}"] = [
+            f"user:u{rng.randint(0, 20)}",
+            f"area:a{rng.randint(0, 30)}",
+            f"device:{rng.choice(devices)}",
+        ]
+    return entity_tags
+
+
+def best_time(function, number):
+    """Get the best per-call time in milliseconds."""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1000
+
+
+def main():
+    """Main function to run the benchmark."""
+    parser = TagExpressionParser()
+    
+    print("\n===== Tag Resolution Benchmark (ms per whole-registry query) =====\n")
+    print(f"{'entities':>9} {'expression':<42} {'tree':>9} {'compiled':>9} {'sets':>9} {'bitset':>9}")
+    
+    for count in (1_000, 10_000, 100_000):
+        entity_tags = generate_entities(count)
+        tag_sets = {entity_id: frozenset(tags) for entity_id, tags in entity_tags.items()}
+        index = TagIndex()
+        index.rebuild(entity_tags)
+        number = max(1, 10_000 // count)
+        
+        for expression in EXPRESSIONS:
+            tree = parser.parse(expression)
+            compiled = compile_tree(tree)
+            
+            tree_ms = best_time(
+                lambda: [e for e, tags in entity_tags.items() if tree.evaluate(tags)], number)
+            compiled_ms = best_time(
+                lambda: [e for e, tags in tag_sets.items() if compiled.matches(tags)], number)
+            sets_ms = best_time(lambda: set(index._resolve(tree)), number)
+            bitset_ms = best_time(
+                lambda: index.entities_in_mask(index.match_mask(tree)), number)
+            
+            print(
+                f"{count:>9} {expression:<42} {tree_ms:>9.3f} {compiled_ms:>9.3f} "
+                f"{sets_ms:>9.3f} {bitset_ms:>9.3f}"
+            )
+    
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,19 @@ import json
 import hashlib
 import yaml
 import datetime
+import functools
+from collections import deque
 from flask import Flask, request, jsonify, send_from_directory, render_template, Response
 
 # Import the tag parser
-from tag_routing.parser import TagExpressionParser, TagLiteral, TagOperator
+from tag_routing.parser import get_parse_cache, parse_expression
+from tag_routing.compiler import compile_expression, get_compiled_cache
 from tag_routing.entity_manager import EntityManager, EntityTagManager
-from tag_routing.ha_client import HomeAssistantAPIClient
-from tag_routing.notification_router import NotificationRouter
+from tag_routing.ha_client import HomeAssistantAPIClient, NotificationPayload
+from tag_routing.notification_router import NotificationRouter, unique_service_names
+from tag_routing.delivery import DeliveryQueue
+from tag_routing.retry import RetryPolicy
+from tag_routing.store import DeliveryStore
 
 # Set up logging
 logging.basicConfig(
@@ -59,7 +65,7 @@ DEFAULT_CONFIG = {
 # In-memory message cache for deduplication
 message_cache = {}
 deduplication_ttl = 300  # default: 5 minutes (300 seconds)
-notification_history = []  # Store recent notifications
+notification_history = deque(maxlen=20)  # Store recent notifications
 
 # Load add-on options
 
@@ -128,6 +134,61 @@ if options:
 # Initialize the notification router with the config
 notification_router = NotificationRouter(ha_client, config)
 
+
+def record_async_delivery(record):
+    """Add an asynchronously delivered notification to the history."""
+    # Retries of a synchronous notification, which is in the history already
+    if record.context.get('history_recorded'):
+        return
+    sent = [service for service, result in record.services.items() if result['status'] == 'sent']
+    failed = [{'service': service, 'error': result.get('error')}
+              for service, result in record.services.items() if result['status'] == 'failed']
+    notification_history.append(dict(
+        record.context,
+        timestamp=datetime.datetime.now().isoformat(),
+        routed_to=sent,
+        routing_success=bool(sent) or not record.services,
+        failed_services=failed,
+        tracking_id=record.tracking_id
+    ))
+
+
+def open_delivery_store():
+    """Open the on-disk store of queued notifications, if there is somewhere to keep it."""
+    path = options.get('delivery_store', config.get('delivery_store'))
+    if path is None and os.path.isdir('/data'):
+        path = '/data/delivery_queue.db'
+    if not path:
+        return None
+    try:
+        return DeliveryStore(path)
+    except Exception as e:
+        logger.error(f"Error opening delivery store {path}, queued notifications will not survive restarts: {e}")
+        return None
+
+
+# Queue for notifications sent with "async": service calls happen in the background.
+# Accepted notifications are kept on disk and undelivered ones are replayed at startup.
+# Workers never wait for a rate-limit slot; such calls are rescheduled instead.
+delivery_queue = DeliveryQueue(
+    functools.partial(notification_router.call_services, max_wait=0),
+    workers=config.get('delivery_workers', 4),
+    on_complete=record_async_delivery,
+    store=open_delivery_store(),
+    rank=notification_router.get_severity_level_index,
+    aging_interval=config.get('delivery_aging_interval', 10.0),
+    retry_policy=RetryPolicy.from_config(config['retry']) if 'retry' in config else None
+)
+delivery_queue.replay()
+
+
+def is_async_request(data):
+    """Check whether a notification request opted in to asynchronous delivery."""
+    value = data.get('async', request.args.get('async', False))
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
 # Helper function to check message deduplication
 
 
@@ -282,7 +343,8 @@ def notify():
                 'title': request.form.get('title', ''),
                 'message': request.form.get('message', ''),
                 'severity': request.form.get('severity', 'medium'),
-                'audience': request.form.getlist('audience')
+                'audience': request.form.getlist('audience'),
+                'async': request.form.get('async', False)
             }
 
         if not data:
@@ -307,6 +369,30 @@ def notify():
         logger.info(
             f"Notification received: {title} ({severity}) -> {audiences}")
 
+        if is_async_request(data):
+            # Route now, deliver in the background and report the tracking ID
+            services = unique_service_names(
+                notification_router.select_services(severity, audiences))
+            tracking_id = delivery_queue.submit(
+                services,
+                NotificationPayload(title, message, additional_data),
+                context={
+                    'title': title,
+                    'message': message,
+                    'severity': severity,
+                    'audiences': audiences
+                },
+                severity=severity
+            )
+            return jsonify({
+                'success': True,
+                'status': 'queued',
+                'message': 'Notification queued for delivery',
+                'tracking_id': tracking_id,
+                'status_url': f'/notify/status/{tracking_id}',
+                'services': services
+            }), 202
+
         # Route the notification using our new NotificationRouter
         routing_result = notification_router.route_notification(
             title=title,
@@ -316,6 +402,26 @@ def notify():
             data=additional_data
         )
 
+        # Retry failed services in the background with backoff; the notification
+        # was already sent, so a retry that cannot be stored is only logged
+        failed_services = routing_result.get('failed_services', [])
+        try:
+            retry_tracking_id = delivery_queue.retry(
+                {failed['service']: failed['error'] for failed in failed_services},
+                NotificationPayload(title, message, additional_data),
+                context={
+                    'title': title,
+                    'message': message,
+                    'severity': severity,
+                    'audiences': audiences,
+                    'history_recorded': True
+                },
+                severity=severity
+            )
+        except Exception as e:
+            logger.error(f"Error scheduling retries of failed services: {e}")
+            retry_tracking_id = None
+
         # Add to notification history with routing results
         history_entry = {
             'title': title,
@@ -325,14 +431,12 @@ def notify():
             'timestamp': datetime.datetime.now().isoformat(),
             'routed_to': routing_result.get('sent_to_services', []),
             'routing_success': routing_result.get('success', False),
-            'failed_services': routing_result.get('failed_services', [])
+            'failed_services': failed_services,
+            'retry_tracking_id': retry_tracking_id
         }
+        # The history keeps the last 20 items
         notification_history.append(history_entry)
 
-        # Keep history to last 20 items
-        if len(notification_history) > 20:
-            notification_history.pop(0)
-
         return jsonify({
             'success': routing_result.get('success', False),
             'status': 'ok',
@@ -344,7 +448,8 @@ def notify():
                 'severity': severity,
                 'audiences': audiences,
                 'services_notified': routing_result.get('sent_to_services', []),
-                'failed_services': routing_result.get('failed_services', [])
+                'failed_services': failed_services,
+                'retry_tracking_id': retry_tracking_id
             }
         })
 
@@ -352,6 +457,16 @@ def notify():
         logger.error(f"Error processing notification: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Delivery status of an asynchronously sent notification
+
+
+@app.route('/notify/status/<tracking_id>')
+def notify_status(tracking_id):
+    delivery = delivery_queue.get_status(tracking_id)
+    if delivery is None:
+        return jsonify({'success': False, 'error': f'Unknown tracking ID: {tracking_id}'}), 404
+    return jsonify(dict(delivery, success=True))
+
 # Status endpoint to check if service is running
 
 
@@ -364,6 +479,11 @@ def status():
         'message_count': len(message_cache),
         'deduplication_ttl': deduplication_ttl,
         'notification_count': len(notification_history),
+        'parse_cache': get_parse_cache().stats(),
+        'compiled_cache': get_compiled_cache().stats(),
+        'ha_requests': ha_client.inflight.stats(),
+        'delivery_queue': delivery_queue.stats(),
+        'rate_limits': notification_router.get_rate_limit_stats(),
         'timestamp': datetime.datetime.now().isoformat()
     })
 
@@ -445,6 +565,9 @@ def configuration():
                 if new_audiences:
                     config['audiences'] = new_audiences
 
+            # Recompile the severity model and audience routing table
+            notification_router.update_config(config)
+
             return jsonify({
                 'status': 'ok',
                 'message': 'Configuration updated successfully'
@@ -464,7 +587,7 @@ def configuration():
 def get_notifications():
     return jsonify({
         'status': 'ok',
-        'notifications': notification_history
+        'notifications': list(notification_history)
     })
 
 # Debug routes endpoint
@@ -499,7 +622,9 @@ def debug():
         'config': config,
         'cache_info': {
             'message_cache_count': len(message_cache),
-            'deduplication_ttl': deduplication_ttl
+            'deduplication_ttl': deduplication_ttl,
+            'parse_cache': get_parse_cache().stats(),
+            'compiled_cache': get_compiled_cache().stats()
         },
         'notification_history': len(notification_history),
         'environment': dict(os.environ),
@@ -657,22 +782,21 @@ def test_expression_v2():
                 'error': 'Expression is required'
             }), 400
 
-        # Create a tag expression parser
-        parser = TagExpressionParser()
-
         try:
-            # Parse the expression
-            parse_tree = parser.parse(expression)
+            # Parse and compile the expression (cached process-wide)
+            compiled = compile_expression(expression)
 
-            # Get expression tree for visualization
-            expression_tree = parse_tree.to_dict() if hasattr(parse_tree, 'to_dict') else {
-                "error": "Expression tree not available"}
+            # Get expression tree for visualization (as written, before simplification)
+            expression_tree = parse_expression(expression).to_dict()
 
             # Get all entities
             entities = entity_manager.get_entities()
             entity_tags = entity_manager.get_entity_tags()
 
-            # Test expression against each entity
+            # Resolve the expression against the inverted tag index
+            matching_ids = entity_manager.tag_index.resolve(compiled)
+
+            # Split entities into matches and non-matches
             matches = []
             non_matches = []
 
@@ -680,8 +804,7 @@ def test_expression_v2():
                 entity_id = entity['entity_id']
                 entity_tag_list = entity_tags.get(entity_id, [])
 
-                # Evaluate if entity matches the expression
-                if parse_tree.evaluate(entity_tag_list):
+                if entity_id in matching_ids:
                     # Add to matches with tags
                     entity_copy = entity.copy()
                     entity_copy['tags'] = entity_tag_list
@@ -695,6 +818,7 @@ def test_expression_v2():
             return jsonify({
                 'status': 'ok',
                 'expression': expression,
+                'canonical_expression': compiled.expression,
                 'matches': matches,
                 'non_matches': non_matches,
                 'total_entities': len(entities),
@@ -715,6 +839,93 @@ def test_expression_v2():
         }), 500
 
 
+@app.route('/api/v2/estimate-expression', methods=['POST'])
+def estimate_expression_v2():
+    """Estimate how many entities a tag expression matches without evaluating it"""
+    try:
+        data = request.json
+        expression = data.get('expression')
+
+        if not expression:
+            return jsonify({
+                'status': 'error',
+                'error': 'Expression is required'
+            }), 400
+
+        try:
+            compiled = compile_expression(expression)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'error': f'Invalid expression: {str(e)}'
+            }), 400
+
+        return jsonify({
+            'status': 'ok',
+            'expression': expression,
+            'canonical_expression': compiled.expression,
+            'estimated_count': entity_manager.tag_index.estimate_cardinality(compiled),
+            'total_entities': len(entity_manager.tag_index)
+        })
+
+    except Exception as e:
+        logger.error(f"Error estimating expression: {e}")
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/v2/test-expressions', methods=['POST'])
+def test_expressions_v2():
+    """Test several tag expressions against all entities in one batch"""
+    try:
+        data = request.json
+        expressions = data.get('expressions') or []
+
+        if not isinstance(expressions, list) or not expressions:
+            return jsonify({
+                'status': 'error',
+                'error': 'A non-empty list of expressions is required'
+            }), 400
+
+        # Compile every expression first so invalid ones are reported individually
+        compiled = []
+        errors = {}
+        for expression in expressions:
+            try:
+                compiled.append((expression, compile_expression(expression)))
+            except ValueError as e:
+                errors[str(expression)] = str(e)
+
+        # Evaluate all valid expressions in a single batch; equivalent
+        # expressions share a plan and are evaluated once
+        matches = entity_manager.resolve_expressions([plan for _, plan in compiled])
+
+        results = []
+        for expression, plan in compiled:
+            results.append({
+                'expression': expression,
+                'canonical_expression': plan.expression,
+                'matches': matches[plan.expression],
+                'count': len(matches[plan.expression])
+            })
+
+        return jsonify({
+            'status': 'ok',
+            'results': results,
+            'errors': errors,
+            'total_entities': len(entity_manager.tag_index),
+            'backend': entity_manager.batch_evaluator.backend
+        })
+
+    except Exception as e:
+        logger.error(f"Error testing expressions: {e}")
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
 def main():
     """Main function to run the Smart Notification Router."""
     # Get port from config or use default
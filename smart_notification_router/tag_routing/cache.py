@@ -0,0 +1,159 @@
+"""
+Cache Utilities
+
+This module provides a bounded, thread-safe LRU cache used by the tag routing
+components to keep hot data (such as parsed tag expressions) in memory without
+growing without limit. Entries can optionally expire after a time-to-live.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache.
+
+    Keeps hit, miss, eviction and expiration counters so callers can monitor
+    how effective the cache is.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, on_evict=None, clock=time.monotonic):
+        """Initialize the cache.
+
+        Args:
+            maxsize (int): Maximum number of entries kept in the cache
+            ttl (float): Seconds an entry stays valid after it is stored (optional;
+                entries never expire without one)
+            on_evict (callable): Called with (key, value) for entries dropped
+                because the cache is full or the entry expired (optional)
+            clock (callable): Time source returning seconds
+        """
+        if maxsize <= 0:
+            raise ValueError("Cache size must be a positive integer")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("Cache TTL must be positive")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._on_evict = on_evict
+        self._clock = clock
+        self._data = OrderedDict()
+        self._expires = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, key):
+        """Check whether an entry has outlived its TTL (caller must hold the lock)."""
+        return self.ttl is not None and self._expires[key] <= self._clock()
+
+    def _notify(self, dropped):
+        """Report dropped entries to the eviction callback (outside the lock)."""
+        if self._on_evict is not None:
+            for key, value in dropped:
+                self._on_evict(key, value)
+
+    def get(self, key, default=None):
+        """Get a value from the cache.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is not cached or has expired
+
+        Returns:
+            Cached value or default
+        """
+        dropped = []
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if self._expired(key):
+                del self._data[key]
+                del self._expires[key]
+                self.expirations += 1
+                self.misses += 1
+                dropped.append((key, value))
+                value = default
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+
+        self._notify(dropped)
+        return value
+
+    def put(self, key, value):
+        """Store a value in the cache, evicting the oldest entry if full.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+        """
+        dropped = []
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = value
+            if self.ttl is not None:
+                self._expires[key] = self._clock() + self.ttl
+
+            while len(self._data) > self.maxsize:
+                dropped.append(self._data.popitem(last=False))
+                self._expires.pop(dropped[-1][0], None)
+                self.evictions += 1
+
+        self._notify(dropped)
+
+    def pop(self, key, default=None):
+        """Remove a key from the cache.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is not cached
+
+        Returns:
+            Removed value or default
+        """
+        with self._lock:
+            self._expires.pop(key, None)
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def stats(self):
+        """Get cache statistics.
+
+        Returns:
+            dict: Size, capacity, TTL, hit, miss, eviction and expiration counters
+        """
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
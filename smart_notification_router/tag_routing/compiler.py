@@ -0,0 +1,318 @@
+"""
+Tag Expression Compiler
+
+This module compiles tag expression parse trees into flat evaluator functions.
+Instead of walking the tree recursively for every entity, a compiled expression
+is a single Python boolean expression (e.g. ``'user:john' in t and 'device:mobile' in t``)
+evaluated against a frozenset of the entity's tags.
+
+Before compiling, expressions are simplified into canonical form (see
+simplifier.py). Compiled expressions are cached process-wide, keyed by the
+canonical expression string, so equivalent expressions such as "a+b" and
+"b+a+a" share one compiled plan. The raw expression string is kept as an alias
+key so repeated lookups skip parsing altogether.
+
+Given per-tag cardinality statistics (from the TagIndex), a plan can also be
+reordered so that the most selective AND operand and the most inclusive OR
+operand come first. Per-entity evaluation then short-circuits as early as
+possible, and set algebra keeps intermediate results small. The same
+statistics give a cheap estimate of how many entities an expression matches.
+"""
+
+import logging
+from .cache import LRUCache
+from .parser import (
+    OperatorType, TagEmpty, TagLiteral, TagOperator, TagPrefix, WILDCARD_TAG,
+    normalize_expression, parse_expression
+)
+from .simplifier import EMPTY_CANONICAL, canonical_string, simplify
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledExpression:
+    """A tag expression compiled into a flat evaluator function."""
+    __slots__ = ("expression", "tree", "tags", "prefixes", "source", "_function")
+    
+    def __init__(self, expression, tree, tags, source, function, prefixes=frozenset()):
+        """Initialize the compiled expression.
+        
+        Args:
+            expression (str): Canonical expression string
+            tree (TagNode): Parse tree the expression was compiled from
+            tags (frozenset): Literal tags referenced by the expression
+            source (str): Generated Python source of the evaluator
+            function (callable): Evaluator taking a frozenset of tags
+            prefixes (frozenset): Prefixes of the wildcard tags referenced
+        """
+        self.expression = expression
+        self.tree = tree
+        self.tags = tags
+        self.prefixes = prefixes
+        self.source = source
+        self._function = function
+    
+    def matches(self, tag_set):
+        """Check if a set of tags matches the expression.
+        
+        Args:
+            tag_set (frozenset): Tags of an entity
+            
+        Returns:
+            bool: True if the tags match
+        """
+        return self._function(tag_set)
+    
+    def evaluate(self, entity_tags):
+        """Check if a list of tags matches the expression.
+        
+        Args:
+            entity_tags: List (or other iterable) of tags for an entity
+            
+        Returns:
+            bool: True if the tags match
+        """
+        if not isinstance(entity_tags, (set, frozenset)):
+            entity_tags = frozenset(entity_tags)
+        return self._function(entity_tags)
+    
+    @property
+    def is_empty(self):
+        """True if the expression can never match any entity."""
+        return isinstance(self.tree, TagEmpty)
+    
+    def __str__(self):
+        return f"Compiled({self.expression})"
+
+
+def chain_operands(node, operator_type):
+    """Collect the operands of a left-nested chain of the same operator.
+    
+    Args:
+        node (TagNode): Root of the chain
+        operator_type (OperatorType): Operator of the chain
+        
+    Returns:
+        list: Operand nodes in left-to-right order
+    """
+    operands = []
+    while isinstance(node, TagOperator) and node.operator_type == operator_type:
+        operands.append(node.right)
+        node = node.left
+    operands.append(node)
+    operands.reverse()
+    return operands
+
+
+def _generate(node, tags, prefixes):
+    """Generate Python source evaluating a node against a tag set named ``t``.
+    
+    Args:
+        node (TagNode): Node to generate source for
+        tags (set): Set collecting the literal tags referenced
+        prefixes (set): Set collecting the prefixes of wildcard tags referenced
+        
+    Returns:
+        str: Python expression source
+    """
+    if isinstance(node, TagEmpty):
+        return "False"
+    
+    if isinstance(node, TagLiteral):
+        if node.tag == WILDCARD_TAG:
+            return "True"
+        tags.add(node.tag)
+        return f"{node.tag!r} in t"
+    
+    if isinstance(node, TagPrefix):
+        prefixes.add(node.prefix)
+        return f"any(x.startswith({node.prefix!r}) for x in t)"
+    
+    if not isinstance(node, TagOperator):
+        raise ValueError(f"Cannot compile node: {node}")
+    
+    operands = [_generate(operand, tags, prefixes)
+                for operand in chain_operands(node, node.operator_type)]
+    
+    if node.operator_type == OperatorType.AND:
+        return "(" + " and ".join(operands) + ")"
+    elif node.operator_type == OperatorType.OR:
+        return "(" + " or ".join(operands) + ")"
+    elif node.operator_type == OperatorType.NOT:
+        return "(" + " and not ".join(operands) + ")"
+    
+    raise ValueError(f"Unknown operator type: {node.operator_type}")
+
+
+def compile_tree(tree, expression=None):
+    """Compile a parse tree into a flat evaluator.
+    
+    Args:
+        tree (TagNode): Root node of the parse tree
+        expression (str): Expression string the tree was parsed from (optional)
+        
+    Returns:
+        CompiledExpression: Compiled expression
+    """
+    tags = set()
+    prefixes = set()
+    source = _generate(tree, tags, prefixes)
+    
+    try:
+        function = eval(compile(f"lambda t: {source}", "<tag-expression>", "eval"))
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        # Extremely nested expressions can exceed the Python compiler's limits;
+        # fall back to walking the tree.
+        logger.warning(f"Falling back to tree evaluation for '{expression}': {e}")
+        function = tree.evaluate
+    
+    return CompiledExpression(expression or source, tree, frozenset(tags), source, function,
+                              frozenset(prefixes))
+
+
+def _order(node, cardinality, total):
+    """Reorder a node's operands by estimated cardinality.
+    
+    Args:
+        node (TagNode): Node to reorder
+        cardinality (callable): Returns the number of entities carrying a tag
+            (or, for wildcard tags such as "device:*", any matching tag)
+        total (int): Number of entities
+        
+    Returns:
+        tuple: (reordered node, estimated number of matching entities)
+    """
+    if isinstance(node, TagEmpty):
+        return node, 0.0
+    
+    if isinstance(node, TagLiteral):
+        if node.tag == WILDCARD_TAG:
+            return node, float(total)
+        return node, float(min(cardinality(node.tag), total))
+    
+    if isinstance(node, TagPrefix):
+        return node, float(min(cardinality(node.pattern), total))
+    
+    if not isinstance(node, TagOperator):
+        raise ValueError(f"Cannot order node: {node}")
+    
+    if total <= 0:
+        return node, 0.0
+    
+    operator_type = node.operator_type
+    ordered = [_order(operand, cardinality, total) for operand in chain_operands(node, operator_type)]
+    
+    # Estimates assume tags occur independently of each other
+    if operator_type == OperatorType.AND:
+        # Most selective first: later operands only run for survivors
+        ordered.sort(key=lambda item: item[1])
+        fraction = 1.0
+        for _, estimate in ordered:
+            fraction *= estimate / total
+        estimate = min(total * fraction, ordered[0][1])
+    elif operator_type == OperatorType.OR:
+        # Most inclusive first: later operands only run for non-matches
+        ordered.sort(key=lambda item: -item[1])
+        missing = 1.0
+        for _, estimate in ordered:
+            missing *= 1.0 - estimate / total
+        estimate = max(total * (1.0 - missing), ordered[0][1])
+    elif operator_type == OperatorType.NOT:
+        # The first operand is the base set; the excluded operands commute
+        base, excluded = ordered[0], ordered[1:]
+        excluded.sort(key=lambda item: -item[1])
+        ordered = [base] + excluded
+        estimate = base[1]
+        for _, excluded_estimate in excluded:
+            estimate *= 1.0 - excluded_estimate / total
+    else:
+        raise ValueError(f"Unknown operator type: {operator_type}")
+    
+    result = ordered[0][0]
+    for operand, _ in ordered[1:]:
+        result = TagOperator(operator_type, result, operand)
+    return result, estimate
+
+
+def estimate_cardinality(tree, cardinality, total):
+    """Estimate how many entities match a tree without evaluating it.
+    
+    Literal tags are exact; combinations assume tags occur independently.
+    
+    Args:
+        tree (TagNode): Root node of the parse tree
+        cardinality (callable): Returns the number of entities carrying a tag
+        total (int): Number of entities
+        
+    Returns:
+        int: Estimated number of matching entities
+    """
+    return int(round(_order(tree, cardinality, total)[1]))
+
+
+def order_by_selectivity(compiled, cardinality, total):
+    """Recompile an expression with operands ordered by selectivity.
+    
+    Args:
+        compiled (CompiledExpression): Compiled expression
+        cardinality (callable): Returns the number of entities carrying a tag
+        total (int): Number of entities
+        
+    Returns:
+        CompiledExpression: Equivalent compiled expression with reordered operands
+    """
+    tree, _ = _order(compiled.tree, cardinality, total)
+    return compile_tree(tree, compiled.expression)
+
+
+# Process-wide cache of compiled expressions keyed by canonical expression,
+# with the normalized raw expressions as additional alias keys
+_compiled_cache = LRUCache(maxsize=512)
+
+# Key of the expression matching nothing; its canonical form "!" is not valid
+# input, so it must not be found by the alias lookup of a raw expression
+_EMPTY_KEY = (EMPTY_CANONICAL,)
+
+
+def compile_expression(expression):
+    """Parse, simplify and compile a tag expression, reusing cached results when available.
+    
+    Equivalent expressions return the same CompiledExpression instance as long
+    as it is still cached.
+    
+    Args:
+        expression (str): A tag expression like "user:john+device:mobile"
+        
+    Returns:
+        CompiledExpression: Compiled expression
+    """
+    if not expression or not isinstance(expression, str):
+        raise ValueError("Expression must be a non-empty string")
+    
+    key = normalize_expression(expression)
+    compiled = _compiled_cache.get(key)
+    if compiled is not None:
+        return compiled
+    
+    tree = simplify(parse_expression(key))
+    canonical = canonical_string(tree)
+    canonical_key = _EMPTY_KEY if canonical == EMPTY_CANONICAL else canonical
+    
+    compiled = _compiled_cache.get(canonical_key)
+    if compiled is None:
+        compiled = compile_tree(tree, canonical)
+        _compiled_cache.put(canonical_key, compiled)
+    
+    if key != canonical:
+        _compiled_cache.put(key, compiled)
+    
+    return compiled
+
+
+def get_compiled_cache():
+    """Get the process-wide compiled expression cache.
+    
+    Returns:
+        LRUCache: Cache of compiled expressions
+    """
+    return _compiled_cache
@@ -0,0 +1,105 @@
+"""
+Routing Context Snapshot
+
+This module provides a snapshot of Home Assistant data scoped to routing a
+single notification. Presence checks, priority handling and target selection
+all read entity states and tag expression results through the same snapshot,
+so each state is fetched at most once and in bulk, and each expression is
+resolved at most once, however many devices the recipients own. A snapshot
+may be shared by threads resolving different recipients concurrently.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingContext:
+    """Per-notification snapshot of entity states and expression results."""
+
+    def __init__(self, ha_client, tag_resolver=None):
+        """Initialize an empty snapshot.
+
+        Args:
+            ha_client (HomeAssistantAPIClient): Home Assistant API client
+            tag_resolver (TagResolutionService): Tag resolution service used to
+                resolve expressions (optional; the API client is used without one)
+        """
+        self.ha_client = ha_client
+        self.tag_resolver = tag_resolver
+        self._states = {}
+        self._missing = set()
+        self._expressions = {}
+        self._lock = threading.Lock()
+        self.state_requests = 0
+
+    def resolve(self, expression):
+        """Resolve a tag expression, at most once per snapshot.
+
+        Args:
+            expression (str): A tag expression
+
+        Returns:
+            list: Matching entity IDs
+        """
+        entities = self._expressions.get(expression)
+        if entities is None:
+            if self.tag_resolver is not None:
+                entities = self.tag_resolver.resolve_expression(expression)
+            else:
+                entities = self.ha_client.get_entities_by_tag_expression(expression)
+            entities = self._expressions.setdefault(expression, entities)
+        return entities
+
+    def prefetch_states(self, entity_ids):
+        """Fetch the states of entities not yet in the snapshot in one request.
+
+        Args:
+            entity_ids (iterable): IDs of the entities needed
+        """
+        with self._lock:
+            missing = [entity_id for entity_id in dict.fromkeys(entity_ids)
+                       if entity_id not in self._states and entity_id not in self._missing]
+            if not missing:
+                return
+
+            states = self.ha_client.get_entity_states(missing) or {}
+            self.state_requests += 1
+            for entity_id in missing:
+                state = states.get(entity_id)
+                if state is None:
+                    self._missing.add(entity_id)
+                else:
+                    self._states[entity_id] = state
+
+        logger.debug(f"Fetched {len(states)} of {len(missing)} entity states in one request")
+
+    def get_state(self, entity_id):
+        """Get the state of an entity from the snapshot.
+
+        Entities that were not prefetched are fetched on demand.
+
+        Args:
+            entity_id (str): Entity ID
+
+        Returns:
+            dict: Entity state with attributes, None if not found
+        """
+        if entity_id not in self._states and entity_id not in self._missing:
+            self.prefetch_states([entity_id])
+        return self._states.get(entity_id)
+
+
+# Helper function to create routing context instance
+def create_routing_context(ha_client, tag_resolver=None):
+    """Create a new RoutingContext instance.
+
+    Args:
+        ha_client (HomeAssistantAPIClient): Home Assistant API client
+        tag_resolver (TagResolutionService): Tag resolution service (optional)
+
+    Returns:
+        RoutingContext: New routing context instance
+    """
+    return RoutingContext(ha_client, tag_resolver)
@@ -0,0 +1,484 @@
+"""
+Asynchronous Delivery Queue
+
+This module lets notification endpoints answer as soon as a notification has
+been validated and routed. The service calls are put on an in-process queue
+drained by worker threads, and the delivery result of every service is kept
+under the notification's tracking ID so callers can look it up later.
+
+With a DeliveryStore attached, a notification is committed to disk before
+submit() returns and its per-service results are written as they arrive;
+replay() re-queues the services that had not been delivered when the process
+stopped.
+
+Queued notifications are delivered most severe first. Each one is ordered by
+its submission time minus its severity rank times an aging interval, so a
+notification of severity rank n overtakes less severe work submitted up to n
+aging intervals before it, while older low-severity work still gets its turn.
+
+With a RetryPolicy, services whose call failed are retried with jittered
+exponential backoff. Pending retries wait on a timing wheel and are put back on
+the queue when due, so they are delivered by the same workers.
+
+A service whose response carries 'retry_after' was held back by a rate limit
+without being called. The notification waits on the same timing wheel until
+then, as `deferred`, and the wait does not count as an attempt; the worker is
+free for other notifications meanwhile.
+"""
+
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from .ha_client import NotificationPayload
+from .retry import RetryScheduler
+
+logger = logging.getLogger(__name__)
+
+# Delivery states of a notification
+QUEUED = "queued"
+DELIVERING = "delivering"
+RETRYING = "retrying"
+DEFERRED = "deferred"
+DELIVERED = "delivered"
+PARTIAL = "partial"
+FAILED = "failed"
+
+# Delivery states of a single service
+PENDING = "pending"
+SENT = "sent"
+
+# Seconds of waiting worth one severity rank
+DEFAULT_AGING_INTERVAL = 10.0
+
+# Queue waits kept per severity for the latency statistics
+LATENCY_SAMPLES = 1000
+
+
+class DeliveryRecord:
+    """Delivery status of one notification and each of its services."""
+    __slots__ = ("tracking_id", "status", "services", "payload", "context", "severity",
+                 "submitted_at", "completed_at")
+
+    def __init__(self, tracking_id, services, payload, context=None, severity=None):
+        """Initialize a queued record.
+
+        Args:
+            tracking_id (str): Tracking ID of the notification
+            services (list): Services to deliver the notification to
+            payload (NotificationPayload): Notification payload
+            context (dict): Caller data kept with the record (optional)
+            severity (str): Severity the notification is scheduled by (optional)
+        """
+        self.tracking_id = tracking_id
+        self.status = QUEUED
+        self.severity = severity
+        self.services = {service: {"status": PENDING} for service in services}
+        self.payload = payload
+        self.context = context or {}
+        self.submitted_at = time.time()
+        self.completed_at = None
+
+    @property
+    def done(self):
+        """Whether delivery has finished."""
+        return self.status not in (QUEUED, DELIVERING, RETRYING, DEFERRED)
+
+    def to_dict(self):
+        """Convert the record to a dictionary.
+
+        Returns:
+            dict: Tracking ID, overall status and per-service results
+        """
+        return {
+            "tracking_id": self.tracking_id,
+            "status": self.status,
+            "severity": self.severity,
+            "services": {service: dict(result) for service, result in self.services.items()},
+            "submitted_at": self.submitted_at,
+            "completed_at": self.completed_at
+        }
+
+
+class DeliveryQueue:
+    """In-process priority queue of notifications drained by worker threads."""
+
+    def __init__(self, deliver, workers=4, max_records=1000, on_complete=None, store=None,
+                 rank=None, aging_interval=DEFAULT_AGING_INTERVAL, retry_policy=None):
+        """Initialize the queue; workers start on the first submission.
+
+        Args:
+            deliver (callable): Called with (services, payload); returns a dict
+                of each service's response, with an 'error' key on failure and
+                a 'retry_after' key if the call was deferred by a rate limit
+            workers (int): Number of worker threads
+            max_records (int): Number of delivery records kept for status lookups
+            on_complete (callable): Called with each finished DeliveryRecord (optional)
+            store (DeliveryStore): Durable store of accepted notifications (optional)
+            rank (callable): Maps a severity to its rank, higher is more severe
+                (optional; without it notifications are delivered in order)
+            aging_interval (float): Seconds of waiting worth one severity rank
+            retry_policy (RetryPolicy): Retry policy for failed services (optional;
+                without it failed services are not retried)
+        """
+        if workers <= 0:
+            raise ValueError("Delivery queue needs at least one worker")
+
+        self._deliver = deliver
+        self._on_complete = on_complete
+        self.store = store
+        self._rank = rank
+        self.aging_interval = aging_interval
+        self.workers = workers
+        self.max_records = max_records
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._waits = {}
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.retry_policy = retry_policy
+        self._retries = RetryScheduler(self._retry_due)
+        self._retrying = 0
+        self._retries_done = threading.Condition(self._lock)
+        self.submitted = 0
+        self.completed = 0
+
+    def submit(self, services, payload, tracking_id=None, context=None, severity=None):
+        """Queue a notification for delivery.
+
+        Args:
+            services (list): Services to deliver the notification to
+            payload (NotificationPayload): Notification payload
+            tracking_id (str): Tracking ID (optional; generated if omitted)
+            context (dict): Caller data passed back with the record (optional)
+            severity (str): Severity to schedule the notification by (optional)
+
+        Returns:
+            str: Tracking ID to look the delivery status up with
+        """
+        tracking_id = tracking_id or str(uuid.uuid4())
+        record = DeliveryRecord(tracking_id, list(dict.fromkeys(services)), payload, context, severity)
+
+        if self.store is not None:
+            self.store.add(record)
+
+        self._enqueue(record)
+        logger.info(f"Queued notification {tracking_id} for {len(record.services)} services")
+        return tracking_id
+
+    def retry(self, errors, payload, tracking_id=None, context=None, severity=None):
+        """Schedule retries of services whose first call was made elsewhere and failed.
+
+        Args:
+            errors (dict): Error of each failed service
+            payload (NotificationPayload): Notification payload
+            tracking_id (str): Tracking ID (optional; generated if omitted)
+            context (dict): Caller data passed back with the record (optional)
+            severity (str): Severity to schedule the notification by (optional)
+
+        Returns:
+            str: Tracking ID of the retries, None if retries are disabled or
+                there is nothing to retry
+        """
+        if self.retry_policy is None or not self.retry_policy.should_retry(1) or not errors:
+            return None
+
+        tracking_id = tracking_id or str(uuid.uuid4())
+        record = DeliveryRecord(tracking_id, [], payload, context, severity)
+        record.services = {service: {"status": PENDING, "attempts": 1, "error": error}
+                           for service, error in errors.items()}
+        record.status = RETRYING
+
+        if self.store is not None:
+            self.store.add(record)
+
+        with self._lock:
+            self._start_workers()
+            self._records[tracking_id] = record
+            self._trim_records()
+            self.submitted += 1
+        self._schedule_retry(record, 1)
+        return tracking_id
+
+    def replay(self):
+        """Re-queue the notifications the store holds as undelivered.
+
+        Services already sent before the restart are not called again.
+
+        Returns:
+            int: Number of notifications re-queued
+        """
+        if self.store is None:
+            return 0
+
+        replayed = 0
+        for stored in self.store.pending():
+            payload = NotificationPayload(stored["title"], stored["message"], stored["data"])
+            record = DeliveryRecord(stored["tracking_id"], [], payload, stored["context"],
+                                    stored["severity"])
+            record.services = stored["services"]
+            record.submitted_at = stored["submitted_at"]
+            if not record.services:
+                continue
+            self._enqueue(record)
+            replayed += 1
+
+        if replayed:
+            logger.info(f"Replayed {replayed} undelivered notifications from {self.store.path}")
+        return replayed
+
+    def get_status(self, tracking_id):
+        """Get the delivery status of a notification.
+
+        Args:
+            tracking_id (str): Tracking ID returned by submit()
+
+        Returns:
+            dict: Delivery status, None if the tracking ID is unknown
+        """
+        with self._lock:
+            record = self._records.get(tracking_id)
+            if record is not None:
+                return record.to_dict()
+        return self.store.get(tracking_id) if self.store is not None else None
+
+    def stats(self):
+        """Get queue statistics.
+
+        Returns:
+            dict: Queue depth, worker count, submission counters and the queue
+                wait of recent notifications per severity
+        """
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "workers": len(self._threads),
+                "records": len(self._records),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "latency": {severity: _latency_stats(waits) for severity, waits in self._waits.items()},
+                "retries": self._retries.stats(),
+                "store": self.store.stats() if self.store is not None else None
+            }
+
+    def join(self):
+        """Block until every queued notification has been delivered or given up on."""
+        while True:
+            self._queue.join()
+            with self._retries_done:
+                if not self._retrying:
+                    if not self._queue.unfinished_tasks:
+                        return
+                    continue
+                self._retries_done.wait()
+
+    def shutdown(self):
+        """Stop the workers after the queued notifications are delivered.
+
+        Pending retries are dropped from memory; with a store they are kept on
+        disk and replayed on the next start.
+        """
+        dropped = self._retries.stop()
+        with self._retries_done:
+            # Dropped records are no longer waited for
+            self._retrying -= dropped
+            self._retries_done.notify_all()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put((math.inf, next(self._sequence), None))
+        for thread in threads:
+            thread.join()
+        if self.store is not None:
+            self.store.flush()
+
+    def _enqueue(self, record):
+        """Track a record and hand it to the workers."""
+        with self._lock:
+            self._start_workers()
+            self._records[record.tracking_id] = record
+            self._trim_records()
+            self.submitted += 1
+        self._queue.put((self._priority(record), next(self._sequence), record))
+
+    def _schedule_retry(self, record, attempts):
+        """Put a record on the timing wheel until its next attempt is due."""
+        delay = self.retry_policy.delay(attempts)
+        if self._schedule(record, delay):
+            logger.info(f"Retrying notification {record.tracking_id} in {delay:.1f}s (attempt {attempts + 1})")
+
+    def _schedule(self, record, delay):
+        """Put a record on the timing wheel for a delay; False if the queue is shutting down."""
+        with self._lock:
+            self._retrying += 1
+        try:
+            self._retries.schedule(delay, record)
+        except RuntimeError:
+            logger.warning(f"Not rescheduling notification {record.tracking_id}: delivery queue is shutting down")
+            self._retry_due(record, enqueue=False)
+            return False
+        return True
+
+    def _retry_due(self, record, enqueue=True):
+        """Hand a record whose retry is due back to the workers."""
+        if enqueue:
+            self._queue.put((self._priority(record), next(self._sequence), record))
+        with self._retries_done:
+            self._retrying -= 1
+            self._retries_done.notify_all()
+
+    def _priority(self, record):
+        """Get the queue ordering key of a record; lower is delivered first."""
+        if self._rank is None or record.severity is None:
+            return record.submitted_at
+        rank = self._rank(record.severity)
+        return record.submitted_at - max(rank or 0, 0) * self.aging_interval
+
+    def _start_workers(self):
+        """Start the worker threads (caller must hold the lock)."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"delivery-{len(self._threads)}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _trim_records(self):
+        """Drop the oldest finished records beyond max_records (caller must hold the lock)."""
+        excess = len(self._records) - self.max_records
+        if excess <= 0:
+            return
+        for tracking_id in [tracking_id for tracking_id, record in self._records.items()
+                            if record.done][:excess]:
+            del self._records[tracking_id]
+
+    def _run(self):
+        """Worker loop delivering queued notifications."""
+        while True:
+            _, _, record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self._process(record)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, record):
+        """Deliver one notification and store the per-service results."""
+        with self._lock:
+            if record.status == QUEUED:
+                waits = self._waits.get(record.severity)
+                if waits is None:
+                    waits = self._waits[record.severity] = deque(maxlen=LATENCY_SAMPLES)
+                waits.append(time.time() - record.submitted_at)
+            record.status = DELIVERING
+        services = [service for service, result in record.services.items() if result["status"] == PENDING]
+
+        try:
+            responses = self._deliver(services, record.payload)
+        except Exception as e:
+            logger.exception(f"Error delivering notification {record.tracking_id}")
+            responses = {service: {"error": str(e)} for service in services}
+
+        with self._lock:
+            retry_attempts = 0
+            deferral = None
+            for service in services:
+                response = responses.get(service, {"error": "Not delivered"})
+                if "retry_after" in response:
+                    # Held back by a rate limit; not called, so not an attempt
+                    deferral = min(response["retry_after"], deferral or math.inf)
+                    continue
+                attempts = record.services[service].get("attempts", 0) + 1
+                if "error" not in response:
+                    result = {"status": SENT}
+                elif self.retry_policy is not None and self.retry_policy.should_retry(attempts):
+                    result = {"status": PENDING, "error": response["error"]}
+                    retry_attempts = max(retry_attempts, attempts)
+                else:
+                    result = {"status": FAILED, "error": response["error"]}
+                if attempts > 1 or result["status"] == PENDING:
+                    result["attempts"] = attempts
+                record.services[service] = result
+
+            if retry_attempts:
+                record.status = RETRYING
+            elif deferral is not None:
+                record.status = DEFERRED
+            else:
+                sent = sum(1 for result in record.services.values() if result["status"] == SENT)
+                if sent == len(record.services):
+                    record.status = DELIVERED
+                else:
+                    record.status = PARTIAL if sent else FAILED
+                record.completed_at = time.time()
+                self.completed += 1
+
+        if self.store is not None:
+            self.store.update(record)
+
+        if retry_attempts:
+            self._schedule_retry(record, retry_attempts)
+            return
+        if deferral is not None:
+            if self._schedule(record, deferral):
+                logger.debug(f"Deferred notification {record.tracking_id} by {deferral:.1f}s for a rate limit")
+            return
+
+        logger.info(f"Delivered notification {record.tracking_id}: {record.status}")
+
+        if self._on_complete is not None:
+            try:
+                self._on_complete(record)
+            except Exception:
+                logger.exception(f"Error in delivery callback for {record.tracking_id}")
+
+
+def _latency_stats(waits):
+    """Summarize queue waits in milliseconds.
+
+    Args:
+        waits (deque): Queue waits in seconds
+
+    Returns:
+        dict: Sample count and p50, p99 and maximum wait
+    """
+    ordered = sorted(waits)
+    if not ordered:
+        return {"count": 0}
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(0.5),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+# Helper function to create delivery queue instance
+def create_delivery_queue(deliver, workers=4, max_records=1000, on_complete=None, store=None,
+                          rank=None, aging_interval=DEFAULT_AGING_INTERVAL, retry_policy=None):
+    """Create a new DeliveryQueue instance.
+
+    Args:
+        deliver (callable): Called with (services, payload) to deliver a notification
+        workers (int): Number of worker threads
+        max_records (int): Number of delivery records kept for status lookups
+        on_complete (callable): Called with each finished DeliveryRecord (optional)
+        store (DeliveryStore): Durable store of accepted notifications (optional)
+        rank (callable): Maps a severity to its rank, higher is more severe (optional)
+        aging_interval (float): Seconds of waiting worth one severity rank
+        retry_policy (RetryPolicy): Retry policy for failed services (optional)
+
+    Returns:
+        DeliveryQueue: New delivery queue instance
+    """
+    return DeliveryQueue(deliver, workers, max_records, on_complete, store, rank, aging_interval,
+                         retry_policy)
@@ -4,21 +4,52 @@ This module manages entity tags and provides access to Home Assistant entities.
 """
 
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Callable, Dict, List, Any, Optional
 from .ha_client import HomeAssistantAPIClient
+from .compiler import compile_expression
+from .tag_index import TagIndex
+from .vectorized import BatchEvaluator
 
 logger = logging.getLogger(__name__)
 
 class EntityManager:
     """Manages entities and their tags."""
 
-    def __init__(self, demo_mode: bool = True):
+    def __init__(self, demo_mode: bool = True, ha_client: Optional[HomeAssistantAPIClient] = None):
         """Initialize the entity manager.
         
         Args:
             demo_mode: Whether to use demo data instead of actual API calls
+            ha_client: API client to share (optional; one is created if omitted)
         """
-        self.ha_client = HomeAssistantAPIClient(demo_mode=demo_mode)
+        self.ha_client = ha_client or HomeAssistantAPIClient(demo_mode=demo_mode)
+        self._tag_index = None
+        self._tag_index_lock = threading.Lock()
+        self._batch_evaluator = None
+        self._tag_listeners = []
+    
+    @property
+    def tag_index(self) -> TagIndex:
+        """Inverted tag index, built on first use and kept up to date by tag writes."""
+        if self._tag_index is None:
+            with self._tag_index_lock:
+                if self._tag_index is None:
+                    index = TagIndex()
+                    entity_ids = [entity["entity_id"] for entity in self.get_all_entities()]
+                    index.rebuild(self.ha_client.get_entity_tags(), entity_ids)
+                    self._tag_index = index
+        return self._tag_index
+    
+    @property
+    def batch_evaluator(self) -> BatchEvaluator:
+        """Evaluator for checking many expressions against all entities at once."""
+        if self._batch_evaluator is None:
+            tag_index = self.tag_index
+            with self._tag_index_lock:
+                if self._batch_evaluator is None:
+                    self._batch_evaluator = BatchEvaluator(tag_index)
+        return self._batch_evaluator
     
     def get_all_entities(self) -> List[Dict[str, Any]]:
         """Get all entities from Home Assistant."""
@@ -48,9 +79,71 @@ class EntityManager:
         all_tags = self.ha_client.get_entity_tags()
         return all_tags.get(entity_id, [])
     
+    def add_tag_listener(self, listener: Callable[[str, Optional[frozenset], frozenset], None]) -> None:
+        """Register a callback run after an entity's tags change.
+        
+        The callback receives the entity ID, its previous tags (None if the
+        entity was not known) and its new tags (None if the entity was
+        removed). Registering a listener builds the tag index, which is where
+        the previous tags come from.
+        
+        Args:
+            listener: Callback taking (entity_id, old_tags, new_tags)
+        """
+        # Build the index now; it supplies the previous tags passed to listeners
+        _ = self.tag_index
+        with self._tag_index_lock:
+            self._tag_listeners.append(listener)
+    
     def set_entity_tags(self, entity_id: str, tags: List[str]) -> None:
         """Set tags for an entity."""
         self.ha_client.set_entity_tags(entity_id, tags)
+        self._index_entity(entity_id, tags)
+    
+    def _index_entity(self, entity_id: str, tags: List[str]) -> None:
+        """Apply an entity's tags to the tag index, tag listeners and batch evaluator."""
+        if self._tag_index is not None:
+            known = entity_id in self._tag_index
+            old_tags = self._tag_index.update_entity(entity_id, tags)
+            new_tags = frozenset(tags)
+            if self._tag_listeners and (old_tags != new_tags or not known):
+                for listener in list(self._tag_listeners):
+                    listener(entity_id, old_tags if known else None, new_tags)
+        if self._batch_evaluator is not None:
+            self._batch_evaluator.update_entity(entity_id, tags)
+    
+    def remove_entity(self, entity_id: str) -> None:
+        """Drop an entity that no longer exists from the tag index and batch evaluator.
+        
+        Args:
+            entity_id: The ID of the removed entity
+        """
+        if self._tag_index is not None and entity_id in self._tag_index:
+            old_tags = self._tag_index.get_tags(entity_id)
+            self._tag_index.remove_entity(entity_id)
+            for listener in list(self._tag_listeners):
+                listener(entity_id, old_tags, None)
+        if self._batch_evaluator is not None:
+            self._batch_evaluator.remove_entity(entity_id)
+    
+    def on_entity_state_changed(self, entity_id: str, state: Optional[Dict[str, Any]]) -> None:
+        """Keep the tag index's entities in step with Home Assistant.
+        
+        The index is built from the entities known at the time; entities that
+        appear later are added with their stored tags, and removed entities
+        are dropped. Meant to be registered as a StateWatcher state listener.
+        
+        Args:
+            entity_id: The ID of the entity whose state changed
+            state: The new state, None if the entity was removed
+        """
+        if self._tag_index is None:
+            # Built on first use from the entities known then
+            return
+        if state is None:
+            self.remove_entity(entity_id)
+        elif entity_id not in self._tag_index:
+            self._index_entity(entity_id, self.get_tags_for_entity(entity_id))
     
     def add_tag_to_entity(self, entity_id: str, tag: str) -> None:
         """Add a tag to an entity if it doesn't already exist."""
@@ -113,14 +206,49 @@ class EntityManager:
         Returns:
             List of entity IDs that have the tag
         """
-        results = []
-        entity_tags = self.get_entity_tags()
+        return sorted(self.tag_index.entities_with_tag(tag))
+    
+    def resolve_expression(self, expression: str) -> List[str]:
+        """Find entities matching a tag expression using the tag index.
+        
+        Args:
+            expression: Tag expression (e.g., 'user:john+device:mobile')
+            
+        Returns:
+            Sorted list of matching entity IDs
+            
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        return sorted(self.tag_index.resolve(compile_expression(expression)))
+    
+    def estimate_expression(self, expression: str) -> int:
+        """Estimate how many entities match a tag expression without evaluating it.
         
-        for entity_id, tags in entity_tags.items():
-            if tag in tags:
-                results.append(entity_id)
+        Args:
+            expression: Tag expression (e.g., 'user:john+device:mobile')
+            
+        Returns:
+            Estimated number of matching entities
+            
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        return self.tag_index.estimate_cardinality(compile_expression(expression))
+    
+    def resolve_expressions(self, expressions: List[str]) -> Dict[str, List[str]]:
+        """Find entities matching each of several tag expressions in one batch.
         
-        return results
+        Args:
+            expressions: Tag expressions to evaluate
+            
+        Returns:
+            Dictionary mapping each canonical expression to sorted matching entity IDs
+            
+        Raises:
+            ValueError: If any expression is invalid
+        """
+        return self.batch_evaluator.evaluate(expressions)
     
     def get_entities(self) -> List[Dict[str, Any]]:
         """Alias for get_all_entities() for compatibility."""
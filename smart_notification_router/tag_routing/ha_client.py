@@ -8,9 +8,57 @@ import json
 import os
 import requests
 from typing import Dict, List, Any, Optional
+from .compiler import compile_expression
+from .singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+
+class NotificationPayload:
+    """Notification service data, serialized once and shared by every service call."""
+
+    def __init__(self, title: str, message: str, data: Optional[Dict[str, Any]] = None):
+        """Initialize the payload.
+
+        Args:
+            title: Notification title
+            message: Notification message
+            data: Additional notification data (optional)
+        """
+        self.title = title
+        self.message = message
+        self.data = data
+        self._bodies = {}
+
+    def for_domain(self, domain: str) -> tuple:
+        """Get the service data and its JSON body for a service domain.
+
+        Notify services take additional data under "data"; other services take
+        it at the top level. Each shape is serialized at most once.
+
+        Args:
+            domain: Service domain
+
+        Returns:
+            tuple: Service data dict and its serialized JSON body
+        """
+        shape = "notify" if domain == "notify" else "service"
+        body = self._bodies.get(shape)
+        if body is None:
+            service_data = {
+                "title": self.title,
+                "message": self.message
+            }
+            if self.data:
+                if shape == "notify":
+                    service_data["data"] = self.data
+                else:
+                    # For non-notify services, merge data at top level
+                    service_data.update(self.data)
+            body = self._bodies[shape] = (service_data, json.dumps(service_data))
+        return body
+
+
 class HomeAssistantAPIClient:
     """Client for Home Assistant API communication."""
 
@@ -22,6 +70,8 @@ class HomeAssistantAPIClient:
         """
         self.demo_mode = demo_mode
         self._entity_tags = {}  # In-memory entity tags for demo mode
+        # Concurrent requests for the same state share one HTTP call
+        self.inflight = SingleFlight()
         
         # Initialize Home Assistant API connection
         self.ha_url = os.environ.get("SUPERVISOR_URL", "http://supervisor/core")
@@ -131,6 +181,94 @@ class HomeAssistantAPIClient:
         
         return entity
     
+    def get_entity_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current state of an entity from Home Assistant.
+        
+        Args:
+            entity_id: The ID of the entity
+            
+        Returns:
+            Dict: Entity state with attributes, None if not found
+        """
+        if self.demo_mode:
+            return self.get_entity(entity_id)
+        
+        return self.inflight.do(entity_id, self._fetch_entity_state, entity_id)
+    
+    def _fetch_entity_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the state of an entity from the Home Assistant API."""
+        if not self._check_api_connection():
+            logger.error("Cannot get entity state, no valid API connection")
+            return None
+        
+        try:
+            url = f"{self.ha_url}/api/states/{entity_id}"
+            headers = {
+                "Authorization": f"Bearer {self.ha_token}",
+                "Content-Type": "application/json"
+            }
+            
+            response = requests.get(url, headers=headers, timeout=10)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            
+            return response.json()
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error getting state for {entity_id}: {e}")
+            return None
+    
+    def get_entity_states(self, entity_ids: Optional[List[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Get the current states of many entities in a single request.
+        
+        Args:
+            entity_ids: IDs of the entities to fetch (all entities if omitted)
+            
+        Returns:
+            Dict: Entity states keyed by entity ID; entities that do not exist are
+                left out. None if the states could not be fetched
+        """
+        if self.demo_mode:
+            if entity_ids is None:
+                return {entity["entity_id"]: entity for entity in self.get_entities()}
+            states = {}
+            for entity_id in entity_ids:
+                entity = self.get_entity(entity_id)
+                if entity:
+                    states[entity_id] = entity
+            return states
+        
+        # Every caller filters the same full state list, so concurrent callers share it
+        states = self.inflight.do("/api/states", self._fetch_entity_states)
+        if states is None:
+            return None
+        if entity_ids is None:
+            return dict(states)
+        return {entity_id: states[entity_id] for entity_id in entity_ids if entity_id in states}
+    
+    def _fetch_entity_states(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Fetch the states of all entities from the Home Assistant API; None on failure."""
+        if not self._check_api_connection():
+            logger.error("Cannot get entity states, no valid API connection")
+            return None
+        
+        try:
+            url = f"{self.ha_url}/api/states"
+            headers = {
+                "Authorization": f"Bearer {self.ha_token}",
+                "Content-Type": "application/json"
+            }
+            
+            response = requests.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+            
+            return {state["entity_id"]: state for state in response.json()}
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error getting entity states: {e}")
+            return None
+    
     def get_entities(self) -> List[Dict[str, Any]]:
         """Get all entities from Home Assistant."""
         if not self.demo_mode:
@@ -168,6 +306,30 @@ class HomeAssistantAPIClient:
         
         return self._entity_tags
     
+    def get_entities_by_tag_expression(self, expression: str) -> List[str]:
+        """Get IDs of entities whose tags match a tag expression.
+        
+        Args:
+            expression: Tag expression (e.g., 'user:john+device:mobile')
+            
+        Returns:
+            List of matching entity IDs
+        """
+        try:
+            compiled = compile_expression(expression)
+        except ValueError as e:
+            logger.error(f"Invalid tag expression '{expression}': {e}")
+            return []
+        
+        # Provably empty expressions never need the tag registry
+        if compiled.is_empty:
+            return []
+        
+        return [
+            entity_id for entity_id, tags in self.get_entity_tags().items()
+            if compiled.evaluate(tags)
+        ]
+    
     def set_entity_tags(self, entity_id: str, tags: List[str]) -> None:
         """Set tags for an entity."""
         if not self.demo_mode:
@@ -176,13 +338,15 @@ class HomeAssistantAPIClient:
         
         self._entity_tags[entity_id] = tags
         
-    def call_service(self, domain: str, service: str, service_data: Dict[str, Any]) -> Dict[str, Any]:
+    def call_service(self, domain: str, service: str, service_data: Dict[str, Any],
+                     body: Optional[str] = None) -> Dict[str, Any]:
         """Call a Home Assistant service.
         
         Args:
             domain: Service domain (e.g., 'notify', 'persistent_notification')
             service: Service name (e.g., 'mobile_app_pixel_9_pro_xl', 'create')
             service_data: Data to send with service call
+            body: service_data already serialized to JSON (optional)
             
         Returns:
             Dict: Response from Home Assistant
@@ -205,7 +369,10 @@ class HomeAssistantAPIClient:
             }
             
             # Make the API call
-            response = requests.post(url, headers=headers, json=service_data, timeout=10)
+            if body is not None:
+                response = requests.post(url, headers=headers, data=body, timeout=10)
+            else:
+                response = requests.post(url, headers=headers, json=service_data, timeout=10)
             
             # Check for errors
             response.raise_for_status()
@@ -217,7 +384,8 @@ class HomeAssistantAPIClient:
             logger.error(f"Error calling service {domain}.{service}: {e}")
             return {"error": str(e)}
             
-    def send_notification(self, service_name: str, title: str, message: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+    def send_notification(self, service_name: str, title: str, message: str, data: Dict[str, Any] = None,
+                          payload: Optional[NotificationPayload] = None) -> Dict[str, Any]:
         """Send a notification through a Home Assistant notification service.
         
         Args:
@@ -225,6 +393,8 @@ class HomeAssistantAPIClient:
             title: Notification title
             message: Notification message
             data: Additional notification data (optional)
+            payload: Payload shared by the service calls of one notification
+                (optional; built from title, message and data if omitted)
             
         Returns:
             Dict: Response from Home Assistant
@@ -238,27 +408,18 @@ class HomeAssistantAPIClient:
         domain, service = parts
         
         # Prepare service data
-        service_data = {
-            "title": title,
-            "message": message
-        }
-        
-        # Add additional data if provided
-        if data:
-            if domain == "notify":
-                service_data["data"] = data
-            else:
-                # For non-notify services, merge data at top level
-                service_data.update(data)
+        if payload is None:
+            payload = NotificationPayload(title, message, data)
+        service_data, body = payload.for_domain(domain)
         
         # Call the service
-        return self.call_service(domain, service, service_data)
+        return self.call_service(domain, service, service_data, body)
         
-    def get_services(self) -> List[Dict[str, Any]]:
+    def get_services(self) -> Optional[List[Dict[str, Any]]]:
         """Get all available services from Home Assistant.
         
         Returns:
-            List: List of available services
+            List: List of available services, None if they could not be fetched
         """
         if self.demo_mode:
             # Return a list of demo services
@@ -307,7 +468,7 @@ class HomeAssistantAPIClient:
         
         if not self._check_api_connection():
             logger.error("Cannot get services, no valid API connection")
-            return []
+            return None
             
         try:
             # Get services from Home Assistant API
@@ -324,4 +485,4 @@ class HomeAssistantAPIClient:
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error getting services: {e}")
-            return []
\ No newline at end of file
+            return None
\ No newline at end of file
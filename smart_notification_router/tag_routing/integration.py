@@ -5,16 +5,22 @@ This module integrates the tag-based routing system with the main application,
 providing the necessary interfaces to use tag expressions in notifications.
 """
 
+import functools
 import logging
 import yaml
 import os
 from flask import request, jsonify, Blueprint, render_template
-from .ha_client import HomeAssistantAPIClient
+from .delivery import DeliveryQueue
+from .ha_client import HomeAssistantAPIClient, NotificationPayload
+from .notification_router import NotificationRouter
 from .parser import TagExpressionParser
-from .resolution import TagResolutionService, ContextResolver
+from .resolution import create_context_resolver, create_resolution_service
 from .routing import RoutingEngine
 from .service_discovery import ServiceDiscovery
-from .entity_manager import EntityTagManager
+from .retry import RetryPolicy
+from .store import DeliveryStore
+from .watcher import StateWatcher
+from .entity_manager import EntityManager
 
 logger = logging.getLogger(__name__)
 
@@ -28,49 +34,91 @@ context_resolver = None
 routing_engine = None
 service_discovery = None
 entity_manager = None
+delivery_queue = None
+state_watcher = None
+notification_router = None
 
 # Configuration constants
-HA_URL_OPTION = "homeassistant_url"
 HA_TOKEN_OPTION = "homeassistant_token"
-DEFAULT_HA_URL = "http://supervisor/core/api"
 
 
-def initialize_tag_routing(app_config):
+def initialize_tag_routing(app_config, router=None, queue=None):
     """Initialize the tag-based routing system.
     
     Args:
         app_config (dict): Application configuration
+        router (NotificationRouter): The application's notification router, which
+            makes the service calls of queued notifications (optional; one is
+            created if omitted)
+        queue (DeliveryQueue): The application's delivery queue (optional; one is
+            created and replayed if omitted). Pass it whenever the application
+            has one, so the delivery store is opened and replayed only once
         
     Returns:
         dict: Initialized components
     """
     global ha_client, tag_resolver, context_resolver, routing_engine, service_discovery, entity_manager
+    global delivery_queue, state_watcher, notification_router
     
     # Get Home Assistant API configuration
-    ha_url = app_config.get(HA_URL_OPTION, DEFAULT_HA_URL)
     ha_token = app_config.get(HA_TOKEN_OPTION, "")
     
     if not ha_token:
         logger.warning("Home Assistant token not configured, using demo mode")
         ha_token = "DEMO_TOKEN"
     
-    # Initialize Home Assistant API client
-    ha_client = HomeAssistantAPIClient(ha_url, ha_token)
+    # Initialize Home Assistant API client; it reads the Supervisor URL and token from the environment
+    ha_client = HomeAssistantAPIClient(demo_mode=ha_token == "DEMO_TOKEN")
     
-    # Initialize tag resolution service
-    tag_resolver = TagResolutionService(ha_client)
+    # Initialize entity manager; its tag writes refresh the caches built on tags
+    entity_manager = EntityManager(ha_client=ha_client)
     
-    # Initialize context resolver
-    context_resolver = ContextResolver(ha_client)
+    # Initialize tag resolution service on the entity manager's tag index, so
+    # routing decisions can be cached and are invalidated by tag writes
+    tag_resolver = create_resolution_service(ha_client, entity_manager=entity_manager)
+    
+    # Initialize context resolver, dropping users' targets when their devices are retagged
+    context_resolver = create_context_resolver(ha_client, tag_resolver, entity_manager)
     
     # Initialize service discovery
     service_discovery = ServiceDiscovery(ha_client)
     
     # Initialize routing engine
     routing_engine = RoutingEngine(tag_resolver, context_resolver, ha_client, app_config)
+    routing_engine.refresh_service_map()
+    
+    # Share the application's router, so configuration reloads and its rate
+    # limits also apply to queued deliveries
+    notification_router = router or NotificationRouter(ha_client, app_config)
     
-    # Initialize entity tag manager
-    entity_manager = EntityTagManager(ha_client, config_dir=app_config.get("config_dir", "/config"))
+    # Share the application's delivery queue; otherwise create the queue for
+    # asynchronously delivered notifications, kept on disk when a store path is
+    # configured so undelivered work is replayed. Calls without a free
+    # rate-limit slot are rescheduled, not waited for
+    if queue is not None:
+        delivery_queue = queue
+    else:
+        store_path = app_config.get("delivery_store")
+        delivery_queue = DeliveryQueue(
+            functools.partial(notification_router.call_services, max_wait=0),
+            workers=app_config.get("delivery_workers", 4),
+            store=DeliveryStore(store_path) if store_path else None,
+            rank=lambda severity: routing_engine.routing_table.severity.rank(severity),
+            aging_interval=app_config.get("delivery_aging_interval", 10.0),
+            retry_policy=RetryPolicy.from_config(app_config["retry"]) if "retry" in app_config else None
+        )
+        delivery_queue.replay()
+    
+    # Poll Home Assistant for state and service changes, so entities that come
+    # or go join or leave the tag index, presence changes refresh users' targets
+    # and entity or service changes their service mappings
+    state_watcher = StateWatcher(ha_client, app_config.get("state_poll_interval", 30.0))
+    state_watcher.add_state_listener(entity_manager.on_entity_state_changed)
+    state_watcher.add_state_listener(context_resolver.on_presence_changed)
+    state_watcher.add_state_listener(routing_engine.on_entity_state_changed)
+    state_watcher.add_services_listener(routing_engine.on_services_changed)
+    state_watcher.poll()
+    state_watcher.start()
     
     logger.info("Tag-based routing system initialized")
     
@@ -80,7 +128,10 @@ def initialize_tag_routing(app_config):
         "context_resolver": context_resolver,
         "routing_engine": routing_engine,
         "service_discovery": service_discovery,
-        "entity_manager": entity_manager
+        "entity_manager": entity_manager,
+        "delivery_queue": delivery_queue,
+        "state_watcher": state_watcher,
+        "notification_router": notification_router
     }
 
 
@@ -145,6 +196,26 @@ def tag_based_notify():
                 "detail": result
             }), 400
         
+        # Deliver in the background if requested; the caller polls the status
+        if payload.get("async"):
+            data = {key: value for key, value in payload.items()
+                    if key not in ["title", "message", "target", "audience", "async"]}
+            data["tracking_id"] = result.get("tracking_id")
+            data["target"] = target
+            tracking_id = delivery_queue.submit(
+                result["services"],
+                NotificationPayload(payload["title"], payload["message"], data),
+                tracking_id=result.get("tracking_id"),
+                severity=result.get("severity")
+            )
+            return jsonify({
+                "status": "queued",
+                "message": f"Notification queued for {len(result['services'])} services",
+                "services": result["services"],
+                "tracking_id": tracking_id,
+                "detail": result
+            }), 202
+        
         # Send notifications to selected services
         services_sent = []
         for service in result["services"]:
@@ -189,6 +260,26 @@ def tag_based_notify():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@tag_routing_bp.route('/notify/<tracking_id>', methods=['GET'])
+def tag_based_notify_status(tracking_id):
+    """API endpoint for the delivery status of an asynchronous notification.
+    
+    Args:
+        tracking_id (str): Tracking ID returned by /notify
+        
+    Returns:
+        Response: Flask response
+    """
+    delivery = delivery_queue.get_status(tracking_id)
+    if delivery is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown tracking ID: {tracking_id}"
+        }), 404
+    
+    return jsonify({"status": "ok", "delivery": delivery}), 200
+
+
 @tag_routing_bp.route('/resolve-tag', methods=['POST'])
 def resolve_tag_expression():
     """API endpoint to resolve a tag expression to entities.
@@ -6,11 +6,32 @@ based on severity levels and audience targeting.
 """
 
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
-from .ha_client import HomeAssistantAPIClient
+from .ha_client import HomeAssistantAPIClient, NotificationPayload
+from .rate_limit import RateLimiter
+from .severity import DEFAULT_SEVERITY_LEVELS, compile_routing_table
 
 logger = logging.getLogger(__name__)
 
+# Default number of service calls made concurrently for one notification
+DEFAULT_MAX_PARALLEL_CALLS = 8
+
+
+def unique_service_names(audience_services: List[tuple]) -> List[str]:
+    """Get the distinct services of several audiences in first-seen order.
+
+    Args:
+        audience_services: (audience name, services) pairs
+
+    Returns:
+        List[str]: Service names
+    """
+    return list(dict.fromkeys(
+        service_name for _, services in audience_services for service_name in services))
+
 
 class NotificationRouter:
     """Routes notifications to appropriate Home Assistant services."""
@@ -23,9 +44,24 @@ class NotificationRouter:
             config: Configuration dictionary with audiences and severity levels
         """
         self.ha_client = ha_client
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.update_config(config)
+
+    def update_config(self, config: Dict[str, Any]) -> None:
+        """Replace the configuration and recompile the audience routing table.
+
+        Args:
+            config: Configuration dictionary with audiences and severity levels
+        """
         self.config = config
-        self.severity_levels = config.get(
-            'severity_levels', ['low', 'medium', 'high', 'emergency'])
+        self.severity_levels = config.get('severity_levels', DEFAULT_SEVERITY_LEVELS)
+        self.routing_table = compile_routing_table(config)
+        # Keep the buckets across reloads, so a reload does not reset the limits
+        if getattr(self, 'rate_limiter', None) is None:
+            self.rate_limiter = RateLimiter(config.get('rate_limits'))
+        else:
+            self.rate_limiter.update_config(config.get('rate_limits'))
 
     def get_severity_level_index(self, severity: str) -> int:
         """Get the index of a severity level.
@@ -36,11 +72,11 @@ class NotificationRouter:
         Returns:
             int: Index of severity level (higher is more severe), -1 if not found
         """
-        try:
-            return self.severity_levels.index(severity)
-        except ValueError:
+        rank = self.routing_table.severity.rank(severity)
+        if rank is None:
             logger.warning(f"Unknown severity level: {severity}")
             return -1
+        return rank
 
     def is_severity_at_least(self, check_severity: str, min_severity: str) -> bool:
         """Check if a severity level is at least a minimum level.
@@ -70,21 +106,19 @@ class NotificationRouter:
         Returns:
             List[str]: List of service names to call, empty if severity is too low
         """
-        # Get audience configuration
-        audience = self.config.get('audiences', {}).get(audience_name)
-        if not audience:
+        if audience_name not in self.routing_table:
             logger.warning(f"Unknown audience: {audience_name}")
             return []
 
-        # Check if severity meets minimum threshold
-        min_severity = audience.get('min_severity', 'low')
-        if not self.is_severity_at_least(severity, min_severity):
-            logger.info(
-                f"Notification severity {severity} below minimum {min_severity} for audience {audience_name}")
-            return []
+        # Services were compiled per severity; none below the minimum threshold
+        services = self.routing_table.services(audience_name, severity)
+        if not services:
+            min_severity = self.routing_table.min_severity(audience_name)
+            if not self.is_severity_at_least(severity, min_severity):
+                logger.info(
+                    f"Notification severity {severity} below minimum {min_severity} for audience {audience_name}")
 
-        # Return services for this audience
-        return audience.get('services', [])
+        return list(services)
 
     def route_notification(self, title: str, message: str, severity: str, audiences: List[str],
                            data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -107,57 +141,48 @@ class NotificationRouter:
             'audiences_processed': []
         }
 
-        # Track which services we've already called to avoid duplicates
-        called_services = set()
+        # Collect each audience's services; every service is called at most once
+        audience_services = self.select_services(severity, audiences)
+        unique_services = unique_service_names(audience_services)
 
-        # Process each audience
-        for audience_name in audiences:
-            # Get services for this audience based on severity
-            services = self.get_audience_services(audience_name, severity)
+        # Call all services concurrently with one shared payload
+        payload = NotificationPayload(title, message, data)
+        responses = self.call_services(unique_services, payload)
+
+        # Track which services we've already reported to avoid duplicates
+        reported_services = set()
 
+        # Process each audience
+        for audience_name, services in audience_services:
             # Track that we processed this audience
             audience_result = {
                 'name': audience_name,
                 'services_called': [],
                 'services_skipped': [],
-                'min_severity': self.config.get('audiences', {}).get(audience_name, {}).get('min_severity', 'low')
+                'min_severity': self.routing_table.min_severity(audience_name) or 'low'
             }
 
-            # Call each service
             for service_name in services:
-                # Skip if we've already called this service
-                if service_name in called_services:
-                    audience_result['services_skipped'].append(service_name)
+                response = responses[service_name]
+                failed = 'error' in response
+
+                # Skip if an earlier audience already called this service
+                if service_name in reported_services:
+                    if not failed:
+                        audience_result['services_skipped'].append(service_name)
                     continue
+                reported_services.add(service_name)
 
-                # Call the service
-                try:
-                    logger.info(
-                        f"Sending notification to service: {service_name}")
-                    response = self.ha_client.send_notification(
-                        service_name, title, message, data)
-
-                    # Check for errors
-                    if 'error' in response:
-                        logger.error(
-                            f"Error sending notification to {service_name}: {response['error']}")
-                        results['failed_services'].append({
-                            'service': service_name,
-                            'error': response['error']
-                        })
-                    else:
-                        # Success!
-                        called_services.add(service_name)
-                        results['sent_to_services'].append(service_name)
-                        audience_result['services_called'].append(service_name)
-
-                except Exception as e:
-                    logger.exception(
-                        f"Exception sending notification to {service_name}")
+                # Check for errors
+                if failed:
                     results['failed_services'].append({
                         'service': service_name,
-                        'error': str(e)
+                        'error': response['error']
                     })
+                else:
+                    # Success!
+                    results['sent_to_services'].append(service_name)
+                    audience_result['services_called'].append(service_name)
 
             # Add audience result to processed list
             results['audiences_processed'].append(audience_result)
@@ -171,3 +196,128 @@ class NotificationRouter:
                 results['info'] = "No services matched the notification criteria"
 
         return results
+
+    def select_services(self, severity: str, audiences: List[str]) -> List[tuple]:
+        """Select the services of each audience for a notification severity.
+
+        Args:
+            severity: Severity level
+            audiences: List of audience names
+
+        Returns:
+            List[tuple]: (audience name, services) pairs in audience order
+        """
+        return [(audience_name, self.get_audience_services(audience_name, severity))
+                for audience_name in audiences]
+
+    def call_services(self, service_names: List[str], payload: NotificationPayload,
+                      max_wait: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Call notification services concurrently.
+
+        Calls to rate-limited services are delayed until their reserved slot
+        instead of being made (and rejected) early. The calling thread waits
+        out the delays, so pool threads are only used for actual calls. Calls
+        whose slot is more than max_wait away are not made; their response has
+        an 'error' and the 'retry_after' seconds until a slot is free, so the
+        caller can schedule them instead of holding a thread.
+
+        Args:
+            service_names: Services to call
+            payload: Notification payload shared by all calls
+            max_wait: Longest wait for a slot in seconds (optional; defaults to
+                the rate limiter's max_delay)
+
+        Returns:
+            Dict: Response of each service, with an 'error' key if the call failed
+        """
+        started = time.monotonic()
+        due = {}
+        deferred = {}
+        for service_name in service_names:
+            delay = self.rate_limiter.reserve(service_name, max_wait)
+            if delay > (self.rate_limiter.max_delay if max_wait is None else max_wait):
+                deferred[service_name] = {'error': 'Rate limited', 'retry_after': delay}
+            else:
+                due[service_name] = started + delay
+        if deferred:
+            logger.info(f"Deferred rate-limited calls to {sorted(deferred)}")
+        service_names = [service_name for service_name in service_names if service_name in due]
+
+        if len(service_names) <= 1:
+            responses = deferred
+            for service_name in service_names:
+                self._wait_for_slot(service_name, due[service_name], started)
+                responses[service_name] = self._call_service(service_name, payload)
+            return responses
+
+        executor = self._get_executor()
+        futures = {}
+        for service_name in sorted(service_names, key=due.get):
+            self._wait_for_slot(service_name, due[service_name], started)
+            futures[service_name] = executor.submit(self._call_service, service_name, payload)
+        # Each call is bounded by the client's request timeout
+        responses = deferred
+        for service_name in service_names:
+            responses[service_name] = futures[service_name].result()
+        return responses
+
+    def _wait_for_slot(self, service_name: str, due: float, started: float) -> None:
+        """Sleep until a service's rate-limit slot if its call was delayed.
+
+        Args:
+            service_name: Service about to be called
+            due: Monotonic time of the reserved slot
+            started: Monotonic time the slot was reserved at
+        """
+        if due <= started:
+            return
+        remaining = due - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.rate_limiter.started(service_name)
+
+    def get_rate_limit_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get queue depth and wait statistics of rate-limited services.
+
+        Returns:
+            Dict: Statistics per service
+        """
+        return self.rate_limiter.stats()
+
+    def _call_service(self, service_name: str, payload: NotificationPayload) -> Dict[str, Any]:
+        """Call one notification service, turning exceptions into error responses.
+
+        Args:
+            service_name: Service to call
+            payload: Notification payload
+
+        Returns:
+            Dict: Service response
+        """
+        try:
+            logger.info(f"Sending notification to service: {service_name}")
+            response = self.ha_client.send_notification(
+                service_name, payload.title, payload.message, payload.data, payload=payload)
+            if 'error' in response:
+                logger.error(f"Error sending notification to {service_name}: {response['error']}")
+            return response
+        except Exception as e:
+            logger.exception(f"Exception sending notification to {service_name}")
+            return {'error': str(e)}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the bounded thread pool used for service calls."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.get('max_parallel_calls', DEFAULT_MAX_PARALLEL_CALLS),
+                    thread_name_prefix="notify"
+                )
+            return self._executor
+
+    def shutdown(self) -> None:
+        """Stop the service call thread pool."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -10,6 +10,9 @@ Example expressions:
 - "area:kitchen+device:speaker" - All speakers in the kitchen
 - "user:john|user:jane" - All entities belonging to either John or Jane
 - "area:home-area:bedroom" - All entities in the home but not in the bedroom
+- "*" - All entities
+- "user:john+device:*" - All of John's entities with any "device:" tag
+- "area:bed*" - All entities with an area tag starting with "bed"
 
 The parser converts these expressions into a structured format that can be evaluated
 against entity tags to determine if an entity matches the expression.
@@ -18,9 +21,13 @@ against entity tags to determine if an entity matches the expression.
 import re
 import logging
 from enum import Enum
+from .cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Tag matching every entity; as a suffix ("device:*") it matches any tag with that prefix
+WILDCARD_TAG = "*"
+
 
 class OperatorType(Enum):
     """Enumeration of supported operators in tag expressions."""
@@ -30,7 +37,19 @@ class OperatorType(Enum):
 
 
 class TagNode:
-    """Base class for nodes in the tag expression parse tree."""
+    """Base class for nodes in the tag expression parse tree.
+    
+    Nodes are immutable once constructed so that parse trees can be shared
+    between threads through the parse cache.
+    """
+    __slots__ = ()
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable")
+    
     def evaluate(self, entity_tags):
         """Evaluate if entity tags match this node.
         
@@ -53,13 +72,15 @@ class TagNode:
 
 class TagLiteral(TagNode):
     """Node representing a literal tag in an expression."""
+    __slots__ = ("tag",)
+    
     def __init__(self, tag):
         """Initialize with a tag value.
         
         Args:
             tag: String tag value (e.g., "user:john")
         """
-        self.tag = tag
+        object.__setattr__(self, "tag", tag)
     
     def evaluate(self, entity_tags):
         """Check if entity has this tag.
@@ -71,7 +92,7 @@ class TagLiteral(TagNode):
             bool: True if entity has this tag
         """
         # Special case for wildcard tag
-        if self.tag == "*":
+        if self.tag == WILDCARD_TAG:
             return True
         return self.tag in entity_tags
     
@@ -90,8 +111,85 @@ class TagLiteral(TagNode):
         return f"Tag({self.tag})"
 
 
+class TagPrefix(TagNode):
+    """Node representing a wildcard tag such as "device:*" or "area:bed*"."""
+    __slots__ = ("prefix",)
+    
+    def __init__(self, prefix):
+        """Initialize with a tag prefix.
+        
+        Args:
+            prefix: String the matching tags start with (e.g., "device:")
+        """
+        object.__setattr__(self, "prefix", prefix)
+    
+    @property
+    def pattern(self):
+        """Wildcard tag as written in expressions (e.g., "device:*")."""
+        return self.prefix + WILDCARD_TAG
+    
+    def evaluate(self, entity_tags):
+        """Check if entity has any tag starting with the prefix.
+        
+        Args:
+            entity_tags: List of tags for an entity
+            
+        Returns:
+            bool: True if entity has a matching tag
+        """
+        return any(tag.startswith(self.prefix) for tag in entity_tags)
+    
+    def to_dict(self):
+        """Convert to dictionary representation.
+        
+        Returns:
+            dict: Dictionary with node type and wildcard tag
+        """
+        return {
+            "type": "prefix",
+            "value": self.pattern
+        }
+    
+    def __str__(self):
+        return f"Prefix({self.pattern})"
+
+
+class TagEmpty(TagNode):
+    """Node that matches no entity.
+    
+    Produced by the simplifier for provably empty expressions such as "a:b-a:b".
+    """
+    __slots__ = ()
+    
+    def evaluate(self, entity_tags):
+        """An empty expression never matches.
+        
+        Args:
+            entity_tags: List of tags for an entity
+            
+        Returns:
+            bool: Always False
+        """
+        return False
+    
+    def to_dict(self):
+        """Convert to dictionary representation.
+        
+        Returns:
+            dict: Dictionary with the node type
+        """
+        return {
+            "type": "empty"
+        }
+    
+    def __str__(self):
+        return "Empty()"
+
+
 class TagOperator(TagNode):
     """Node representing an operator in a tag expression."""
+    __slots__ = ("operator_type", "left", "right")
+    
     def __init__(self, operator_type, left, right=None):
         """Initialize with operator type and operands.
         
@@ -100,9 +198,9 @@ class TagOperator(TagNode):
             left: Left operand node
             right: Right operand node (None for unary operators)
         """
-        self.operator_type = operator_type
-        self.left = left
-        self.right = right
+        object.__setattr__(self, "operator_type", operator_type)
+        object.__setattr__(self, "left", left)
+        object.__setattr__(self, "right", right)
     
     def evaluate(self, entity_tags):
         """Evaluate operator node against entity tags.
@@ -147,17 +245,66 @@ class TagOperator(TagNode):
         return f"Op({self.operator_type}, {self.left}, {self.right})"
 
 
+# Operator precedence (higher binds tighter); all operators are left-associative
+OPERATOR_PRECEDENCE = {
+    OperatorType.OR: 1,
+    OperatorType.AND: 2,
+    OperatorType.NOT: 3
+}
+
+_OPERATORS = {op.value: op for op in OperatorType}
+
+# Token kinds produced by the tokenizer
+TOKEN_TAG = "tag"
+TOKEN_OPERATOR = "operator"
+TOKEN_LPAREN = "("
+TOKEN_RPAREN = ")"
+
+
+class _TokenStream:
+    """Cursor over the tokens of a single expression."""
+    
+    def __init__(self, expression, tokens):
+        self.expression = expression
+        self.tokens = tokens
+        self.position = 0
+    
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+    
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+
 class TagExpressionParser:
     """Parser for tag expressions.
     
     Converts string tag expressions into a parse tree that can be evaluated
-    against entity tags.
+    against entity tags. The expression is tokenized in a single pass and the
+    tree is built by precedence climbing, so parsing time grows linearly with
+    the length of the expression.
     """
     
-    def __init__(self):
-        """Initialize the parser."""
+    DEFAULT_MAX_LENGTH = 4096
+    DEFAULT_MAX_DEPTH = 32
+    
+    def __init__(self, max_length=DEFAULT_MAX_LENGTH, max_depth=DEFAULT_MAX_DEPTH):
+        """Initialize the parser.
+        
+        Args:
+            max_length (int): Maximum accepted expression length in characters
+            max_depth (int): Maximum nesting depth of parenthesized groups
+        """
         # Regular expression to validate tag format
         self.tag_pattern = re.compile(r'^[a-zA-Z0-9_-]+:[a-zA-Z0-9_-]+$')
+        # Wildcard tags: a namespace ("device:*") or value prefix ("area:bed*")
+        self.prefix_pattern = re.compile(r'^[a-zA-Z0-9_-]+:[a-zA-Z0-9_-]*\*$')
+        self.max_length = max_length
+        self.max_depth = max_depth
     
     def parse(self, expression):
         """Parse a tag expression into a structured representation.
@@ -170,6 +317,12 @@ class TagExpressionParser:
         """
         if not expression or not isinstance(expression, str):
             raise ValueError("Expression must be a non-empty string")
+        
+        if len(expression) > self.max_length:
+            raise ValueError(
+                f"Expression is too long ({len(expression)} characters, "
+                f"maximum is {self.max_length})"
+            )
             
         # Check for standalone operators which are invalid
         if expression in ['+', '|', '-']:
@@ -183,150 +336,125 @@ class TagExpressionParser:
         if expression.startswith('+') or expression.startswith('|'):
             raise ValueError(f"Invalid expression: '{expression}' has a leading operator")
         
-        # Start with parsing OR operator (lowest precedence)
-        return self._parse_or(expression)
-    
-    def _parse_or(self, expression):
-        """Parse an OR expression.
-        
-        Args:
-            expression (str): Tag expression
-            
-        Returns:
-            TagNode: Root node of the parse tree
-        """
-        # Split by OR operator
-        parts = []
-        current = ""
-        depth = 0
-        for char in expression:
-            if char == '(' and not (current and current[-1] == '\\'): 
-                depth += 1
-            elif char == ')' and not (current and current[-1] == '\\'):
-                depth -= 1
-            
-            if char == OperatorType.OR.value and depth == 0:
-                parts.append(current)
-                current = ""
-            else:
-                current += char
-        
-        if current:
-            parts.append(current)
+        stream = _TokenStream(expression, self.tokenize(expression))
+        if stream.peek() is None:
+            raise ValueError("Empty expression")
         
-        # If there's only one part, there's no OR operator
-        if len(parts) == 1:
-            return self._parse_and(parts[0].strip())
+        node = self._parse_binary(stream, 1, 0)
         
-        # Process left-to-right for multiple OR operators
-        node = self._parse_and(parts[0].strip())
-        for part in parts[1:]:
-            node = TagOperator(OperatorType.OR, node, self._parse_and(part.strip()))
+        token = stream.peek()
+        if token is not None:
+            raise ValueError(
+                f"Invalid expression: unexpected '{token[1]}' at position {token[2]}"
+            )
         
         return node
     
-    def _parse_and(self, expression):
-        """Parse an AND expression.
+    def tokenize(self, expression):
+        """Split an expression into tag, operator and parenthesis tokens.
         
         Args:
             expression (str): Tag expression
             
         Returns:
-            TagNode: Root node of the parse tree
+            list: Tokens as (kind, value, position) tuples
         """
-        # Split by AND operator
-        parts = []
-        current = ""
-        depth = 0
-        for char in expression:
-            if char == '(' and not (current and current[-1] == '\\'): 
-                depth += 1
-            elif char == ')' and not (current and current[-1] == '\\'):
-                depth -= 1
+        tokens = []
+        length = len(expression)
+        index = 0
+        
+        while index < length:
+            char = expression[index]
             
-            if char == OperatorType.AND.value and depth == 0:
-                parts.append(current)
-                current = ""
+            if char.isspace():
+                index += 1
+            elif char in _OPERATORS:
+                tokens.append((TOKEN_OPERATOR, _OPERATORS[char], index))
+                index += 1
+            elif char == '(':
+                tokens.append((TOKEN_LPAREN, char, index))
+                index += 1
+            elif char == ')':
+                tokens.append((TOKEN_RPAREN, char, index))
+                index += 1
             else:
-                current += char
-        
-        if current:
-            parts.append(current)
-        
-        # If there's only one part, there's no AND operator
-        if len(parts) == 1:
-            return self._parse_not(parts[0].strip())
-        
-        # Process left-to-right for multiple AND operators
-        node = self._parse_not(parts[0].strip())
-        for part in parts[1:]:
-            node = TagOperator(OperatorType.AND, node, self._parse_not(part.strip()))
-        
-        return node
+                start = index
+                while (index < length and expression[index] not in _OPERATORS
+                       and expression[index] not in '()' and not expression[index].isspace()):
+                    index += 1
+                
+                tag = expression[start:index]
+                if (tag != WILDCARD_TAG and not self.tag_pattern.match(tag)
+                        and not self.prefix_pattern.match(tag)):
+                    raise ValueError(f"Invalid tag format: {tag}")
+                tokens.append((TOKEN_TAG, tag, start))
+        
+        return tokens
     
-    def _parse_not(self, expression):
-        """Parse a NOT expression.
+    def _parse_binary(self, stream, min_precedence, depth):
+        """Parse a sequence of operands joined by operators of at least a precedence.
         
         Args:
-            expression (str): Tag expression
+            stream (_TokenStream): Token stream
+            min_precedence (int): Lowest operator precedence consumed by this call
+            depth (int): Current parenthesis nesting depth
             
         Returns:
-            TagNode: Root node of the parse tree
+            TagNode: Root node of the parsed sub-tree
         """
-        # Split by NOT operator
-        parts = []
-        current = ""
-        depth = 0
-        for char in expression:
-            if char == '(' and not (current and current[-1] == '\\'): 
-                depth += 1
-            elif char == ')' and not (current and current[-1] == '\\'):
-                depth -= 1
-            
-            if char == OperatorType.NOT.value and depth == 0:
-                parts.append(current)
-                current = ""
-            else:
-                current += char
-        
-        if current:
-            parts.append(current)
-        
-        # If there's only one part, there's no NOT operator
-        if len(parts) == 1:
-            return self._parse_atom(parts[0].strip())
-        
-        # Process left-to-right for NOT operator
-        node = self._parse_atom(parts[0].strip())
-        for part in parts[1:]:
-            node = TagOperator(OperatorType.NOT, node, self._parse_atom(part.strip()))
+        node = self._parse_atom(stream, depth)
         
-        return node
+        while True:
+            token = stream.peek()
+            if token is None or token[0] != TOKEN_OPERATOR:
+                return node
+            
+            operator_type = token[1]
+            precedence = OPERATOR_PRECEDENCE[operator_type]
+            if precedence < min_precedence:
+                return node
+            
+            stream.next()
+            right = self._parse_binary(stream, precedence + 1, depth)
+            node = TagOperator(operator_type, node, right)
     
-    def _parse_atom(self, expression):
+    def _parse_atom(self, stream, depth):
         """Parse an atomic expression (tag or parenthesized expression).
         
         Args:
-            expression (str): Tag expression
+            stream (_TokenStream): Token stream
+            depth (int): Current parenthesis nesting depth
             
         Returns:
-            TagNode: Root node of the parse tree
+            TagNode: Root node of the parsed sub-tree
         """
-        expression = expression.strip()
+        token = stream.next()
         
-        # Empty expression
-        if not expression:
+        # Missing operand
+        if token is None or token[0] in (TOKEN_OPERATOR, TOKEN_RPAREN):
             raise ValueError("Empty expression")
         
+        if token[0] == TOKEN_TAG:
+            tag = token[1]
+            if tag != WILDCARD_TAG and tag.endswith(WILDCARD_TAG):
+                return TagPrefix(tag[:-1])
+            return TagLiteral(tag)
+        
         # Parenthesized expression
-        if expression.startswith('(') and expression.endswith(')'):
-            return self.parse(expression[1:-1].strip())
+        if depth >= self.max_depth:
+            raise ValueError(
+                f"Expression is nested too deeply (maximum depth is {self.max_depth})"
+            )
+        
+        node = self._parse_binary(stream, 1, depth + 1)
         
-        # Validate tag format
-        if not self.tag_pattern.match(expression):
-            raise ValueError(f"Invalid tag format: {expression}")
+        closing = stream.next()
+        if closing is None or closing[0] != TOKEN_RPAREN:
+            raise ValueError(
+                f"Invalid expression: unbalanced parentheses in '{stream.expression}'"
+            )
         
-        return TagLiteral(expression)
+        return node
     
     def evaluate(self, expression, entity_tags):
         """Evaluate if an entity's tags match the expression.
@@ -342,7 +470,7 @@ class TagExpressionParser:
             return False
         
         try:
-            parse_tree = self.parse(expression)
+            parse_tree = parse_expression(expression)
             return parse_tree.evaluate(entity_tags)
         except Exception as e:
             logger.error(f"Error evaluating expression '{expression}': {e}")
@@ -356,4 +484,53 @@ def create_parser():
     Returns:
         TagExpressionParser: New parser instance
     """
-    return TagExpressionParser()
\ No newline at end of file
+    return TagExpressionParser()
+
+
+# Process-wide cache of parse trees keyed by normalized expression
+_parse_cache = LRUCache(maxsize=512)
+_cache_parser = TagExpressionParser()
+
+
+def normalize_expression(expression):
+    """Normalize an expression string for use as a cache key.
+    
+    Args:
+        expression (str): Tag expression
+        
+    Returns:
+        str: Normalized expression
+    """
+    return expression.strip()
+
+
+def parse_expression(expression):
+    """Parse a tag expression, reusing a cached parse tree when available.
+    
+    The returned tree is shared between callers and must not be modified.
+    
+    Args:
+        expression (str): A tag expression like "user:john+device:mobile"
+        
+    Returns:
+        TagNode: Root node of the parse tree
+    """
+    if not expression or not isinstance(expression, str):
+        raise ValueError("Expression must be a non-empty string")
+    
+    key = normalize_expression(expression)
+    parse_tree = _parse_cache.get(key)
+    if parse_tree is None:
+        parse_tree = _cache_parser.parse(key)
+        _parse_cache.put(key, parse_tree)
+    
+    return parse_tree
+
+
+def get_parse_cache():
+    """Get the process-wide parse tree cache.
+    
+    Returns:
+        LRUCache: Cache of parse trees
+    """
+    return _parse_cache
@@ -0,0 +1,254 @@
+"""
+Service Rate Limiting
+
+This module paces calls to notification services that have their own rate
+limits (mobile push, Telegram, TTS speakers, ...). Limits are token buckets
+configured per service and per domain under `rate_limits`:
+
+    rate_limits:
+      max_delay: 10
+      domains:
+        tts: {rate: 0.2, burst: 1}
+      services:
+        notify.telegram: {rate: 1, burst: 5}
+
+`rate` is the sustained number of calls per second and `burst` the number of
+calls allowed back to back. A call over the limit is not failed: it reserves
+the next free slot and is told how long to wait for it, so a burst is spread
+out at the configured rate. Slots are reserved at most `max_delay` seconds
+ahead; a call whose slot would be further away reserves nothing and is told
+when to ask again, so the backlog of a slow service stays bounded and callers
+such as the delivery queue can park the call instead of waiting for it.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default seconds a slot can be reserved ahead
+DEFAULT_MAX_DELAY = 10.0
+
+
+class TokenBucket:
+    """Token bucket handing out reservations for future slots."""
+    __slots__ = ("rate", "burst", "tokens", "updated", "_lock")
+
+    def __init__(self, rate, burst=None):
+        """Initialize a full bucket.
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Bucket capacity (optional; defaults to max(1, rate))
+        """
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, borrowing against future refills if the bucket is empty.
+
+        Returns:
+            float: Seconds until the reserved token is available (0 if now)
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def wait_time(self):
+        """Get the wait a reservation made now would have, without making it.
+
+        Returns:
+            float: Seconds until the next token is available (0 if now)
+        """
+        with self._lock:
+            self._refill()
+            return (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+
+    def configure(self, rate, burst=None):
+        """Change the rate and capacity, keeping the tokens already taken.
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Bucket capacity (optional; defaults to max(1, rate))
+        """
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.burst = float(burst if burst is not None else max(1.0, rate))
+            self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        """Add the tokens earned since the last update (caller must hold the lock)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Per-service and per-domain token buckets with wait statistics."""
+
+    def __init__(self, config=None):
+        """Initialize the limiter.
+
+        Args:
+            config (dict): The `rate_limits` configuration section (optional)
+        """
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.update_config(config)
+
+    def update_config(self, config):
+        """Replace the limits, keeping the state of buckets that still have one.
+
+        Buckets whose limit changed are rescaled rather than refilled, so a
+        configuration reload does not hand out a fresh burst.
+
+        Args:
+            config (dict): The `rate_limits` configuration section
+        """
+        config = config or {}
+        service_limits = self._parse_limits(config.get("services"))
+        domain_limits = self._parse_limits(config.get("domains"))
+        with self._lock:
+            self.max_delay = float(config.get("max_delay", DEFAULT_MAX_DELAY))
+            self.service_limits = service_limits
+            self.domain_limits = domain_limits
+            for key, bucket in list(self._buckets.items()):
+                limits = service_limits if key[0] == "service" else domain_limits
+                limit = limits.get(key[1])
+                if limit is None:
+                    del self._buckets[key]
+                else:
+                    bucket.configure(*limit)
+
+    @staticmethod
+    def _parse_limits(section):
+        """Parse a name to {rate, burst} mapping, skipping invalid entries."""
+        limits = {}
+        for name, limit in (section or {}).items():
+            try:
+                rate = float(limit["rate"])
+                burst = limit.get("burst")
+                if rate <= 0:
+                    raise ValueError("rate must be positive")
+                limits[name] = (rate, float(burst) if burst is not None else None)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring invalid rate limit for {name}: {e}")
+        return limits
+
+    def _get_bucket(self, key, limit):
+        """Get or create the bucket of a service or domain (caller must hold the lock)."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*limit)
+        return bucket
+
+    def reserve(self, service_name, max_delay=None):
+        """Reserve a call slot for a service.
+
+        A delayed reservation counts as waiting until started() is called. If
+        the slot is further away than max_delay, nothing is reserved.
+
+        Args:
+            service_name (str): Full service name (domain.service)
+            max_delay (float): Longest wait accepted (optional; defaults to the
+                configured max_delay)
+
+        Returns:
+            float: Seconds to wait before making the call (0 if it can go now);
+                more than max_delay if no slot was reserved
+        """
+        domain = service_name.split(".", 1)[0]
+        service_limit = self.service_limits.get(service_name)
+        domain_limit = self.domain_limits.get(domain)
+        if service_limit is None and domain_limit is None:
+            return 0.0
+
+        # Every bucket is only changed under the limiter lock, so the buckets
+        # of a service are checked and taken from together
+        with self._lock:
+            buckets = []
+            if service_limit is not None:
+                buckets.append(self._get_bucket(("service", service_name), service_limit))
+            if domain_limit is not None:
+                buckets.append(self._get_bucket(("domain", domain), domain_limit))
+            stats = self._stats.get(service_name)
+            if stats is None:
+                stats = self._stats[service_name] = {
+                    "calls": 0, "delayed": 0, "deferred": 0, "waiting": 0, "total_wait": 0.0,
+                    "max_wait": 0.0}
+
+            delay = max(bucket.wait_time() for bucket in buckets)
+            if delay > (self.max_delay if max_delay is None else max_delay):
+                stats["deferred"] += 1
+                logger.debug(f"Next slot of {service_name} is {delay:.3f}s away; not reserved")
+                return delay
+            delay = max(bucket.reserve() for bucket in buckets)
+
+            stats["calls"] += 1
+            if delay > 0:
+                stats["delayed"] += 1
+                stats["waiting"] += 1
+                stats["total_wait"] += delay
+                stats["max_wait"] = max(stats["max_wait"], delay)
+        if delay > 0:
+            logger.debug(f"Delaying call to {service_name} by {delay:.3f}s to respect its rate limit")
+        return delay
+
+    def started(self, service_name):
+        """Record that a delayed call has finished waiting.
+
+        Args:
+            service_name (str): Service whose reservation was delayed
+        """
+        with self._lock:
+            stats = self._stats.get(service_name)
+            if stats is not None and stats["waiting"] > 0:
+                stats["waiting"] -= 1
+
+    def stats(self):
+        """Get per-service statistics.
+
+        Returns:
+            dict: For each rate-limited service: calls, delayed calls, calls
+                deferred for lack of a slot within max_delay, calls currently
+                waiting, and average and maximum wait in milliseconds
+        """
+        with self._lock:
+            return {
+                service_name: {
+                    "calls": stats["calls"],
+                    "delayed": stats["delayed"],
+                    "deferred": stats["deferred"],
+                    "waiting": stats["waiting"],
+                    "avg_wait_ms": round(stats["total_wait"] / stats["delayed"] * 1000, 3)
+                    if stats["delayed"] else 0.0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 3)
+                }
+                for service_name, stats in self._stats.items()
+            }
+
+
+# Helper function to create rate limiter instance
+def create_rate_limiter(config=None):
+    """Create a new RateLimiter instance.
+
+    Args:
+        config (dict): The `rate_limits` configuration section (optional)
+
+    Returns:
+        RateLimiter: New rate limiter instance
+    """
+    return RateLimiter(config)
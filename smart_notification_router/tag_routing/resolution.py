@@ -5,27 +5,95 @@ This module provides services for resolving tag expressions to Home Assistant en
 and determining the appropriate notification targets based on context.
 """
 
+import bisect
 import logging
-import time
-from .parser import TagExpressionParser, create_parser
+import threading
+from .cache import LRUCache
+from .compiler import compile_expression
+from .context import RoutingContext
 from .ha_client import HomeAssistantAPIClient
+from .singleflight import SingleFlight
+from .subscriptions import SubscriptionIndex
 
 logger = logging.getLogger(__name__)
 
+
+class ExpressionView:
+    """Cached result of an expression, maintained incrementally as tags change."""
+    __slots__ = ("plan", "entities", "version")
+    
+    def __init__(self, plan, entities):
+        """Initialize the view.
+        
+        Args:
+            plan (CompiledExpression): Compiled expression of the view
+            entities (list): Sorted matching entity IDs
+        """
+        self.plan = plan
+        self.entities = entities
+        self.version = 0
+    
+    def apply(self, entity_id, new_tags):
+        """Re-check one entity and add or remove it.
+        
+        The entity list is replaced rather than modified, so lists already
+        handed out to callers never change underneath them.
+        
+        Args:
+            entity_id (str): Entity ID
+            new_tags (frozenset): Tags of the entity (None if it was removed)
+            
+        Returns:
+            bool: True if the view changed
+        """
+        matches = new_tags is not None and self.plan.evaluate(new_tags)
+        position = bisect.bisect_left(self.entities, entity_id)
+        present = position < len(self.entities) and self.entities[position] == entity_id
+        
+        if matches == present:
+            return False
+        
+        entities = list(self.entities)
+        if matches:
+            entities.insert(position, entity_id)
+        else:
+            del entities[position]
+        self.entities = entities
+        self.version += 1
+        return True
+
 class TagResolutionService:
     """Service for resolving tag expressions to entities."""
     
-    def __init__(self, ha_client):
+    DEFAULT_CACHE_SIZE = 1024
+    DEFAULT_CACHE_TTL = 300  # 5 minutes cache TTL
+    INVALID_CACHE_SIZE = 256
+    
+    def __init__(self, ha_client, tag_index=None, cache_size=DEFAULT_CACHE_SIZE,
+                 cache_ttl=DEFAULT_CACHE_TTL):
         """Initialize the tag resolution service.
         
         Args:
             ha_client (HomeAssistantAPIClient): Home Assistant API client
+            tag_index (TagIndex): Tag index to resolve expressions against (optional);
+                without one, expressions are resolved through the API client
+            cache_size (int): Maximum number of cached resolutions
+            cache_ttl (float): Seconds a cached resolution stays valid
         """
         self.ha_client = ha_client
-        self.parser = create_parser()
-        self.cache = {}
-        self.cache_time = {}
-        self.cache_ttl = 300  # 5 minutes cache TTL
+        self.tag_index = tag_index
+        self.cache_ttl = cache_ttl
+        # Results keyed by canonical expression
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl, on_evict=self._on_evict)
+        # Invalid expressions as written, so they are rejected without parsing;
+        # kept apart so the result cache statistics only count real lookups
+        self.invalid_cache = LRUCache(maxsize=self.INVALID_CACHE_SIZE)
+        # Cached canonical expressions, matched in reverse when entity tags change
+        self.subscriptions = SubscriptionIndex()
+        # Concurrent misses for the same canonical expression share one lookup
+        self.inflight = SingleFlight()
+        self._generation = 0
+        self._lock = threading.RLock()
     
     def resolve_expression(self, expression):
         """Resolve a tag expression to matching entities.
@@ -36,61 +104,224 @@ class TagResolutionService:
         Returns:
             list: Matching entity IDs
         """
-        # Check cache
-        if expression in self.cache and (time.time() - self.cache_time.get(expression, 0)) < self.cache_ttl:
-            return self.cache[expression]
-            
         # Special case for traditional audiences (backward compatibility)
         if ':' not in expression:
             logger.info(f"Traditional audience detected: {expression}")
             # Returning empty list as traditional audiences are handled separately
             return []
+        
+        # Known invalid expressions are rejected from the negative cache
+        if self.invalid_cache.get(expression) is not None:
+            return []
+        
+        # Reject invalid expressions before querying Home Assistant
+        try:
+            compiled = compile_expression(expression)
+        except ValueError as e:
+            logger.error(f"Invalid tag expression '{expression}': {e}")
+            self.invalid_cache.put(expression, str(e))
+            return []
+        
+        # Equivalent expressions share one cached view under the canonical form
+        key = compiled.expression
+        view = self.cache.get(key)
+        if view is not None:
+            return view.entities
+        
+        return self.inflight.do(key, self._load_view, expression, compiled)
+    
+    def _load_view(self, expression, compiled):
+        """Resolve a compiled expression and cache its view.
+        
+        Args:
+            expression (str): The expression as written
+            compiled (CompiledExpression): Its compiled plan
             
-        # Get entities matching the expression
-        entities = self.ha_client.get_entities_by_tag_expression(expression)
+        Returns:
+            list: Matching entity IDs
+        """
+        key = compiled.expression
+        
+        # A lookup that finished just before this one started filled the cache
+        view = self.cache.get(key)
+        if view is not None:
+            return view.entities
         
-        # Cache and return results
-        self.cache[expression] = entities
-        self.cache_time[expression] = time.time()
+        generation = self._generation
+        if compiled.is_empty:
+            # Provably empty (e.g. "user:john-user:john"); nothing to look up
+            logger.info(f"Expression '{expression}' can never match any entity")
+            entities = []
+        elif self.tag_index is not None:
+            entities = sorted(self.tag_index.resolve(compiled))
+        else:
+            entities = self.ha_client.get_entities_by_tag_expression(expression)
+        
+        # Cache the result (empty results included) unless tags changed meanwhile
+        with self._lock:
+            if generation == self._generation:
+                if key not in self.subscriptions:
+                    self.subscriptions.add(key, compiled)
+                self.cache.put(key, ExpressionView(compiled, entities))
         
         logger.info(f"Resolved expression '{expression}' to {len(entities)} entities")
         return entities
     
+    def on_entity_tags_changed(self, entity_id, old_tags, new_tags):
+        """Update the cached views an entity tag change affects.
+        
+        The views the entity joins or leaves are found through the subscription
+        index; each is updated in place by re-checking only this entity, so no
+        expression is re-evaluated against the whole registry.
+        
+        Args:
+            entity_id (str): Entity ID
+            old_tags (iterable): Tags before the change (None for a new entity)
+            new_tags (iterable): Tags after the change (None for a removed entity)
+            
+        Returns:
+            set: Canonical expressions whose cached views changed
+        """
+        if new_tags is not None:
+            new_tags = frozenset(new_tags)
+        
+        changed = set()
+        with self._lock:
+            self._generation += 1
+            for key in self.subscriptions.affected(old_tags, new_tags):
+                view = self.cache.get(key)
+                if view is not None and view.apply(entity_id, new_tags):
+                    changed.add(key)
+        
+        if changed:
+            logger.debug(f"Tag change on {entity_id} updated {len(changed)} cached expressions")
+        return changed
+    
+    @property
+    def version(self):
+        """Version of the tag data expressions resolve against (None without a tag index)."""
+        return self.tag_index.version if self.tag_index is not None else None
+    
+    def get_view_version(self, expression):
+        """Get the version of an expression's cached view.
+        
+        The version grows each time the view is updated in place, so callers
+        can tell whether a result changed since they last resolved it.
+        
+        Args:
+            expression (str): A tag expression
+            
+        Returns:
+            int: Version of the cached view, or None if it is not cached
+        """
+        try:
+            key = compile_expression(expression).expression
+        except ValueError:
+            return None
+        
+        view = self.cache.get(key)
+        if view is None:
+            return None
+        return view.version
+    
+    def invalidate_expression(self, expression):
+        """Invalidate the cached result of an expression and its equivalents.
+        
+        Args:
+            expression (str): Canonical expression
+        """
+        with self._lock:
+            self.subscriptions.remove(expression)
+            self.cache.pop(expression)
+    
     def invalidate_cache(self):
         """Invalidate the resolution cache."""
-        self.cache = {}
-        self.cache_time = {}
+        with self._lock:
+            self._generation += 1
+            self.cache.clear()
+            self.invalid_cache.clear()
+            self.subscriptions = SubscriptionIndex()
         logger.info("Tag resolution cache invalidated")
+    
+    def _on_evict(self, key, value):
+        """Stop tracking expressions dropped from the cache by size or age.
+        
+        The callback runs after the cache lock is released, so another thread
+        may have cached a fresh view under the key meanwhile; its subscription
+        is kept.
+        """
+        with self._lock:
+            if key not in self.cache:
+                self.subscriptions.remove(key)
 
 
 class ContextResolver:
     """Service for resolving context information for smart routing."""
     
-    def __init__(self, ha_client):
+    def __init__(self, ha_client, tag_resolver=None, table_size=1024, table_ttl=300):
         """Initialize the context resolver.
         
         Args:
             ha_client (HomeAssistantAPIClient): Home Assistant API client
+            tag_resolver (TagResolutionService): Tag resolution service used to
+                resolve device expressions (optional)
+            table_size (int): Maximum number of users kept in the target table
+            table_ttl (float): Seconds a user's targets are kept, so tag changes
+                made outside the entity manager are picked up (None to disable)
         """
         self.ha_client = ha_client
-        self.parser = create_parser()
+        self.tag_resolver = tag_resolver
+        # username -> {priority: (presence, targets) built for that presence}
+        self._targets = LRUCache(maxsize=table_size, ttl=table_ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.target_hits = 0
+        self.target_builds = 0
+    
+    def create_context(self):
+        """Create a snapshot for routing one notification.
+        
+        Returns:
+            RoutingContext: Empty routing context
+        """
+        return RoutingContext(self.ha_client, self.tag_resolver)
+    
+    def prefetch_users(self, user_ids, context):
+        """Load the person and device states of several users in one request.
+        
+        Args:
+            user_ids (iterable): User IDs or tags (e.g., "user:john")
+            context (RoutingContext): Snapshot to load the states into
+        """
+        entity_ids = []
+        for user_id in user_ids:
+            username = _username(user_id)
+            entity_ids.append(f"person.{username}")
+            entity_ids.extend(context.resolve(f"user:{username}+device:*"))
+        context.prefetch_states(entity_ids)
     
-    def get_user_presence(self, user_id):
+    def get_user_presence(self, user_id, context=None):
         """Get presence information for a user.
         
         Args:
             user_id (str): User ID or tag (e.g., "user:john")
+            context (RoutingContext): Snapshot shared with the rest of the routing
+                decision (optional; a fresh one is used if omitted)
             
         Returns:
             dict: Presence information with location and devices
         """
-        # Extract username from tag if provided in tag format
-        username = user_id
-        if ':' in user_id:
-            _, username = user_id.split(':', 1)
+        if context is None:
+            context = self.create_context()
+        
+        username = _username(user_id)
+        
+        # Fetch the person and all of the user's devices together
+        device_entities = context.resolve(f"user:{username}+device:*")
+        context.prefetch_states([f"person.{username}"] + list(device_entities))
         
         # Get person entity
-        person_entity = self.ha_client.get_entity_state(f"person.{username}")
+        person_entity = context.get_state(f"person.{username}")
         
         if not person_entity:
             logger.warning(f"Person entity not found for user: {username}")
@@ -108,13 +339,9 @@ class ContextResolver:
         # Determine presence
         presence = "home" if state == "home" else "away"
         
-        # Get user's devices
-        devices_expression = f"user:{username}+device:*"
-        device_entities = self.ha_client.get_entities_by_tag_expression(devices_expression)
-        
         device_states = []
         for device_id in device_entities:
-            device_state = self.ha_client.get_entity_state(device_id)
+            device_state = context.get_state(device_id)
             if device_state:
                 device_states.append({
                     "entity_id": device_id,
@@ -139,8 +366,10 @@ class ContextResolver:
             str: Priority level
         """
         severity_map = {
+            "emergency": "high",
             "critical": "high",
             "high": "high",
+            "medium": "normal",
             "normal": "normal",
             "low": "low",
             "info": "low"
@@ -148,44 +377,101 @@ class ContextResolver:
         
         return severity_map.get(severity.lower(), "normal")
     
-    def get_best_notification_targets(self, user_id, severity):
+    def get_best_notification_targets(self, user_id, severity, context=None):
         """Get best notification targets for a user based on context.
         
+        Targets are kept in a table keyed by (user, priority). An entry is built
+        on first use and reused until the user's presence changes or a tag on
+        one of their devices changes, so routing only reads the person state.
+        
         Args:
             user_id (str): User ID or tag
             severity (str): Notification severity
+            context (RoutingContext): Snapshot shared with the rest of the routing
+                decision (optional; a fresh one is used if omitted)
             
         Returns:
             dict: Primary and secondary notification targets
         """
-        # Get user presence information
-        presence_info = self.get_user_presence(user_id)
+        if context is None:
+            context = self.create_context()
         
-        # Determine priority
+        username = _username(user_id)
         priority = self.get_notification_priority(severity)
         
+        # High priority targets do not depend on presence
+        presence = None if priority == "high" else self._get_presence(username, context)
+        
+        with self._lock:
+            entry = self._targets.get(username, {}).get(priority)
+            if entry is not None:
+                if entry[0] == presence:
+                    self.target_hits += 1
+                else:
+                    # Presence changed without a notification
+                    self._generation += 1
+            generation = self._generation
+        
+        if entry is not None and entry[0] == presence:
+            targets = entry[1]
+        else:
+            targets = self._build_targets(username, priority, presence, context)
+            with self._lock:
+                self.target_builds += 1
+                # Skip storing if the user's devices changed while building
+                if self._generation == generation:
+                    entries = dict(self._targets.get(username, {}))
+                    entries[priority] = (presence, targets)
+                    self._targets.put(username, entries)
+            
+            logger.info(
+                f"Selected notification targets for user {username} (priority: {priority}): "
+                f"primary={targets['primary']}, secondary={targets['secondary']}"
+            )
+        
+        return {"primary": list(targets["primary"]), "secondary": list(targets["secondary"])}
+    
+    @property
+    def presence_version(self):
+        """Counter that grows whenever a user's presence or device tags are seen to change."""
+        return self._generation
+    
+    def _get_presence(self, username, context):
+        """Get "home", "away" or "unknown" for a user from the snapshot."""
+        person_entity = context.get_state(f"person.{username}")
+        if not person_entity:
+            return "unknown"
+        return "home" if person_entity.get("state") == "home" else "away"
+    
+    def _build_targets(self, username, priority, presence, context):
+        """Select primary and secondary targets for a user, priority and presence.
+        
+        Args:
+            username (str): Username
+            priority (str): Notification priority
+            presence (str): User presence ("home", "away" or "unknown")
+            context (RoutingContext): Snapshot to resolve device expressions with
+            
+        Returns:
+            dict: Primary and secondary notification targets
+        """
         # Default targets
         targets = {
             "primary": [],
             "secondary": []
         }
         
-        # Extract username from tag if provided in tag format
-        username = user_id
-        if ':' in user_id:
-            _, username = user_id.split(':', 1)
-        
         # High priority notifications go to all devices
         if priority == "high":
             # Get all user devices
             device_expression = f"user:{username}+device:*"
-            all_devices = self.ha_client.get_entities_by_tag_expression(device_expression)
+            all_devices = context.resolve(device_expression)
             
             # Mobile devices for primary
             mobile_expression = f"user:{username}+device:mobile"
-            mobile_devices = self.ha_client.get_entities_by_tag_expression(mobile_expression)
+            mobile_devices = context.resolve(mobile_expression)
             
-            targets["primary"] = mobile_devices
+            targets["primary"] = list(mobile_devices)
             
             # Other devices for secondary
             other_devices = [d for d in all_devices if d not in mobile_devices]
@@ -193,30 +479,30 @@ class ContextResolver:
             
         # Normal priority based on location
         elif priority == "normal":
-            if presence_info["presence"] == "home":
+            if presence == "home":
                 # User is home, prefer home devices
                 home_expression = f"user:{username}+device:*+area:home"
-                home_devices = self.ha_client.get_entities_by_tag_expression(home_expression)
+                home_devices = context.resolve(home_expression)
                 
                 # Use most recently active device
                 targets["primary"] = home_devices[:1] if home_devices else []
                 
                 # Mobile as backup
                 mobile_expression = f"user:{username}+device:mobile"
-                mobile_devices = self.ha_client.get_entities_by_tag_expression(mobile_expression)
-                targets["secondary"] = mobile_devices
+                mobile_devices = context.resolve(mobile_expression)
+                targets["secondary"] = list(mobile_devices)
             else:
                 # User is away, use mobile devices
                 mobile_expression = f"user:{username}+device:mobile"
-                mobile_devices = self.ha_client.get_entities_by_tag_expression(mobile_expression)
-                targets["primary"] = mobile_devices
+                mobile_devices = context.resolve(mobile_expression)
+                targets["primary"] = list(mobile_devices)
         
         # Low priority notifications are more selective
         else:  # priority == "low"
-            if presence_info["presence"] == "home":
+            if presence == "home":
                 # User is home, use home devices only
                 home_expression = f"user:{username}+device:*+area:home"
-                home_devices = self.ha_client.get_entities_by_tag_expression(home_expression)
+                home_devices = context.resolve(home_expression)
                 
                 # Use most recently active non-mobile device
                 for device in home_devices:
@@ -230,42 +516,99 @@ class ContextResolver:
             else:
                 # User is away, only notify on mobile if recent activity
                 mobile_expression = f"user:{username}+device:mobile"
-                mobile_devices = self.ha_client.get_entities_by_tag_expression(mobile_expression)
+                mobile_devices = context.resolve(mobile_expression)
                 
                 # Check if any device was active recently (would need device state processing)
                 # For now, just add first mobile device if available
                 if mobile_devices:
                     targets["primary"] = [mobile_devices[0]]
         
-        # Log the decision
-        logger.info(
-            f"Selected notification targets for user {username} (priority: {priority}): "
-            f"primary={targets['primary']}, secondary={targets['secondary']}"
-        )
-        
         return targets
+    
+    def on_presence_changed(self, entity_id, new_state=None):
+        """Drop a user's target table entries when their person entity changes.
+        
+        Args:
+            entity_id (str): ID of the entity whose state changed
+            new_state (dict): New entity state (optional)
+        """
+        if entity_id.startswith("person."):
+            self.invalidate_user(entity_id.split(".", 1)[1])
+    
+    def on_entity_tags_changed(self, entity_id, old_tags, new_tags):
+        """Drop the target table entries of users owning a retagged device.
+        
+        Args:
+            entity_id (str): ID of the entity whose tags changed
+            old_tags (frozenset): Tags before the change (None for a new entity)
+            new_tags (frozenset): Tags after the change
+        """
+        tags = set(old_tags or ()) | set(new_tags or ())
+        for tag in tags:
+            if tag.startswith("user:"):
+                self.invalidate_user(tag)
+    
+    def invalidate_user(self, user_id):
+        """Drop a user's target table entries.
+        
+        Args:
+            user_id (str): User ID or tag
+        """
+        username = _username(user_id)
+        with self._lock:
+            self._generation += 1
+            self._targets.pop(username)
+        logger.debug(f"Notification targets invalidated for user: {username}")
+    
+    def invalidate_targets(self):
+        """Drop the whole target table."""
+        with self._lock:
+            self._generation += 1
+            self._targets.clear()
+
+
+def _username(user_id):
+    """Extract the username from a user ID or "user:" tag."""
+    if ':' in user_id:
+        _, user_id = user_id.split(':', 1)
+    return user_id
 
 
 # Helper function to create resolution service instance
-def create_resolution_service(ha_client):
+def create_resolution_service(ha_client, tag_index=None, entity_manager=None):
     """Create a new TagResolutionService instance.
     
     Args:
         ha_client (HomeAssistantAPIClient): Home Assistant API client
+        tag_index (TagIndex): Tag index to resolve expressions against (optional)
+        entity_manager (EntityManager): Entity manager whose tag index is used and
+            whose tag writes invalidate affected cached resolutions (optional)
         
     Returns:
         TagResolutionService: New resolution service instance
     """
-    return TagResolutionService(ha_client)
+    if entity_manager is not None and tag_index is None:
+        tag_index = entity_manager.tag_index
+    
+    service = TagResolutionService(ha_client, tag_index)
+    if entity_manager is not None:
+        entity_manager.add_tag_listener(service.on_entity_tags_changed)
+    return service
 
 # Helper function to create context resolver instance
-def create_context_resolver(ha_client):
+def create_context_resolver(ha_client, tag_resolver=None, entity_manager=None):
     """Create a new ContextResolver instance.
     
     Args:
         ha_client (HomeAssistantAPIClient): Home Assistant API client
+        tag_resolver (TagResolutionService): Tag resolution service (optional)
+        entity_manager (EntityManager): Entity manager whose tag writes refresh
+            the affected users' notification targets (optional)
         
     Returns:
         ContextResolver: New context resolver instance
     """
-    return ContextResolver(ha_client)
\ No newline at end of file
+    resolver = ContextResolver(ha_client, tag_resolver)
+    if entity_manager is not None:
+        entity_manager.add_tag_listener(resolver.on_entity_tags_changed)
+    return resolver
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+Delivery Retries
+
+This module schedules retries of failed service calls. Each retry waits for a
+jittered exponential backoff:
+
+    retry_interval * 2 ** (attempt - 1), capped at max_interval
+
+and loses a random share of up to `jitter` of that, so services that failed
+together do not retry in lockstep. `max_retries` bounds the retries of a
+service, as in the routing rule model of the design document.
+
+Pending retries are kept in a hashed timing wheel: an array of slots, each a
+list of the timers due on that tick modulo the wheel size. Scheduling a timer
+appends to one slot (O(1)), and each tick only visits one slot, so tens of
+thousands of pending retries cost no more per insert than a handful. A single
+ticker thread hands due retries to a callback; it does not make any calls
+itself, so retries run on the caller's existing workers.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default retry settings
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_INTERVAL = 5.0
+DEFAULT_MAX_INTERVAL = 300.0
+DEFAULT_JITTER = 0.5
+
+# Default timing wheel resolution and size
+DEFAULT_TICK = 0.1
+DEFAULT_SLOTS = 512
+
+
+class RetryPolicy:
+    """Retry limit and jittered exponential backoff."""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, retry_interval=DEFAULT_RETRY_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, jitter=DEFAULT_JITTER, rng=None):
+        """Initialize the policy.
+
+        Args:
+            max_retries (int): Retries allowed after the first attempt
+            retry_interval (float): Backoff before the first retry in seconds
+            max_interval (float): Upper bound of the backoff in seconds
+            jitter (float): Share of the backoff randomly taken off (0 to 1)
+            rng (random.Random): Random number generator (optional)
+        """
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_interval = max_interval
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a policy from the `retry` configuration section.
+
+        Args:
+            config (dict): max_retries, retry_interval, max_interval and jitter
+
+        Returns:
+            RetryPolicy: Policy, None if retries are disabled
+        """
+        config = config or {}
+        if not config.get("enabled", True) or config.get("max_retries", DEFAULT_MAX_RETRIES) <= 0:
+            return None
+        return cls(
+            max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+            retry_interval=config.get("retry_interval", DEFAULT_RETRY_INTERVAL),
+            max_interval=config.get("max_interval", DEFAULT_MAX_INTERVAL),
+            jitter=config.get("jitter", DEFAULT_JITTER)
+        )
+
+    def should_retry(self, attempts):
+        """Check whether another attempt is allowed.
+
+        Args:
+            attempts (int): Attempts made so far
+
+        Returns:
+            bool: True if the service may be retried
+        """
+        return attempts <= self.max_retries
+
+    def delay(self, attempts):
+        """Get the backoff before the next attempt.
+
+        Args:
+            attempts (int): Attempts made so far
+
+        Returns:
+            float: Seconds to wait
+        """
+        backoff = min(self.max_interval, self.retry_interval * 2 ** max(attempts - 1, 0))
+        return backoff * (1 - self.jitter * self._rng.random())
+
+
+class TimingWheel:
+    """Hashed timing wheel; not thread-safe on its own."""
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, clock=time.monotonic):
+        """Initialize an empty wheel.
+
+        Args:
+            tick (float): Seconds per slot
+            slots (int): Number of slots
+            clock (callable): Monotonic clock in seconds
+        """
+        if tick <= 0 or slots <= 0:
+            raise ValueError("Timing wheel needs a positive tick and slot count")
+
+        self.tick = tick
+        self.slots = slots
+        self._clock = clock
+        self._wheel = [[] for _ in range(slots)]
+        self._origin = clock()
+        self._ticks = 0
+        self._count = 0
+
+    def __len__(self):
+        """Number of scheduled timers."""
+        return self._count
+
+    def _current_tick(self, now):
+        """Get the number of whole ticks elapsed since the wheel started."""
+        return int((now - self._origin) / self.tick)
+
+    def schedule(self, delay, item):
+        """Schedule an item to become due after a delay.
+
+        Args:
+            delay (float): Seconds from now; rounded up to whole ticks
+            item: Item returned by advance() once due
+        """
+        now = self._clock()
+        if not self._count:
+            # Nothing to expire on the way; skip the idle ticks
+            self._ticks = max(self._ticks, self._current_tick(now))
+        due = math.ceil((now + max(delay, 0.0) - self._origin) / self.tick)
+        offset = max(1, due - self._ticks)
+        self._wheel[(self._ticks + offset) % self.slots].append([(offset - 1) // self.slots, item])
+        self._count += 1
+
+    def advance(self, now=None):
+        """Move the wheel to the current time.
+
+        Args:
+            now (float): Current clock value (optional)
+
+        Returns:
+            list: Items that became due, in due order
+        """
+        target = self._current_tick(self._clock() if now is None else now)
+        due = []
+        while self._ticks < target:
+            if not self._count:
+                self._ticks = target
+                break
+            self._ticks += 1
+            slot = self._wheel[self._ticks % self.slots]
+            if not slot:
+                continue
+            waiting = []
+            for timer in slot:
+                if timer[0]:
+                    timer[0] -= 1
+                    waiting.append(timer)
+                else:
+                    due.append(timer[1])
+            self._count -= len(slot) - len(waiting)
+            self._wheel[self._ticks % self.slots] = waiting
+        return due
+
+
+class RetryScheduler:
+    """Timing wheel driven by one ticker thread."""
+
+    def __init__(self, callback, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        """Initialize the scheduler; the ticker starts with the first retry.
+
+        Args:
+            callback (callable): Called with each item when it is due
+            tick (float): Seconds per wheel slot
+            slots (int): Number of wheel slots
+        """
+        self._callback = callback
+        self._wheel = TimingWheel(tick, slots)
+        self._lock = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.scheduled = 0
+        self.fired = 0
+
+    def schedule(self, delay, item):
+        """Schedule an item to be handed to the callback after a delay.
+
+        Args:
+            delay (float): Seconds from now
+            item: Item passed to the callback
+        """
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("Retry scheduler is stopped")
+            self._wheel.schedule(delay, item)
+            self.scheduled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="delivery-retries", daemon=True)
+                self._thread.start()
+            self._lock.notify()
+
+    def pending(self):
+        """Get the number of scheduled items not yet due.
+
+        Returns:
+            int: Pending items
+        """
+        with self._lock:
+            return len(self._wheel)
+
+    def stats(self):
+        """Get scheduler statistics.
+
+        Returns:
+            dict: Pending, scheduled and fired counts
+        """
+        with self._lock:
+            return {"pending": len(self._wheel), "scheduled": self.scheduled, "fired": self.fired}
+
+    def stop(self):
+        """Stop the ticker; items not yet due are dropped.
+
+        Returns:
+            int: Number of dropped items
+        """
+        with self._lock:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._lock.notify()
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            dropped = len(self._wheel)
+            self._wheel = TimingWheel(self._wheel.tick, self._wheel.slots)
+        return dropped
+
+    def _run(self):
+        """Ticker loop handing due items to the callback."""
+        while True:
+            with self._lock:
+                while not len(self._wheel) and not self._stopped:
+                    self._lock.wait()
+                if self._stopped:
+                    return
+                self._lock.wait(self._wheel.tick)
+                if self._stopped:
+                    return
+                due = self._wheel.advance()
+                self.fired += len(due)
+
+            for item in due:
+                try:
+                    self._callback(item)
+                except Exception:
+                    logger.exception("Error handing a due retry over")
+
+
+# Helper function to create retry scheduler instance
+def create_retry_scheduler(callback, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+    """Create a new RetryScheduler instance.
+
+    Args:
+        callback (callable): Called with each item when it is due
+        tick (float): Seconds per wheel slot
+        slots (int): Number of wheel slots
+
+    Returns:
+        RetryScheduler: New retry scheduler instance
+    """
+    return RetryScheduler(callback, tick, slots)
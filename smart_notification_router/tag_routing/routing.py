@@ -6,11 +6,25 @@ using tag expressions to determine notification targets based on context.
 """
 
 import logging
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from .cache import LRUCache
+from .service_map import ServiceMappingTable, notify_service_names
+from .severity import compile_routing_table
 
 logger = logging.getLogger(__name__)
 
+# Defaults for resolving the targets of several users concurrently
+DEFAULT_RESOLUTION_WORKERS = 8
+DEFAULT_RESOLUTION_DEADLINE = 5.0
+
+# Defaults for the routing plan cache
+DEFAULT_PLAN_CACHE_SIZE = 256
+DEFAULT_PLAN_CACHE_TTL = 60
+
 class RoutingEngine:
     """Engine for routing notifications based on tag expressions."""
     
@@ -29,6 +43,17 @@ class RoutingEngine:
         self.config = config
         self.notification_history = []
         self.max_history = 100
+        self.config_version = 0
+        self.routing_table = compile_routing_table(config)
+        # Entity ID -> notification service, built by refresh_service_map()
+        self.service_map = ServiceMappingTable(config.get("entity_service_mappings", {}))
+        # (target, severity) -> (versions, result) of earlier routing decisions
+        self._plans = LRUCache(
+            maxsize=config.get("routing_cache_size", DEFAULT_PLAN_CACHE_SIZE),
+            ttl=config.get("routing_cache_ttl", DEFAULT_PLAN_CACHE_TTL)
+        )
+        self._executor = None
+        self._executor_lock = threading.Lock()
     
     def route_notification(self, notification, target_expression):
         """Route a notification based on target expression and context.
@@ -62,19 +87,94 @@ class RoutingEngine:
         tracking_id = str(uuid.uuid4())
         self._track_notification(tracking_id, notification, target_expression)
         
-        # Check if traditional audience or tag expression
-        if target_expression in self.config.get("audiences", {}):
-            logger.info(f"Routing by traditional audience: {target_expression}")
-            result = self._route_by_audience(notification, target_expression)
+        # Reuse the decision for this target and severity while its inputs are
+        # unchanged, including the person states of the users it covers
+        key = (target_expression, notification.get("severity", "normal"))
+        versions = self._plan_versions(target_expression)
+        cached = self._plans.get(key) if versions is not None else None
+        context = self.context_resolver.create_context() if self.context_resolver is not None else None
+        
+        if cached is not None and cached[0] == versions and \
+                cached[1] == self._presence_fingerprint(cached[2].get("users", ()), context):
+            logger.debug(f"Routing plan cache hit: {target_expression}")
+            result = dict(cached[2], services=list(cached[2]["services"]), cached=True)
+            if "state_requests" in result:
+                result["state_requests"] = context.state_requests
         else:
-            logger.info(f"Routing by tag expression: {target_expression}")
-            result = self._route_by_tag_expression(notification, target_expression)
+            # Check if traditional audience or tag expression
+            if target_expression in self.routing_table:
+                logger.info(f"Routing by traditional audience: {target_expression}")
+                result = self._route_by_audience(notification, target_expression)
+            else:
+                logger.info(f"Routing by tag expression: {target_expression}")
+                result = self._route_by_tag_expression(notification, target_expression, context)
+            
+            # Incomplete decisions are not reused
+            if versions is not None and not result.get("timed_out_users"):
+                presence = self._presence_fingerprint(result.get("users", ()), context)
+                self._plans.put(key, (versions, presence, dict(result, services=list(result["services"]))))
         
         # Add tracking ID to result
         result["tracking_id"] = tracking_id
         
         return result
     
+    def _plan_versions(self, target_expression):
+        """Get the versions of the data a routing decision for a target depends on.
+        
+        Args:
+            target_expression (str): Target tag expression or audience
+            
+        Returns:
+            tuple: Versions to store with the decision, or None if the decision
+                cannot be cached because the tag data is not versioned
+        """
+        if target_expression in self.routing_table:
+            return (self.config_version,)
+        
+        tag_version = getattr(self.tag_resolver, "version", None)
+        if tag_version is None:
+            return None
+        # Presence is checked separately, against the person states of the plan's users
+        return (tag_version, self.config_version, self.service_map.version)
+    
+    def _presence_fingerprint(self, users, context):
+        """Get the person states of the users a routing decision covers.
+        
+        Args:
+            users (iterable): Usernames
+            context (RoutingContext): Snapshot to read the states from; all
+                person states are fetched in one request
+            
+        Returns:
+            tuple: Person state of each user (None if unknown)
+        """
+        person_ids = [f"person.{user_id}" for user_id in users]
+        if not person_ids:
+            return ()
+        context.prefetch_states(person_ids)
+        return tuple((context.get_state(person_id) or {}).get("state") for person_id in person_ids)
+    
+    def update_config(self, config):
+        """Replace the router configuration.
+        
+        Args:
+            config (dict): New router configuration
+        """
+        self.config = config
+        self.config_version += 1
+        self.routing_table = compile_routing_table(config)
+        self.service_map.set_entity_mappings(config.get("entity_service_mappings", {}))
+        self._plans.clear()
+    
+    def get_plan_cache_stats(self):
+        """Get routing plan cache statistics.
+        
+        Returns:
+            dict: Routing plan cache statistics
+        """
+        return self._plans.stats()
+    
     def _route_by_audience(self, notification, audience):
         """Route notification using a traditional audience.
         
@@ -85,10 +185,7 @@ class RoutingEngine:
         Returns:
             dict: Routing result with selected services
         """
-        # Get audience configuration
-        audience_config = self.config.get("audiences", {}).get(audience, {})
-        
-        if not audience_config:
+        if audience not in self.routing_table:
             logger.error(f"Audience not found: {audience}")
             return {
                 "success": False,
@@ -96,15 +193,15 @@ class RoutingEngine:
                 "services": []
             }
         
-        # Check severity threshold
         severity = notification.get("severity", "normal").lower()
-        min_severity = audience_config.get("min_severity", "normal").lower()
         
-        severity_levels = ["low", "normal", "high", "critical"]
-        severity_index = severity_levels.index(severity) if severity in severity_levels else 1
-        min_severity_index = severity_levels.index(min_severity) if min_severity in severity_levels else 1
+        # Services were compiled per severity; none below the threshold
+        services = list(self.routing_table.services(audience, severity))
+        min_severity = self.routing_table.min_severity(audience)
+        severity_rank = self.routing_table.severity.rank(severity)
+        min_severity_rank = self.routing_table.severity.rank(min_severity)
         
-        if severity_index < min_severity_index:
+        if severity_rank is None or min_severity_rank is None or severity_rank < min_severity_rank:
             logger.info(f"Notification severity {severity} below threshold {min_severity} for audience {audience}")
             return {
                 "success": False,
@@ -112,9 +209,6 @@ class RoutingEngine:
                 "services": []
             }
         
-        # Get services for audience
-        services = audience_config.get("services", [])
-        
         return {
             "success": True,
             "services": services,
@@ -122,18 +216,24 @@ class RoutingEngine:
             "severity": severity
         }
     
-    def _route_by_tag_expression(self, notification, expression):
+    def _route_by_tag_expression(self, notification, expression, context=None):
         """Route notification using a tag expression.
         
         Args:
             notification (dict): Notification data
             expression (str): Tag expression
+            context (RoutingContext): Snapshot to route with (optional)
             
         Returns:
             dict: Routing result with selected services
         """
+        # One snapshot of Home Assistant data serves the whole routing decision
+        started = time.monotonic()
+        if context is None:
+            context = self.context_resolver.create_context()
+        
         # Resolve tag expression to entities
-        entities = self.tag_resolver.resolve_expression(expression)
+        entities = context.resolve(expression)
         
         if not entities:
             logger.warning(f"No entities found for expression: {expression}")
@@ -148,10 +248,11 @@ class RoutingEngine:
         services = []
         
         # Group entities by user
+        context.prefetch_states(entities)
         users = {}
         for entity_id in entities:
             # Extract user from entity tags
-            entity_state = self.ha_client.get_entity_state(entity_id)
+            entity_state = context.get_state(entity_id)
             if not entity_state:
                 continue
                 
@@ -162,24 +263,29 @@ class RoutingEngine:
                 user_id = user_tag.split(":", 1)[1]
                 users.setdefault(user_id, []).append(entity_id)
         
-        # Process each user
-        for user_id, user_entities in users.items():
-            # Get best notification targets based on context
-            targets = self.context_resolver.get_best_notification_targets(user_id, severity)
+        # Load every user's person and device states together
+        if users:
+            self.context_resolver.prefetch_users(users, context)
+        
+        # Resolve every user's targets concurrently
+        deadline = started + self.config.get("resolution_deadline", DEFAULT_RESOLUTION_DEADLINE)
+        user_services, timed_out = self._resolve_user_services(users, severity, context, deadline)
+        
+        # Merge in user order, as if the users had been processed one at a time
+        for user_id in users:
+            if user_id not in user_services:
+                continue
+            primary, secondary = user_services[user_id]
             
             # Add services to the list
-            if targets.get("primary"):
-                for entity_id in targets["primary"]:
-                    # Convert entity to service name
-                    service = self._entity_to_service(entity_id)
-                    if service and service not in services:
-                        services.append(service)
+            for service in primary:
+                if service not in services:
+                    services.append(service)
             
             # Add secondary targets if needed
-            if len(services) == 0 and targets.get("secondary"):
-                for entity_id in targets["secondary"]:
-                    service = self._entity_to_service(entity_id)
-                    if service and service not in services:
+            if len(services) == 0:
+                for service in secondary:
+                    if service not in services:
                         services.append(service)
         
         # If no services selected, try to use default services
@@ -191,60 +297,152 @@ class RoutingEngine:
             "success": len(services) > 0,
             "services": services,
             "entities": entities,
+            "users": list(users),
             "expression": expression,
             "severity": severity,
+            "state_requests": context.state_requests,
+            "timed_out_users": timed_out,
             "error": "No services found" if not services else None
         }
     
-    def _entity_to_service(self, entity_id):
+    def _resolve_user_services(self, user_ids, severity, context, deadline):
+        """Resolve the services of several users concurrently.
+        
+        Args:
+            user_ids (list): Usernames
+            severity (str): Notification severity
+            context (RoutingContext): Snapshot shared by all users
+            deadline (float): time.monotonic() value after which slow users are skipped
+            
+        Returns:
+            tuple: Dict of username to (primary services, secondary services) and
+                the list of users skipped because they missed the deadline
+        """
+        user_ids = list(user_ids)
+        if len(user_ids) <= 1:
+            return {user_id: self._user_services(user_id, severity, context)
+                    for user_id in user_ids}, []
+        
+        executor = self._get_executor()
+        futures = {user_id: executor.submit(self._user_services, user_id, severity, context)
+                   for user_id in user_ids}
+        wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        
+        results = {}
+        timed_out = []
+        for user_id, future in futures.items():
+            if not future.done():
+                future.cancel()
+                timed_out.append(user_id)
+                continue
+            try:
+                results[user_id] = future.result()
+            except Exception as e:
+                logger.error(f"Error resolving notification targets for user {user_id}: {str(e)}")
+        
+        if timed_out:
+            logger.warning(f"Notification target resolution timed out for users: {timed_out}")
+        
+        return results, timed_out
+    
+    def _user_services(self, user_id, severity, context):
+        """Select the primary and secondary services of one user.
+        
+        Args:
+            user_id (str): Username
+            severity (str): Notification severity
+            context (RoutingContext): Snapshot shared with the rest of the routing decision
+            
+        Returns:
+            tuple: Lists of primary and secondary service names
+        """
+        # Get best notification targets based on context
+        targets = self.context_resolver.get_best_notification_targets(user_id, severity, context)
+        
+        # Convert entities to service names
+        primary = [service for service in (self._entity_to_service(entity_id, context)
+                                           for entity_id in targets.get("primary", [])) if service]
+        secondary = [service for service in (self._entity_to_service(entity_id, context)
+                                             for entity_id in targets.get("secondary", [])) if service]
+        return primary, secondary
+    
+    def _get_executor(self):
+        """Get the bounded thread pool used for per-user resolution."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.get("resolution_workers", DEFAULT_RESOLUTION_WORKERS),
+                    thread_name_prefix="routing"
+                )
+            return self._executor
+    
+    def shutdown(self):
+        """Stop the per-user resolution thread pool."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+    
+    def _entity_to_service(self, entity_id, context=None):
         """Convert an entity ID to a notification service name.
         
+        Known entities are looked up in the service mapping table; an entity
+        seen for the first time is mapped from its state and added to it.
+        
         Args:
             entity_id (str): Entity ID
+            context (RoutingContext): Snapshot to read the entity state from (optional)
             
         Returns:
             str: Service name or None
         """
-        # Map entity types to services based on configuration
-        entity_mappings = self.config.get("entity_service_mappings", {})
-        
-        # Check for direct entity mapping
-        if entity_id in entity_mappings:
-            return entity_mappings[entity_id]
-        
-        # Check for entity type mapping
-        entity_type = entity_id.split(".")[0] if "." in entity_id else ""
-        if entity_type in entity_mappings:
-            return entity_mappings[entity_type]
-        
-        # Default mappings
-        if entity_id.startswith("mobile_app."):
-            device_name = entity_id.split(".", 1)[1]
-            return f"mobile_app_{device_name}"
-        elif entity_id.startswith("notify."):
-            return entity_id.split(".", 1)[1]
-        
-        # Entity specific logic
-        if "mobile" in entity_id.lower():
-            # Try to extract device name
-            parts = entity_id.split(".")
-            if len(parts) > 1:
-                device_name = parts[1].replace("_", "")
-                return f"mobile_app_{device_name}"
+        if entity_id in self.service_map:
+            return self.service_map.get(entity_id)
         
         # Check entity state for mobile app data
-        entity_state = self.ha_client.get_entity_state(entity_id)
-        if entity_state:
-            attributes = entity_state.get("attributes", {})
-            source = attributes.get("source_type")
-            
-            if source == "mobile_app":
-                device_name = attributes.get("friendly_name", "").replace(" ", "").lower()
-                if device_name:
-                    return f"mobile_app_{device_name}"
+        if context is not None:
+            entity_state = context.get_state(entity_id)
+        else:
+            entity_state = self.ha_client.get_entity_state(entity_id)
+        return self.service_map.update_entity(entity_id, entity_state)
+    
+    def refresh_service_map(self):
+        """Rebuild the service mapping table from all entity states and notify services.
+        
+        The table is kept as it is if the states cannot be fetched.
+        """
+        states = self.ha_client.get_entity_states()
+        if states is None:
+            logger.warning("Entity states unavailable, service mapping table not rebuilt")
+            return
+        services = self.ha_client.get_services()
+        notify_services = notify_service_names(services) if services is not None else None
+        self.service_map.rebuild(states, notify_services)
+    
+    def on_entity_state_changed(self, entity_id, new_state):
+        """Update the service mapping of an entity whose state changed.
+        
+        Args:
+            entity_id (str): Entity ID
+            new_state (dict): New entity state (None if the entity was removed)
+        """
+        if new_state is None:
+            self.service_map.remove_entity(entity_id)
+        else:
+            self.service_map.update_entity(entity_id, new_state)
+    
+    def on_services_changed(self, services=None):
+        """Update the service mapping table after notify services were added or removed.
         
-        logger.warning(f"Could not map entity {entity_id} to a notification service")
-        return None
+        Args:
+            services (list): Service domains as returned by the services API
+                (optional; fetched from Home Assistant if omitted)
+        """
+        if services is None:
+            services = self.ha_client.get_services()
+            if services is None:
+                return
+        self.service_map.update_services(notify_service_names(services))
     
     def _validate_notification(self, notification):
         """Validate notification data.
@@ -261,14 +459,11 @@ class RoutingEngine:
             if field not in notification:
                 return False
         
-        # Check severity if provided
-        if "severity" in notification:
-            severity = notification["severity"].lower()
-            valid_severities = ["low", "normal", "high", "critical", "info"]
-            if severity not in valid_severities:
-                notification["severity"] = "normal"
-        else:
-            notification["severity"] = "normal"
+        # Replace a missing or unknown severity with "normal", or with the least
+        # severe level if the configured levels have nothing "normal" maps to
+        severity = self.routing_table.severity
+        if severity.rank(notification.get("severity")) is None:
+            notification["severity"] = "normal" if severity.rank("normal") is not None else severity.levels[0]
         
         return True
     
@@ -0,0 +1,280 @@
+"""
+Entity to Service Mapping Table
+
+This module keeps the notification service of every known entity in a table,
+so routing maps an entity to its service with one dictionary lookup instead of
+running the mapping rules, string heuristics and state lookups each time.
+
+Entries are computed from the configured entity_service_mappings, the entity
+state attributes (source_type and friendly_name) and the discovered notify
+services. They are updated one entity at a time when an entity's state
+changes; entities no rule maps are recorded as unmappable rather than being
+retried on every notification.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def notify_service_names(services):
+    """Extract notify service names from a Home Assistant service listing.
+
+    Args:
+        services (list): Service domains as returned by the services API
+
+    Returns:
+        frozenset: Names of the services in the notify domain
+    """
+    names = set()
+    for domain in services or []:
+        if domain.get("domain") == "notify":
+            names.update(domain.get("services", {}))
+    return frozenset(names)
+
+
+def map_entity(entity_id, entity_mappings, attributes=None, notify_services=frozenset()):
+    """Map an entity to a notification service name.
+
+    Args:
+        entity_id (str): Entity ID
+        entity_mappings (dict): Configured entity or domain to service mappings
+        attributes (dict): Entity state attributes (optional)
+        notify_services (frozenset): Discovered notify service names
+
+    Returns:
+        tuple: Service name (None if unmappable) and whether it was found only
+            through the discovered notify services
+    """
+    # Check for direct entity mapping
+    if entity_id in entity_mappings:
+        return entity_mappings[entity_id], False
+
+    # Check for entity type mapping
+    entity_type = entity_id.split(".")[0] if "." in entity_id else ""
+    if entity_type in entity_mappings:
+        return entity_mappings[entity_type], False
+
+    # Default mappings
+    if entity_id.startswith("mobile_app."):
+        device_name = entity_id.split(".", 1)[1]
+        return f"mobile_app_{device_name}", False
+    elif entity_id.startswith("notify."):
+        return entity_id.split(".", 1)[1], False
+
+    # Entity specific logic
+    if "mobile" in entity_id.lower():
+        # Try to extract device name
+        parts = entity_id.split(".")
+        if len(parts) > 1:
+            device_name = parts[1].replace("_", "")
+            return f"mobile_app_{device_name}", False
+
+    # Check entity state for mobile app data
+    if attributes:
+        if attributes.get("source_type") == "mobile_app":
+            device_name = (attributes.get("friendly_name") or "").replace(" ", "").lower()
+            if device_name:
+                return f"mobile_app_{device_name}", False
+
+    # Fall back to a discovered notify service named after the entity
+    object_id = entity_id.split(".", 1)[-1]
+    for service in (object_id, f"mobile_app_{object_id}"):
+        if service in notify_services:
+            return service, True
+
+    return None, False
+
+
+class ServiceMappingTable:
+    """Thread-safe table of entity IDs to notification service names."""
+
+    def __init__(self, entity_mappings=None):
+        """Initialize an empty table.
+
+        Args:
+            entity_mappings (dict): Configured entity or domain to service mappings
+        """
+        self._entity_mappings = dict(entity_mappings or {})
+        self._notify_services = frozenset()
+        self._services = {}
+        self._unmappable = set()
+        self._discovered = set()
+        self._attributes = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def rebuild(self, states, notify_services=None):
+        """Rebuild the table from the states of all entities.
+
+        Args:
+            states (dict): Entity states keyed by entity ID
+            notify_services (iterable): Discovered notify service names (optional;
+                the current ones are kept if omitted)
+        """
+        with self._lock:
+            if notify_services is not None:
+                self._notify_services = frozenset(notify_services)
+            self._services.clear()
+            self._unmappable.clear()
+            self._discovered.clear()
+            self._attributes = {entity_id: self._mapping_attributes(state)
+                                for entity_id, state in states.items()}
+            for entity_id in self._attributes:
+                self._map(entity_id)
+            self.version += 1
+
+        logger.info(f"Mapped {len(self._services)} entities to notification services, "
+                    f"{len(self._unmappable)} unmappable")
+
+    def update_entity(self, entity_id, state):
+        """Add an entity or update it after its state changed.
+
+        Args:
+            entity_id (str): Entity ID
+            state (dict): Entity state with attributes (None if unknown)
+
+        Returns:
+            str: Service name of the entity, None if unmappable
+        """
+        with self._lock:
+            attributes = self._mapping_attributes(state)
+            known = entity_id in self._attributes
+            previous = self._services.get(entity_id)
+            if known and self._attributes[entity_id] == attributes:
+                return previous
+
+            self._attributes[entity_id] = attributes
+            service = self._map(entity_id)
+            # A new entity maps the same way it did before it was recorded
+            if known and service != previous:
+                self.version += 1
+            return service
+
+    def remove_entity(self, entity_id):
+        """Remove an entity from the table.
+
+        Args:
+            entity_id (str): Entity ID
+        """
+        with self._lock:
+            if entity_id not in self._attributes:
+                return
+            del self._attributes[entity_id]
+            self._services.pop(entity_id, None)
+            self._unmappable.discard(entity_id)
+            self._discovered.discard(entity_id)
+            self.version += 1
+
+    def update_services(self, notify_services):
+        """Replace the discovered notify services.
+
+        Only unmappable entities and entities mapped through a discovered
+        service are re-checked.
+
+        Args:
+            notify_services (iterable): Discovered notify service names
+        """
+        notify_services = frozenset(notify_services)
+        with self._lock:
+            if notify_services == self._notify_services:
+                return
+            self._notify_services = notify_services
+            for entity_id in self._unmappable | self._discovered:
+                self._map(entity_id)
+            self.version += 1
+
+    def set_entity_mappings(self, entity_mappings):
+        """Replace the configured mappings and remap every entity.
+
+        Args:
+            entity_mappings (dict): Configured entity or domain to service mappings
+        """
+        with self._lock:
+            entity_mappings = dict(entity_mappings or {})
+            if entity_mappings == self._entity_mappings:
+                return
+            self._entity_mappings = entity_mappings
+            for entity_id in self._attributes:
+                self._map(entity_id)
+            self.version += 1
+
+    def get(self, entity_id):
+        """Get the service of a known entity.
+
+        Args:
+            entity_id (str): Entity ID
+
+        Returns:
+            str: Service name, None if the entity is unmappable or unknown
+        """
+        return self._services.get(entity_id)
+
+    def get_unmappable(self):
+        """Get the entities no rule maps to a service.
+
+        Returns:
+            set: Entity IDs
+        """
+        with self._lock:
+            return set(self._unmappable)
+
+    def stats(self):
+        """Get mapping table statistics.
+
+        Returns:
+            dict: Entity, mapped and unmappable counts and the table version
+        """
+        with self._lock:
+            return {
+                "entities": len(self._attributes),
+                "mapped": len(self._services),
+                "unmappable": len(self._unmappable),
+                "version": self.version
+            }
+
+    def _map(self, entity_id):
+        """Compute and store the service of an entity (caller must hold the lock)."""
+        service, discovered = map_entity(entity_id, self._entity_mappings,
+                                         self._attributes.get(entity_id), self._notify_services)
+        if service:
+            self._services[entity_id] = service
+            self._unmappable.discard(entity_id)
+        else:
+            self._services.pop(entity_id, None)
+            if entity_id not in self._unmappable:
+                logger.warning(f"Could not map entity {entity_id} to a notification service")
+            self._unmappable.add(entity_id)
+        if discovered:
+            self._discovered.add(entity_id)
+        else:
+            self._discovered.discard(entity_id)
+        return service
+
+    @staticmethod
+    def _mapping_attributes(state):
+        """Keep only the state attributes the mapping rules read."""
+        attributes = (state or {}).get("attributes") or {}
+        return {key: attributes[key] for key in ("source_type", "friendly_name") if key in attributes}
+
+    def __contains__(self, entity_id):
+        with self._lock:
+            return entity_id in self._attributes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._attributes)
+
+
+# Helper function to create service mapping table instance
+def create_service_mapping_table(entity_mappings=None):
+    """Create a new ServiceMappingTable instance.
+
+    Args:
+        entity_mappings (dict): Configured entity or domain to service mappings
+
+    Returns:
+        ServiceMappingTable: New service mapping table instance
+    """
+    return ServiceMappingTable(entity_mappings)
@@ -0,0 +1,156 @@
+"""
+Severity Model and Audience Routing Table
+
+This module gives both routers one definition of notification severity. The
+configured severity levels are compiled into integer ranks, with aliases so
+that names used elsewhere (such as "normal" or "critical") map onto the
+configured levels. Audience configuration is compiled into a table from
+(audience, severity rank) to a de-duplicated tuple of services, so routing a
+notification to an audience is an indexed lookup.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEVERITY_LEVELS = ["low", "medium", "high", "emergency"]
+
+# Names accepted for the default levels; configured levels always take precedence
+DEFAULT_SEVERITY_ALIASES = {
+    "info": "low",
+    "normal": "medium",
+    "warning": "medium",
+    "critical": "emergency"
+}
+
+
+class SeverityModel:
+    """Ordered severity levels with integer ranks (higher is more severe)."""
+
+    def __init__(self, levels=None, aliases=None):
+        """Initialize the model.
+
+        Args:
+            levels (list): Severity levels from least to most severe
+            aliases (dict): Alternative names mapped to a level (optional;
+                DEFAULT_SEVERITY_ALIASES for the levels they refer to)
+        """
+        self.levels = tuple(level.strip().lower() for level in (levels or DEFAULT_SEVERITY_LEVELS))
+        if not self.levels:
+            raise ValueError("At least one severity level is required")
+
+        self._ranks = {level: rank for rank, level in enumerate(self.levels)}
+        if aliases is None:
+            aliases = DEFAULT_SEVERITY_ALIASES
+        for alias, level in aliases.items():
+            alias = alias.strip().lower()
+            rank = self._ranks.get(level.strip().lower())
+            if rank is None:
+                continue
+            self._ranks.setdefault(alias, rank)
+
+    def rank(self, severity):
+        """Get the rank of a severity level or alias.
+
+        Args:
+            severity (str): Severity level or alias
+
+        Returns:
+            int: Rank of the level, None if unknown
+        """
+        if not isinstance(severity, str):
+            return None
+        rank = self._ranks.get(severity)
+        if rank is None:
+            rank = self._ranks.get(severity.strip().lower())
+        return rank
+
+    def canonical(self, severity):
+        """Get the configured level a severity level or alias stands for.
+
+        Args:
+            severity (str): Severity level or alias
+
+        Returns:
+            str: Configured severity level, None if unknown
+        """
+        rank = self.rank(severity)
+        return self.levels[rank] if rank is not None else None
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class AudienceRoutingTable:
+    """Lookup table from (audience, severity) to the services to notify."""
+
+    def __init__(self, audiences, severity_model):
+        """Compile the audience configuration.
+
+        Args:
+            audiences (dict): Audience configuration keyed by audience name
+            severity_model (SeverityModel): Severity model to rank severities with
+        """
+        self.severity = severity_model
+        self._min_severity = {}
+        self._services = {}
+
+        for name, audience in (audiences or {}).items():
+            audience = audience or {}
+            min_severity = audience.get("min_severity", "low")
+            min_rank = severity_model.rank(min_severity)
+            if min_rank is None:
+                logger.warning(f"Unknown minimum severity {min_severity} for audience {name}")
+
+            services = tuple(dict.fromkeys(audience.get("services", [])))
+            self._min_severity[name] = min_severity
+            # Services for each severity rank; empty below the threshold
+            self._services[name] = tuple(
+                services if min_rank is not None and rank >= min_rank else ()
+                for rank in range(len(severity_model))
+            )
+
+    def services(self, audience, severity):
+        """Get the services of an audience for a notification severity.
+
+        Args:
+            audience (str): Audience name
+            severity (str): Notification severity level or alias
+
+        Returns:
+            tuple: Services to notify, empty if the audience is unknown or the
+                severity is unknown or below the audience's minimum
+        """
+        by_rank = self._services.get(audience)
+        rank = self.severity.rank(severity)
+        if by_rank is None or rank is None:
+            return ()
+        return by_rank[rank]
+
+    def min_severity(self, audience):
+        """Get the configured minimum severity of an audience.
+
+        Args:
+            audience (str): Audience name
+
+        Returns:
+            str: Minimum severity, None if the audience is unknown
+        """
+        return self._min_severity.get(audience)
+
+    def __contains__(self, audience):
+        return audience in self._services
+
+
+def compile_routing_table(config):
+    """Compile the severity model and audience routing table of a configuration.
+
+    Args:
+        config (dict): Configuration with audiences, severity_levels and
+            optionally severity_aliases
+
+    Returns:
+        AudienceRoutingTable: Compiled routing table
+    """
+    model = SeverityModel(config.get("severity_levels"), config.get("severity_aliases"))
+    return AudienceRoutingTable(config.get("audiences", {}), model)
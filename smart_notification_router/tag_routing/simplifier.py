@@ -0,0 +1,247 @@
+"""
+Tag Expression Simplifier
+
+This module rewrites parse trees into a simplified canonical form before they
+are compiled:
+
+- chains of AND and OR are flattened, de-duplicated and sorted
+- "*" (every entity) is folded: "*+a" becomes "a" and "a|*" becomes "*"
+- chains of NOT are merged: "a-b-c" becomes "a-(b|c)"
+- terms absorbed by another term are dropped: "a|(a+b)" becomes "a" and
+  "device:mobile|device:*" becomes "device:*"
+- provably empty expressions such as "a-a" or "(a+b)-a" become TagEmpty
+
+Equivalent expressions simplify to the same tree, and canonical_string()
+renders that tree as a stable string used as the cache key for compiled plans.
+"""
+
+import logging
+from .parser import OperatorType, TagEmpty, TagLiteral, TagOperator, TagPrefix, WILDCARD_TAG
+
+logger = logging.getLogger(__name__)
+
+# Canonical string of an expression that matches nothing
+EMPTY_CANONICAL = "!"
+
+
+def _is_wildcard(node):
+    return isinstance(node, TagLiteral) and node.tag == WILDCARD_TAG
+
+
+def _implies(term, other):
+    """Check whether a literal or wildcard term implies a different wildcard term."""
+    if not isinstance(other, TagPrefix) or term is other:
+        return False
+    if isinstance(term, TagLiteral):
+        return term.tag != WILDCARD_TAG and term.tag.startswith(other.prefix)
+    if isinstance(term, TagPrefix):
+        return term.prefix != other.prefix and term.prefix.startswith(other.prefix)
+    return False
+
+
+def _operands(node, operator_type):
+    """Get the operands of a node for an n-ary operator (the node itself otherwise)."""
+    if isinstance(node, TagOperator) and node.operator_type == operator_type:
+        operands = []
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if isinstance(current, TagOperator) and current.operator_type == operator_type:
+                pending.append(current.right)
+                pending.append(current.left)
+            else:
+                operands.append(current)
+        return operands
+    return [node]
+
+
+def _build(operator_type, operands):
+    """Build a left-nested chain of one operator from canonically sorted operands."""
+    node = operands[0]
+    for operand in operands[1:]:
+        node = TagOperator(operator_type, node, operand)
+    return node
+
+
+def _unique_sorted(operands):
+    """De-duplicate operands by canonical string and sort them."""
+    unique = {}
+    for operand in operands:
+        unique.setdefault(canonical_string(operand), operand)
+    return [unique[key] for key in sorted(unique)]
+
+
+def simplify(node):
+    """Simplify a parse tree into canonical form.
+
+    Args:
+        node (TagNode): Root node of the parse tree
+
+    Returns:
+        TagNode: Equivalent simplified tree
+    """
+    if isinstance(node, (TagLiteral, TagPrefix, TagEmpty)):
+        return node
+
+    if not isinstance(node, TagOperator):
+        raise ValueError(f"Cannot simplify node: {node}")
+
+    if node.operator_type == OperatorType.AND:
+        return _simplify_and(node)
+    elif node.operator_type == OperatorType.OR:
+        return _simplify_or(node)
+    elif node.operator_type == OperatorType.NOT:
+        return _simplify_not(node)
+
+    raise ValueError(f"Unknown operator type: {node.operator_type}")
+
+
+def _simplify_and(node):
+    operands = []
+    for operand in _operands(node, OperatorType.AND):
+        operand = simplify(operand)
+        if isinstance(operand, TagEmpty):
+            return TagEmpty()
+        if _is_wildcard(operand):
+            continue
+        operands.extend(_operands(operand, OperatorType.AND))
+
+    if not operands:
+        return TagLiteral(WILDCARD_TAG)
+
+    operands = _unique_sorted(operands)
+
+    # "device:mobile+device:*" is just "device:mobile"
+    operands = [operand for operand in operands
+                if not (isinstance(operand, TagPrefix)
+                        and any(_implies(other, operand) for other in operands))]
+    keys = {canonical_string(operand) for operand in operands}
+
+    # "a+(b-a)" can never match: an operand excludes another operand
+    for operand in operands:
+        if isinstance(operand, TagOperator) and operand.operator_type == OperatorType.NOT:
+            excluded = {canonical_string(term) for term in _operands(operand.right, OperatorType.OR)}
+            if excluded & keys:
+                return TagEmpty()
+
+    return _build(OperatorType.AND, operands)
+
+
+def _simplify_or(node):
+    operands = []
+    for operand in _operands(node, OperatorType.OR):
+        operand = simplify(operand)
+        if isinstance(operand, TagEmpty):
+            continue
+        if _is_wildcard(operand):
+            return operand
+        operands.extend(_operands(operand, OperatorType.OR))
+
+    if not operands:
+        return TagEmpty()
+
+    operands = _unique_sorted(operands)
+
+    # "device:mobile|device:*" is just "device:*"
+    prefixes = [operand for operand in operands if isinstance(operand, TagPrefix)]
+    if prefixes:
+        operands = [operand for operand in operands
+                    if not any(_implies(operand, prefix) for prefix in prefixes)]
+    keys = {canonical_string(operand) for operand in operands}
+
+    # Absorption: "a|(a+b)" and "a|(a-b)" are both just "a"
+    kept = []
+    for operand in operands:
+        if isinstance(operand, TagOperator):
+            if operand.operator_type == OperatorType.AND:
+                terms = {canonical_string(term) for term in _operands(operand, OperatorType.AND)}
+            elif operand.operator_type == OperatorType.NOT:
+                terms = {canonical_string(operand.left)}
+            else:
+                terms = set()
+            if terms & (keys - {canonical_string(operand)}):
+                continue
+        kept.append(operand)
+
+    return _build(OperatorType.OR, kept)
+
+
+def _simplify_not(node):
+    # Merge chains: "a-b-c" is "a-(b|c)"
+    excluded = []
+    while isinstance(node, TagOperator) and node.operator_type == OperatorType.NOT:
+        excluded.append(node.right)
+        node = node.left
+
+    left = simplify(node)
+    right = _simplify_or(_build(OperatorType.OR, excluded))
+
+    if isinstance(left, TagOperator) and left.operator_type == OperatorType.NOT:
+        right = _simplify_or(TagOperator(OperatorType.OR, left.right, right))
+        left = left.left
+
+    if isinstance(left, TagEmpty) or _is_wildcard(right):
+        return TagEmpty()
+    if isinstance(right, TagEmpty):
+        return left
+
+    left_operands = _operands(left, OperatorType.AND)
+    right_operands = _operands(right, OperatorType.OR)
+    left_terms = {canonical_string(term) for term in left_operands}
+    right_terms = {canonical_string(term) for term in right_operands}
+
+    # "(a+b)-a", "a-(a|b)" and "a-a" can never match
+    if left_terms & right_terms or canonical_string(left) in right_terms:
+        return TagEmpty()
+
+    # Neither can "device:mobile-device:*"
+    excluded_prefixes = [term for term in right_operands if isinstance(term, TagPrefix)]
+    if any(_implies(term, prefix) for term in left_operands for prefix in excluded_prefixes):
+        return TagEmpty()
+
+    return TagOperator(OperatorType.NOT, left, right)
+
+
+def canonical_string(node):
+    """Render a tree as an expression string.
+
+    For simplified trees the result is canonical: equivalent expressions render
+    identically. Apart from the empty expression, the result parses back into
+    the same tree.
+
+    Args:
+        node (TagNode): Root node of the tree
+
+    Returns:
+        str: Expression string
+    """
+    if isinstance(node, TagLiteral):
+        return node.tag
+    if isinstance(node, TagPrefix):
+        return node.pattern
+    if isinstance(node, TagEmpty):
+        return EMPTY_CANONICAL
+    if not isinstance(node, TagOperator):
+        raise ValueError(f"Cannot render node: {node}")
+
+    operands = _operands(node, node.operator_type)
+
+    if node.operator_type == OperatorType.OR:
+        return "|".join(canonical_string(operand) for operand in operands)
+
+    if node.operator_type == OperatorType.AND:
+        parts = []
+        for operand in operands:
+            text = canonical_string(operand)
+            if isinstance(operand, TagOperator) and operand.operator_type == OperatorType.OR:
+                text = f"({text})"
+            parts.append(text)
+        return "+".join(parts)
+
+    left = canonical_string(node.left)
+    if isinstance(node.left, TagOperator) and node.left.operator_type != OperatorType.NOT:
+        left = f"({left})"
+    right = canonical_string(node.right)
+    if isinstance(node.right, TagOperator):
+        right = f"({right})"
+    return f"{left}-{right}"
@@ -0,0 +1,105 @@
+"""
+Single-Flight Call Coalescing
+
+This module lets concurrent callers asking for the same key share one
+in-flight computation. The first caller for a key runs it; callers arriving
+while it runs wait for it and receive the same result (or exception) instead
+of repeating the work, which keeps bursts of identical notifications from
+fanning out into identical Home Assistant requests.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight computation and the outcome shared with its waiters."""
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-safe coalescing of concurrent calls with the same key.
+
+    Keeps counters of executed and coalesced calls so callers can monitor how
+    much duplicate work is avoided.
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """Run a function once for all concurrent callers with the same key.
+
+        Args:
+            key: Hashable key identifying the computation
+            function (callable): Computation to run
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            Result of the function, shared by every caller that waited on it
+
+        Raises:
+            Exception: Whatever the function raised, re-raised in every caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Get coalescing statistics.
+
+        Returns:
+            dict: In-flight, executed and coalesced call counters
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced
+            }
+
+
+# Helper function to create single-flight instance
+def create_single_flight():
+    """Create a new SingleFlight instance.
+
+    Returns:
+        SingleFlight: New single-flight instance
+    """
+    return SingleFlight()
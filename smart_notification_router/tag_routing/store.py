@@ -0,0 +1,346 @@
+"""
+Durable Delivery Store
+
+This module persists accepted notifications and the delivery state of each of
+their services in SQLite, so notifications accepted for asynchronous delivery
+survive a restart or crash of the add-on.
+
+The database runs in write-ahead-log mode with full synchronous commits. All
+writes go through one writer thread that commits whatever has queued up since
+its previous commit in a single transaction (group commit), so a burst of
+notifications shares one fsync instead of paying one each. Callers that need
+durability, such as an endpoint about to acknowledge a notification, wait for
+the commit containing their write; status updates are written behind. If a
+batch fails, its writes are committed one at a time so only the failing write
+is lost, and a caller waiting for it gets the error.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of writes committed in one transaction
+MAX_BATCH = 1024
+
+# Finished deliveries are pruned down to the retention after this many commits
+PRUNE_INTERVAL = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    tracking_id TEXT PRIMARY KEY,
+    title TEXT,
+    message TEXT,
+    data TEXT,
+    context TEXT,
+    severity TEXT,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS deliveries_open ON deliveries (submitted_at) WHERE completed_at IS NULL;
+CREATE INDEX IF NOT EXISTS deliveries_done ON deliveries (completed_at) WHERE completed_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS delivery_services (
+    tracking_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    service TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER,
+    PRIMARY KEY (tracking_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class DeliveryStore:
+    """SQLite-backed store of delivery records with group commit."""
+
+    def __init__(self, path, retain=1000, commit_delay=0.0):
+        """Open (or create) the store.
+
+        Args:
+            path (str): Database file path; its directory is created if missing
+            retain (int): Number of finished deliveries kept for status lookups
+            commit_delay (float): Seconds the writer waits for more writes before
+                committing a batch (0 commits as soon as the writer is free)
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.retain = retain
+        self.commit_delay = commit_delay
+        self._writer = self._connect()
+        self._writer.executescript(_SCHEMA)
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._writes = queue.Queue()
+        self._closed = False
+        self.commits = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="delivery-store", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Delivery store opened at {path}")
+
+    def _connect(self):
+        """Open a connection in WAL mode with durable commits."""
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def add(self, record, wait=True):
+        """Store a newly accepted delivery.
+
+        Args:
+            record (DeliveryRecord): Delivery record
+            wait (bool): Block until the record is committed to disk
+
+        Raises:
+            sqlite3.Error: If waiting and the record could not be stored
+        """
+        payload = record.payload
+        row = (record.tracking_id, payload.title, payload.message,
+               json.dumps(payload.data) if payload.data is not None else None,
+               json.dumps(record.context), record.severity, record.status, record.submitted_at)
+        services = [(record.tracking_id, position, service, result["status"], result.get("error"),
+                     result.get("attempts"))
+                    for position, (service, result) in enumerate(record.services.items())]
+        self._write(("add", row, services), wait)
+
+    def update(self, record, wait=False):
+        """Store the delivery state of a record.
+
+        Args:
+            record (DeliveryRecord): Delivery record
+            wait (bool): Block until the update is committed to disk
+        """
+        services = [(result["status"], result.get("error"), result.get("attempts"), record.tracking_id, position)
+                    for position, result in enumerate(record.services.values())]
+        self._write(("update", (record.status, record.completed_at, record.tracking_id), services), wait)
+
+    def get(self, tracking_id):
+        """Get a stored delivery.
+
+        Args:
+            tracking_id (str): Tracking ID
+
+        Returns:
+            dict: Delivery status in DeliveryRecord.to_dict() form, None if unknown
+        """
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT status, severity, submitted_at, completed_at FROM deliveries WHERE tracking_id = ?",
+                (tracking_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            services = self._reader.execute(
+                "SELECT service, status, error, attempts FROM delivery_services "
+                "WHERE tracking_id = ? ORDER BY position",
+                (tracking_id,)
+            ).fetchall()
+
+        return {
+            "tracking_id": tracking_id,
+            "status": row[0],
+            "severity": row[1],
+            "services": {service: _service_result(status, error, attempts)
+                         for service, status, error, attempts in services},
+            "submitted_at": row[2],
+            "completed_at": row[3]
+        }
+
+    def pending(self):
+        """Get the deliveries that were accepted but not finished.
+
+        Returns:
+            list: Dicts with tracking_id, title, message, data, context,
+                severity, submitted_at and services (service name to result), oldest first
+        """
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT tracking_id, title, message, data, context, severity, submitted_at FROM deliveries "
+                "WHERE completed_at IS NULL ORDER BY submitted_at"
+            ).fetchall()
+            deliveries = []
+            for tracking_id, title, message, data, context, severity, submitted_at in rows:
+                services = self._reader.execute(
+                    "SELECT service, status, error, attempts FROM delivery_services "
+                    "WHERE tracking_id = ? ORDER BY position",
+                    (tracking_id,)
+                ).fetchall()
+                deliveries.append({
+                    "tracking_id": tracking_id,
+                    "title": title,
+                    "message": message,
+                    "data": json.loads(data) if data is not None else None,
+                    "context": json.loads(context) if context else {},
+                    "severity": severity,
+                    "submitted_at": submitted_at,
+                    "services": {service: _service_result(status, error, attempts)
+                                 for service, status, error, attempts in services}
+                })
+        return deliveries
+
+    def flush(self):
+        """Block until every write so far is committed."""
+        self._write(("flush",), wait=True)
+
+    def close(self):
+        """Commit outstanding writes and close the store."""
+        if self._closed:
+            return
+        self._write(("close",), wait=True)
+        self._closed = True
+        self._thread.join()
+        self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+    def stats(self):
+        """Get store statistics.
+
+        Returns:
+            dict: Write, commit and pending write counters
+        """
+        return {
+            "path": self.path,
+            "writes": self.writes,
+            "commits": self.commits,
+            "queued_writes": self._writes.qsize()
+        }
+
+    def _write(self, operation, wait):
+        """Hand a write to the writer thread, optionally waiting for its commit."""
+        if self._closed:
+            raise RuntimeError("Delivery store is closed")
+        done = _Waiter() if wait else None
+        self._writes.put((operation, done))
+        if done is not None:
+            done.event.wait()
+            if done.error is not None:
+                raise done.error
+
+    def _run(self):
+        """Writer loop committing queued writes in batches."""
+        while True:
+            batch = [self._writes.get()]
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = any(operation[0] == "close" for operation, _ in batch)
+            try:
+                self._commit([operation for operation, _ in batch])
+            except sqlite3.Error as e:
+                if len(batch) > 1:
+                    logger.error(f"Error writing {len(batch)} delivery updates, retrying them one by one: {e}")
+                    self._commit_each(batch)
+                else:
+                    logger.error(f"Error writing delivery update {batch[0][0][0]}: {e}")
+                    if batch[0][1] is not None:
+                        batch[0][1].error = e
+            for _, done in batch:
+                if done is not None:
+                    done.event.set()
+            if closing:
+                return
+
+    def _commit_each(self, batch):
+        """Commit the writes of a failed batch separately, recording each error for its waiter."""
+        for operation, done in batch:
+            try:
+                self._commit([operation])
+            except sqlite3.Error as e:
+                logger.error(f"Error writing delivery update {operation[0]}: {e}")
+                if done is not None:
+                    done.error = e
+
+    def _commit(self, operations):
+        """Apply a batch of writes in one transaction."""
+        cursor = self._writer.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for operation in operations:
+                if operation[0] == "add":
+                    _, row, services = operation
+                    cursor.execute("INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", row)
+                    cursor.execute("DELETE FROM delivery_services WHERE tracking_id = ?", (row[0],))
+                    cursor.executemany("INSERT INTO delivery_services VALUES (?, ?, ?, ?, ?, ?)", services)
+                elif operation[0] == "update":
+                    _, row, services = operation
+                    cursor.execute(
+                        "UPDATE deliveries SET status = ?, completed_at = ? WHERE tracking_id = ?", row)
+                    cursor.executemany(
+                        "UPDATE delivery_services SET status = ?, error = ?, attempts = ? "
+                        "WHERE tracking_id = ? AND position = ?", services)
+                else:
+                    continue
+                self.writes += 1
+
+            if self.commits % PRUNE_INTERVAL == 0:
+                self._prune(cursor)
+            cursor.execute("COMMIT")
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        self.commits += 1
+
+    def _prune(self, cursor):
+        """Delete the oldest finished deliveries beyond the retention."""
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS expired (tracking_id TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM expired")
+        cursor.execute(
+            "INSERT INTO expired SELECT tracking_id FROM deliveries WHERE completed_at IS NOT NULL "
+            "ORDER BY completed_at DESC LIMIT -1 OFFSET ?", (self.retain,))
+        cursor.execute(
+            "DELETE FROM delivery_services WHERE tracking_id IN (SELECT tracking_id FROM expired)")
+        cursor.execute("DELETE FROM deliveries WHERE tracking_id IN (SELECT tracking_id FROM expired)")
+
+
+class _Waiter:
+    """Commit notification for a caller waiting on its write."""
+
+    __slots__ = ("event", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.error = None
+
+
+def _service_result(status, error, attempts=None):
+    """Build the per-service result dict of a stored service row."""
+    result = {"status": status}
+    if error is not None:
+        result["error"] = error
+    if attempts is not None:
+        result["attempts"] = attempts
+    return result
+
+
+# Helper function to create delivery store instance
+def create_delivery_store(path, retain=1000, commit_delay=0.0):
+    """Create a new DeliveryStore instance.
+
+    Args:
+        path (str): Database file path
+        retain (int): Number of finished deliveries kept for status lookups
+        commit_delay (float): Seconds the writer waits for more writes per batch
+
+    Returns:
+        DeliveryStore: New delivery store instance
+    """
+    return DeliveryStore(path, retain, commit_delay)
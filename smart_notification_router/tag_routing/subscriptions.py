@@ -0,0 +1,280 @@
+"""
+Subscription Index
+
+This module answers the reverse question of the tag index: given the tags of
+one entity, which of the registered tag expressions match it?
+
+Each registered expression is rewritten into disjunctive normal form, a list of
+conjunctions of required and excluded tags. Conjunctions are indexed under
+their required tags and matched with a counting algorithm: for every tag of
+the entity, the counter of each conjunction requiring that tag is incremented,
+and a conjunction matches once all of its required tags have been counted and
+none of its excluded tags is present. The cost of a lookup follows the number
+of conjunctions that share a tag with the entity, not the number of registered
+expressions.
+
+Wildcard tags such as "device:*" are indexed under their pattern. A lookup
+adds the patterns matched by the entity's tags, found by checking each tag's
+prefixes of the registered pattern lengths, before counting.
+
+Expressions whose normal form would be too large are kept aside and evaluated
+directly on every lookup.
+"""
+
+import logging
+import threading
+from .compiler import CompiledExpression, chain_operands, compile_expression
+from .parser import OperatorType, TagEmpty, TagLiteral, TagOperator, TagPrefix, WILDCARD_TAG
+
+logger = logging.getLogger(__name__)
+
+# Expressions expanding into more conjunctions than this are evaluated directly
+MAX_CONJUNCTIONS = 64
+
+
+class _TooComplex(Exception):
+    """Raised when an expression's normal form exceeds MAX_CONJUNCTIONS."""
+
+
+def _cross(left, right):
+    """AND two lists of conjunctions together."""
+    result = []
+    for left_required, left_excluded in left:
+        for right_required, right_excluded in right:
+            required = left_required | right_required
+            excluded = left_excluded | right_excluded
+            if required.isdisjoint(excluded):
+                result.append((required, excluded))
+    if len(result) > MAX_CONJUNCTIONS:
+        raise _TooComplex()
+    return result
+
+
+def _union(parts):
+    """OR lists of conjunctions together."""
+    result = list(dict.fromkeys(conjunction for part in parts for conjunction in part))
+    if len(result) > MAX_CONJUNCTIONS:
+        raise _TooComplex()
+    return result
+
+
+def to_conjunctions(node, negate=False):
+    """Rewrite a parse tree into disjunctive normal form.
+
+    Args:
+        node (TagNode): Root node of the parse tree
+        negate (bool): Rewrite the negation of the tree instead
+
+    Returns:
+        list: (required tags, excluded tags) pairs of frozensets; the tree
+            matches an entity if any pair does. Wildcard tags appear as their
+            pattern (e.g. "device:*").
+    """
+    if isinstance(node, TagEmpty):
+        return [(frozenset(), frozenset())] if negate else []
+
+    if isinstance(node, TagLiteral):
+        if node.tag == WILDCARD_TAG:
+            return [] if negate else [(frozenset(), frozenset())]
+        tag = frozenset([node.tag])
+        return [(frozenset(), tag)] if negate else [(tag, frozenset())]
+
+    if isinstance(node, TagPrefix):
+        pattern = frozenset([node.pattern])
+        return [(frozenset(), pattern)] if negate else [(pattern, frozenset())]
+
+    if not isinstance(node, TagOperator):
+        raise ValueError(f"Cannot rewrite node: {node}")
+
+    operator_type = node.operator_type
+
+    if operator_type == OperatorType.NOT:
+        # a-b is a AND NOT b; its negation is NOT a OR b
+        operands = chain_operands(node, operator_type)
+        if negate:
+            return _union([to_conjunctions(operands[0], True)] +
+                          [to_conjunctions(operand) for operand in operands[1:]])
+        result = to_conjunctions(operands[0])
+        for operand in operands[1:]:
+            result = _cross(result, to_conjunctions(operand, True))
+        return result
+
+    if operator_type not in (OperatorType.AND, OperatorType.OR):
+        raise ValueError(f"Unknown operator type: {operator_type}")
+
+    parts = [to_conjunctions(operand, negate) for operand in chain_operands(node, operator_type)]
+
+    # De Morgan: a negated AND is an OR of negations and vice versa
+    if (operator_type == OperatorType.OR) != negate:
+        return _union(parts)
+
+    result = parts[0]
+    for part in parts[1:]:
+        result = _cross(result, part)
+    return result
+
+
+class SubscriptionIndex:
+    """Reverse index from entity tags to the registered expressions they match."""
+
+    def __init__(self):
+        """Initialize an empty subscription index."""
+        self._postings = {}
+        self._conjunctions = {}
+        self._unconditional = set()
+        self._unindexed = {}
+        self._expressions = {}
+        self._patterns = {}
+        self._prefix_lengths = {}
+        self._next_conjunction = 0
+        self._lock = threading.RLock()
+
+    def add(self, expression_id, expression):
+        """Register an expression, replacing any expression with the same ID.
+
+        Args:
+            expression_id: Hashable ID reported by match()
+            expression: Expression string or CompiledExpression
+
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        if not isinstance(expression, CompiledExpression):
+            expression = compile_expression(expression)
+
+        try:
+            conjunctions = to_conjunctions(expression.tree)
+        except (_TooComplex, RecursionError):
+            conjunctions = None
+
+        with self._lock:
+            self.remove(expression_id)
+
+            if conjunctions is None:
+                logger.debug(f"Expression '{expression.expression}' is evaluated directly")
+                self._unindexed[expression_id] = expression
+                self._expressions[expression_id] = ()
+                return
+
+            ids = []
+            patterns = set()
+            for required, excluded in conjunctions:
+                patterns.update(tag for tag in required | excluded if tag.endswith(WILDCARD_TAG))
+                conjunction_id = self._next_conjunction
+                self._next_conjunction += 1
+                self._conjunctions[conjunction_id] = (expression_id, len(required), excluded)
+                if required:
+                    for tag in required:
+                        self._postings.setdefault(tag, set()).add(conjunction_id)
+                else:
+                    self._unconditional.add(conjunction_id)
+                ids.append((conjunction_id, required))
+            self._expressions[expression_id] = tuple(ids)
+            self._patterns[expression_id] = patterns
+            for pattern in patterns:
+                length = len(pattern) - 1
+                self._prefix_lengths[length] = self._prefix_lengths.get(length, 0) + 1
+
+    def remove(self, expression_id):
+        """Unregister an expression.
+
+        Args:
+            expression_id: ID the expression was registered with
+        """
+        with self._lock:
+            ids = self._expressions.pop(expression_id, None)
+            if ids is None:
+                return
+            self._unindexed.pop(expression_id, None)
+            for pattern in self._patterns.pop(expression_id, ()):
+                length = len(pattern) - 1
+                self._prefix_lengths[length] -= 1
+                if not self._prefix_lengths[length]:
+                    del self._prefix_lengths[length]
+            for conjunction_id, required in ids:
+                del self._conjunctions[conjunction_id]
+                self._unconditional.discard(conjunction_id)
+                for tag in required:
+                    postings = self._postings[tag]
+                    postings.discard(conjunction_id)
+                    if not postings:
+                        del self._postings[tag]
+
+    def match(self, tags):
+        """Find the registered expressions matching a tag set.
+
+        Args:
+            tags (iterable): Tags of an entity
+
+        Returns:
+            set: IDs of the matching expressions
+        """
+        if not isinstance(tags, (set, frozenset)):
+            tags = frozenset(tags)
+
+        with self._lock:
+            atoms = self._with_patterns(tags) if self._prefix_lengths else tags
+
+            counts = {}
+            for tag in atoms:
+                for conjunction_id in self._postings.get(tag, ()):
+                    counts[conjunction_id] = counts.get(conjunction_id, 0) + 1
+
+            matched = set()
+            conjunctions = self._conjunctions
+            for conjunction_id, count in counts.items():
+                expression_id, required, excluded = conjunctions[conjunction_id]
+                if count == required and excluded.isdisjoint(atoms):
+                    matched.add(expression_id)
+
+            for conjunction_id in self._unconditional:
+                expression_id, _, excluded = conjunctions[conjunction_id]
+                if excluded.isdisjoint(atoms):
+                    matched.add(expression_id)
+
+            for expression_id, expression in self._unindexed.items():
+                if expression.matches(tags):
+                    matched.add(expression_id)
+
+            return matched
+
+    def _with_patterns(self, tags):
+        """Add the registered wildcard patterns matched by a tag set (caller must hold the lock)."""
+        atoms = set(tags)
+        for tag in tags:
+            for length in self._prefix_lengths:
+                if length <= len(tag):
+                    atoms.add(tag[:length] + WILDCARD_TAG)
+        return atoms
+
+    def affected(self, old_tags, new_tags):
+        """Find the expressions whose membership changes when an entity's tags change.
+
+        Args:
+            old_tags (iterable): Tags before the change (None for a new entity)
+            new_tags (iterable): Tags after the change (None for a removed entity)
+
+        Returns:
+            set: IDs of expressions the entity joined or left
+        """
+        old_matches = self.match(old_tags) if old_tags is not None else set()
+        new_matches = self.match(new_tags) if new_tags is not None else set()
+        return old_matches ^ new_matches
+
+    def __contains__(self, expression_id):
+        with self._lock:
+            return expression_id in self._expressions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._expressions)
+
+
+# Helper function to create subscription index instance
+def create_subscription_index():
+    """Create a new SubscriptionIndex instance.
+
+    Returns:
+        SubscriptionIndex: New subscription index instance
+    """
+    return SubscriptionIndex()
@@ -0,0 +1,478 @@
+"""
+Tag Index
+
+This module provides an inverted index from tags to the entities that carry
+them. Tag expressions are resolved against the index with set algebra
+(intersection for AND, union for OR, difference for NOT), so the cost of a
+query follows the size of the matching sets rather than the number of
+entities in the registry.
+
+The index also interns every tag to a small integer and keeps, per tag, an
+integer bitmap over entity ordinals. Queries that touch a large share of the
+registry (such as testing an expression against every entity) are evaluated
+as a handful of bitwise operations on those bitmaps instead.
+
+The postings double as cardinality statistics: optimize() reorders compiled
+expressions so the most selective operands are evaluated first, and
+estimate_cardinality() previews the size of a result without evaluating it.
+
+Tags are also kept in a sorted dictionary, so wildcard tags such as "device:*"
+or "area:bed*" are expanded by binary search to the contiguous run of matching
+tags and resolved as the union of their postings.
+"""
+
+import bisect
+import logging
+import threading
+from .cache import LRUCache
+from .compiler import CompiledExpression, chain_operands, estimate_cardinality, order_by_selectivity
+from .parser import OperatorType, TagEmpty, TagLiteral, TagOperator, TagPrefix, WILDCARD_TAG
+
+logger = logging.getLogger(__name__)
+
+# Bit positions set in each byte value, used to decode bitmaps
+_BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if value & (1 << bit)) for value in range(256)
+)
+
+# Use bitmaps once the postings touched by a query exceed this share of the registry
+BITSET_DENSITY_THRESHOLD = 1 / 16
+
+# Reorder cached plans with fresh statistics after this many index writes
+STATISTICS_REFRESH_INTERVAL = 256
+
+
+class TagIndex:
+    """Inverted index mapping tags to sets of entity IDs."""
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._postings = {}
+        self._sorted_tags = []
+        self._entity_tags = {}
+        self._universe = set()
+        self._tag_ids = {}
+        self._bitmaps = []
+        self._ordinals = {}
+        self._entity_ids = []
+        self._universe_mask = 0
+        self._lock = threading.RLock()
+        self._plans = LRUCache(maxsize=256)
+        self._writes = 0
+        self.version = 0
+        self.statistics_version = 0
+
+    def rebuild(self, entity_tags, entity_ids=()):
+        """Rebuild the index from scratch.
+
+        Args:
+            entity_tags (dict): Mapping of entity IDs to lists of tags
+            entity_ids (iterable): Additional entity IDs without tags
+        """
+        with self._lock:
+            self._postings = {}
+            self._sorted_tags = []
+            self._entity_tags = {}
+            self._universe = set()
+            self._tag_ids = {}
+            self._bitmaps = []
+            self._ordinals = {}
+            self._entity_ids = []
+            self._universe_mask = 0
+            for entity_id in entity_ids:
+                self._add_to_universe(entity_id)
+            for entity_id, tags in entity_tags.items():
+                self._set_tags(entity_id, frozenset(tags))
+            self.version += 1
+            self.statistics_version += 1
+            self._writes = 0
+
+        logger.info(
+            f"Tag index built with {len(self._universe)} entities and {len(self._postings)} tags"
+        )
+
+    def update_entity(self, entity_id, tags):
+        """Replace the tags of an entity.
+
+        Args:
+            entity_id (str): Entity ID
+            tags (list): New tags for the entity
+
+        Returns:
+            frozenset: Tags the entity had before the update
+        """
+        with self._lock:
+            old_tags = self._entity_tags.get(entity_id, frozenset())
+            new_tags = frozenset(tags)
+            if new_tags != old_tags or entity_id not in self._universe:
+                self._set_tags(entity_id, new_tags)
+                self._bump_version()
+            return old_tags
+
+    def remove_entity(self, entity_id):
+        """Remove an entity and its tags from the index.
+
+        Args:
+            entity_id (str): Entity ID
+        """
+        with self._lock:
+            if entity_id not in self._universe:
+                return
+            self._set_tags(entity_id, frozenset())
+            self._entity_tags.pop(entity_id, None)
+            self._universe.discard(entity_id)
+            ordinal = self._ordinals.pop(entity_id)
+            self._entity_ids[ordinal] = None
+            self._universe_mask &= ~(1 << ordinal)
+            self._bump_version()
+
+    def _bump_version(self):
+        """Record a write, refreshing statistics periodically (caller must hold the lock)."""
+        self.version += 1
+        self._writes += 1
+        if self._writes >= STATISTICS_REFRESH_INTERVAL:
+            self.statistics_version += 1
+            self._writes = 0
+
+    def _add_to_universe(self, entity_id):
+        """Assign an ordinal to a new entity (caller must hold the lock).
+
+        Returns:
+            int: Bit of the entity in bitmaps
+        """
+        ordinal = self._ordinals.get(entity_id)
+        if ordinal is None:
+            ordinal = len(self._entity_ids)
+            self._ordinals[entity_id] = ordinal
+            self._entity_ids.append(entity_id)
+            self._universe.add(entity_id)
+            self._universe_mask |= 1 << ordinal
+        return 1 << ordinal
+
+    def _intern_tag(self, tag):
+        """Get the integer ID of a tag, assigning one if needed (caller must hold the lock)."""
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self._bitmaps)
+            self._tag_ids[tag] = tag_id
+            self._bitmaps.append(0)
+        return tag_id
+
+    def _set_tags(self, entity_id, new_tags):
+        """Update postings and bitmaps for an entity (caller must hold the lock)."""
+        old_tags = self._entity_tags.get(entity_id, frozenset())
+        bit = self._add_to_universe(entity_id)
+
+        for tag in old_tags - new_tags:
+            entities = self._postings.get(tag)
+            if entities is not None:
+                entities.discard(entity_id)
+                if not entities:
+                    del self._postings[tag]
+                    del self._sorted_tags[bisect.bisect_left(self._sorted_tags, tag)]
+            tag_id = self._tag_ids[tag]
+            self._bitmaps[tag_id] &= ~bit
+
+        for tag in new_tags - old_tags:
+            entities = self._postings.get(tag)
+            if entities is None:
+                entities = self._postings[tag] = set()
+                bisect.insort(self._sorted_tags, tag)
+            entities.add(entity_id)
+            tag_id = self._intern_tag(tag)
+            self._bitmaps[tag_id] |= bit
+
+        self._entity_tags[entity_id] = new_tags
+
+    def get_tags(self, entity_id):
+        """Get the tags of an entity.
+
+        Args:
+            entity_id (str): Entity ID
+
+        Returns:
+            frozenset: Tags of the entity
+        """
+        with self._lock:
+            return self._entity_tags.get(entity_id, frozenset())
+
+    def entities_with_tag(self, tag):
+        """Get the entities carrying a tag.
+
+        Args:
+            tag (str): Tag to look up
+
+        Returns:
+            set: Entity IDs with the tag
+        """
+        with self._lock:
+            return set(self._postings.get(tag, ()))
+
+    def cardinality(self, tag):
+        """Get the number of entities carrying a tag.
+
+        Args:
+            tag (str): Tag to look up; a wildcard tag such as "device:*" counts
+                the entities carrying any matching tag
+
+        Returns:
+            int: Number of entities with the tag
+        """
+        with self._lock:
+            if tag != WILDCARD_TAG and tag.endswith(WILDCARD_TAG):
+                return len(self._resolve(TagPrefix(tag[:-1])))
+            return len(self._postings.get(tag, ()))
+
+    def expand_prefix(self, prefix):
+        """Get the tags starting with a prefix.
+
+        Args:
+            prefix (str): Tag prefix (e.g., "device:")
+
+        Returns:
+            list: Sorted list of matching tags
+        """
+        with self._lock:
+            return self._expand(prefix)
+
+    def _expand(self, prefix):
+        """Find the run of sorted tags starting with a prefix (caller must hold the lock)."""
+        tags = self._sorted_tags
+        start = bisect.bisect_left(tags, prefix)
+        end = start
+        while end < len(tags) and tags[end].startswith(prefix):
+            end += 1
+        return tags[start:end]
+
+    def get_all_tags(self):
+        """Get all tags present in the index.
+
+        Returns:
+            list: Sorted list of tags
+        """
+        with self._lock:
+            return list(self._sorted_tags)
+
+    def estimate_cardinality(self, expression):
+        """Estimate the number of entities matching an expression without evaluating it.
+
+        Args:
+            expression: Parse tree (TagNode) or CompiledExpression
+            
+        Returns:
+            int: Estimated number of matching entities
+        """
+        if isinstance(expression, CompiledExpression):
+            expression = expression.tree
+
+        with self._lock:
+            return estimate_cardinality(expression, self.cardinality, len(self._universe))
+
+    def optimize(self, compiled):
+        """Get a compiled expression reordered by the index's tag statistics.
+
+        Plans are cached and only reordered after a rebuild or every
+        STATISTICS_REFRESH_INTERVAL writes; operand order affects speed, not results.
+
+        Args:
+            compiled (CompiledExpression): Compiled expression
+            
+        Returns:
+            CompiledExpression: Equivalent expression with selective operands first
+        """
+        with self._lock:
+            cached = self._plans.get(compiled.expression)
+            if cached is not None and cached[0] == self.statistics_version:
+                return cached[1]
+
+            plan = order_by_selectivity(compiled, self.cardinality, len(self._universe))
+            self._plans.put(compiled.expression, (self.statistics_version, plan))
+            return plan
+
+    @property
+    def universe(self):
+        """Set of all entity IDs known to the index."""
+        with self._lock:
+            return set(self._universe)
+
+    def resolve(self, expression):
+        """Resolve an expression to the set of matching entity IDs.
+
+        Sparse queries are answered with set algebra over the postings, with
+        compiled expressions reordered so intermediate sets stay small; queries
+        whose postings cover a large share of the registry use the bitmaps.
+
+        Args:
+            expression: Parse tree (TagNode) or CompiledExpression
+
+        Returns:
+            set: Matching entity IDs
+        """
+        with self._lock:
+            if isinstance(expression, CompiledExpression):
+                expression = self.optimize(expression).tree
+
+            if self._is_dense(expression):
+                return set(self.entities_in_mask(self._resolve_mask(expression)))
+
+            result = self._resolve(expression)
+            # Literal lookups return the index's own sets; never hand those out
+            return set(result)
+
+    def match_mask(self, expression):
+        """Evaluate an expression over every entity as a bitmap.
+
+        Args:
+            expression: Parse tree (TagNode) or CompiledExpression
+
+        Returns:
+            int: Bitmap of matching entity ordinals
+        """
+        if isinstance(expression, CompiledExpression):
+            expression = expression.tree
+
+        with self._lock:
+            return self._resolve_mask(expression)
+
+    def entities_in_mask(self, mask):
+        """Decode a bitmap into entity IDs in ordinal order.
+
+        Args:
+            mask (int): Bitmap of entity ordinals
+
+        Returns:
+            list: Entity IDs whose bits are set
+        """
+        entity_ids = self._entity_ids
+        result = []
+        data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            if byte:
+                base = byte_index * 8
+                for bit in _BYTE_BITS[byte]:
+                    result.append(entity_ids[base + bit])
+        return result
+
+    def _is_dense(self, node):
+        """Check whether a query touches enough postings to favour bitmaps."""
+        total = 0
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, TagLiteral):
+                if node.tag == WILDCARD_TAG:
+                    return True
+                total += len(self._postings.get(node.tag, ()))
+            elif isinstance(node, TagPrefix):
+                total += sum(len(self._postings[tag]) for tag in self._expand(node.prefix))
+            elif isinstance(node, TagOperator):
+                pending.append(node.left)
+                if node.right is not None:
+                    pending.append(node.right)
+        return total > len(self._universe) * BITSET_DENSITY_THRESHOLD
+
+    def _resolve_mask(self, node):
+        """Resolve a node to a bitmap of entity ordinals (caller must hold the lock)."""
+        if isinstance(node, TagEmpty):
+            return 0
+
+        if isinstance(node, TagLiteral):
+            if node.tag == WILDCARD_TAG:
+                return self._universe_mask
+            tag_id = self._tag_ids.get(node.tag)
+            return self._bitmaps[tag_id] if tag_id is not None else 0
+
+        if isinstance(node, TagPrefix):
+            result = 0
+            for tag in self._expand(node.prefix):
+                result |= self._bitmaps[self._tag_ids[tag]]
+            return result
+
+        if not isinstance(node, TagOperator):
+            raise ValueError(f"Cannot resolve node: {node}")
+
+        operands = [self._resolve_mask(operand)
+                    for operand in chain_operands(node, node.operator_type)]
+
+        if node.operator_type == OperatorType.AND:
+            result = operands[0]
+            for mask in operands[1:]:
+                result &= mask
+            return result
+        elif node.operator_type == OperatorType.OR:
+            result = 0
+            for mask in operands:
+                result |= mask
+            return result
+        elif node.operator_type == OperatorType.NOT:
+            result = operands[0]
+            for mask in operands[1:]:
+                result &= ~mask
+            return result
+
+        raise ValueError(f"Unknown operator type: {node.operator_type}")
+
+    def _resolve(self, node):
+        """Resolve a node with set algebra (caller must hold the lock).
+
+        The returned set may be owned by the index and must not be modified.
+        """
+        if isinstance(node, TagEmpty):
+            return frozenset()
+
+        if isinstance(node, TagLiteral):
+            if node.tag == WILDCARD_TAG:
+                return self._universe
+            return self._postings.get(node.tag, frozenset())
+
+        if isinstance(node, TagPrefix):
+            return set().union(*(self._postings[tag] for tag in self._expand(node.prefix)))
+
+        if not isinstance(node, TagOperator):
+            raise ValueError(f"Cannot resolve node: {node}")
+
+        operands = chain_operands(node, node.operator_type)
+
+        if node.operator_type == OperatorType.AND:
+            result = self._resolve(operands[0])
+            for operand in operands[1:]:
+                if not result:
+                    break
+                result = result & self._resolve(operand)
+            return result
+        elif node.operator_type == OperatorType.OR:
+            return set().union(*(self._resolve(operand) for operand in operands))
+        elif node.operator_type == OperatorType.NOT:
+            result = self._resolve(operands[0])
+            for operand in operands[1:]:
+                if not result:
+                    break
+                result = result - self._resolve(operand)
+            return result
+
+        raise ValueError(f"Unknown operator type: {node.operator_type}")
+
+    def __contains__(self, entity_id):
+        with self._lock:
+            return entity_id in self._universe
+
+    def __len__(self):
+        with self._lock:
+            return len(self._universe)
+
+
+# Helper function to create tag index instance
+def create_tag_index(entity_tags=None, entity_ids=()):
+    """Create a new TagIndex instance.
+
+    Args:
+        entity_tags (dict): Mapping of entity IDs to lists of tags (optional)
+        entity_ids (iterable): Additional entity IDs without tags
+
+    Returns:
+        TagIndex: New tag index instance
+    """
+    index = TagIndex()
+    if entity_tags is not None or entity_ids:
+        index.rebuild(entity_tags or {}, entity_ids)
+    return index
@@ -0,0 +1,302 @@
+"""
+Vectorized Batch Evaluation
+
+This module evaluates many tag expressions against every entity at once. When
+NumPy is installed, it keeps an entities x tags boolean matrix and evaluates
+each compiled expression as column-wise boolean operations over that matrix.
+Without NumPy it falls back to the bitmap path of the TagIndex.
+
+The matrix is built from the EntityManager's tag index on first use and then
+updated row by row as entity tags change.
+"""
+
+import bisect
+import logging
+import threading
+from .compiler import CompiledExpression, chain_operands, compile_expression
+from .parser import OperatorType, TagEmpty, TagLiteral, TagOperator, TagPrefix, WILDCARD_TAG
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_NUMPY = "numpy"
+BACKEND_BITSET = "bitset"
+
+
+class TagMatrix:
+    """Boolean matrix with one row per entity and one column per tag."""
+
+    def __init__(self, initial_rows=64, initial_columns=64):
+        """Initialize an empty matrix.
+
+        Args:
+            initial_rows (int): Initial row capacity
+            initial_columns (int): Initial column capacity
+        """
+        if np is None:
+            raise RuntimeError("NumPy is required for TagMatrix")
+
+        # Column-major so that each tag column is contiguous in memory
+        self._matrix = np.zeros((initial_rows, initial_columns), dtype=bool, order="F")
+        self._active = np.zeros(initial_rows, dtype=bool)
+        self._rows = {}
+        self._columns = {}
+        self._sorted_tags = []
+        self.entity_ids = []
+
+    def _row(self, entity_id):
+        """Get the row of an entity, adding one if needed."""
+        row = self._rows.get(entity_id)
+        if row is None:
+            row = len(self.entity_ids)
+            if row >= self._matrix.shape[0]:
+                self._grow(rows=row * 2)
+            self._rows[entity_id] = row
+            self.entity_ids.append(entity_id)
+        return row
+
+    def _column(self, tag):
+        """Get the column of a tag, adding one if needed."""
+        column = self._columns.get(tag)
+        if column is None:
+            column = len(self._columns)
+            if column >= self._matrix.shape[1]:
+                self._grow(columns=column * 2)
+            self._columns[tag] = column
+            bisect.insort(self._sorted_tags, tag)
+        return column
+
+    def _grow(self, rows=None, columns=None):
+        """Enlarge the matrix capacity."""
+        old_rows, old_columns = self._matrix.shape
+        new_rows = max(rows or old_rows, old_rows)
+        new_columns = max(columns or old_columns, old_columns)
+
+        matrix = np.zeros((new_rows, new_columns), dtype=bool, order="F")
+        matrix[:old_rows, :old_columns] = self._matrix
+        self._matrix = matrix
+
+        active = np.zeros(new_rows, dtype=bool)
+        active[:old_rows] = self._active
+        self._active = active
+
+    def update_entity(self, entity_id, tags):
+        """Replace the tags of an entity.
+
+        Args:
+            entity_id (str): Entity ID
+            tags (iterable): Tags of the entity
+        """
+        row = self._row(entity_id)
+        columns = [self._column(tag) for tag in tags]
+        self._matrix[row, :] = False
+        self._matrix[row, columns] = True
+        self._active[row] = True
+
+    def remove_entity(self, entity_id):
+        """Remove an entity from the matrix.
+
+        Args:
+            entity_id (str): Entity ID
+        """
+        row = self._rows.get(entity_id)
+        if row is not None:
+            self._matrix[row, :] = False
+            self._active[row] = False
+
+    def evaluate(self, node):
+        """Evaluate a parse tree column-wise.
+
+        Args:
+            node (TagNode): Root node of the parse tree
+
+        Returns:
+            numpy.ndarray: Boolean membership vector aligned with entity_ids
+        """
+        count = len(self.entity_ids)
+        return self._evaluate(node, count) & self._active[:count]
+
+    @property
+    def active(self):
+        """Boolean vector aligned with entity_ids marking entities not removed."""
+        return self._active[:len(self.entity_ids)]
+
+    def _evaluate(self, node, count):
+        if isinstance(node, TagEmpty):
+            return np.zeros(count, dtype=bool)
+
+        if isinstance(node, TagLiteral):
+            if node.tag == WILDCARD_TAG:
+                return self._active[:count]
+            column = self._columns.get(node.tag)
+            if column is None:
+                return np.zeros(count, dtype=bool)
+            return self._matrix[:count, column]
+
+        if isinstance(node, TagPrefix):
+            tags = self._sorted_tags
+            start = bisect.bisect_left(tags, node.prefix)
+            end = start
+            while end < len(tags) and tags[end].startswith(node.prefix):
+                end += 1
+            columns = [self._columns[tag] for tag in tags[start:end]]
+            if not columns:
+                return np.zeros(count, dtype=bool)
+            return self._matrix[:count, columns].any(axis=1)
+
+        if not isinstance(node, TagOperator):
+            raise ValueError(f"Cannot evaluate node: {node}")
+
+        operands = chain_operands(node, node.operator_type)
+        result = self._evaluate(operands[0], count).copy()
+
+        for operand in operands[1:]:
+            vector = self._evaluate(operand, count)
+            if node.operator_type == OperatorType.AND:
+                result &= vector
+            elif node.operator_type == OperatorType.OR:
+                result |= vector
+            elif node.operator_type == OperatorType.NOT:
+                result &= ~vector
+            else:
+                raise ValueError(f"Unknown operator type: {node.operator_type}")
+
+        return result
+
+
+class BatchEvaluator:
+    """Evaluates batches of tag expressions against every entity."""
+
+    def __init__(self, tag_index, use_numpy=True):
+        """Initialize the batch evaluator.
+
+        Args:
+            tag_index (TagIndex): Tag index holding the entity tags
+            use_numpy (bool): Use the NumPy backend when NumPy is available
+        """
+        self.tag_index = tag_index
+        self.backend = BACKEND_NUMPY if use_numpy and np is not None else BACKEND_BITSET
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        logger.info(f"Batch expression evaluator using {self.backend} backend")
+
+    def _get_matrix(self):
+        """Get the tag matrix, building it from the tag index on first use."""
+        if self._matrix is None:
+            matrix = TagMatrix()
+            for entity_id in sorted(self.tag_index.universe):
+                matrix.update_entity(entity_id, self.tag_index.get_tags(entity_id))
+            self._matrix = matrix
+        return self._matrix
+
+    def update_entity(self, entity_id, tags):
+        """Apply a tag change to the matrix (no-op until the matrix is built).
+
+        Args:
+            entity_id (str): Entity ID
+            tags (iterable): New tags of the entity
+        """
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.update_entity(entity_id, tags)
+
+    def remove_entity(self, entity_id):
+        """Remove an entity from the matrix (no-op until the matrix is built).
+
+        Args:
+            entity_id (str): Entity ID
+        """
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.remove_entity(entity_id)
+
+    def evaluate_vectors(self, expressions):
+        """Evaluate expressions into per-expression membership vectors.
+
+        Args:
+            expressions (list): Expression strings or CompiledExpression objects
+
+        Returns:
+            tuple: (entity_ids, vectors) where vectors maps each expression to a
+                sequence of booleans aligned with entity_ids
+        """
+        compiled = _compile_all(expressions)
+
+        if self.backend == BACKEND_NUMPY:
+            with self._lock:
+                matrix = self._get_matrix()
+                active = matrix.active.copy()
+                entity_ids = [entity_id for entity_id, present in zip(matrix.entity_ids, active) if present]
+                vectors = {plan.expression: matrix.evaluate(plan.tree)[active] for plan in compiled}
+                return entity_ids, vectors
+
+        entity_ids = sorted(self.tag_index.universe)
+        vectors = {}
+        for plan in compiled:
+            matches = set(self.tag_index.entities_in_mask(self.tag_index.match_mask(plan)))
+            vectors[plan.expression] = [entity_id in matches for entity_id in entity_ids]
+        return entity_ids, vectors
+
+    def evaluate(self, expressions):
+        """Evaluate expressions into lists of matching entity IDs.
+
+        Args:
+            expressions (list): Expression strings or CompiledExpression objects
+
+        Returns:
+            dict: Mapping of each canonical expression to a sorted list of matching entity IDs
+        """
+        compiled = _compile_all(expressions)
+
+        if self.backend == BACKEND_NUMPY:
+            with self._lock:
+                matrix = self._get_matrix()
+                entity_ids = matrix.entity_ids
+                return {
+                    plan.expression: sorted(
+                        entity_ids[row] for row in np.flatnonzero(matrix.evaluate(plan.tree))
+                    )
+                    for plan in compiled
+                }
+
+        return {
+            plan.expression: sorted(
+                self.tag_index.entities_in_mask(self.tag_index.match_mask(plan))
+            )
+            for plan in compiled
+        }
+
+
+def _compile(expression):
+    """Compile an expression string, passing compiled expressions through."""
+    if isinstance(expression, CompiledExpression):
+        return expression
+    return compile_expression(expression)
+
+
+def _compile_all(expressions):
+    """Compile expressions, keeping one plan per canonical expression."""
+    plans = {}
+    for expression in expressions:
+        plan = _compile(expression)
+        plans.setdefault(plan.expression, plan)
+    return list(plans.values())
+
+
+# Helper function to create batch evaluator instance
+def create_batch_evaluator(tag_index, use_numpy=True):
+    """Create a new BatchEvaluator instance.
+
+    Args:
+        tag_index (TagIndex): Tag index holding the entity tags
+        use_numpy (bool): Use the NumPy backend when NumPy is available
+
+    Returns:
+        BatchEvaluator: New batch evaluator instance
+    """
+    return BatchEvaluator(tag_index, use_numpy)
@@ -0,0 +1,154 @@
+"""
+Home Assistant State Watcher
+
+This module turns periodic polls of Home Assistant into change notifications.
+Each poll fetches all entity states and the service registry in one request
+each, compares them with the previous poll and calls the registered listeners
+for what changed, so caches keyed on entity states (service mappings, user
+presence and notification targets) are refreshed without waiting for a TTL.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between polls
+DEFAULT_POLL_INTERVAL = 30.0
+
+
+class StateWatcher:
+    """Polls entity states and services and reports changes to listeners."""
+
+    def __init__(self, ha_client, interval=DEFAULT_POLL_INTERVAL):
+        """Initialize the watcher; nothing is polled until poll() or start().
+
+        Args:
+            ha_client (HomeAssistantAPIClient): Home Assistant API client
+            interval (float): Seconds between polls of the background thread
+        """
+        self.ha_client = ha_client
+        self.interval = interval
+        self._states = None
+        self._services = None
+        self._state_listeners = []
+        self._services_listeners = []
+        self._poll_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.failures = 0
+        self.changes = 0
+
+    def add_state_listener(self, listener):
+        """Register a callback for entity state changes.
+
+        Args:
+            listener (callable): Called with (entity_id, new_state); new_state
+                is None when the entity was removed
+        """
+        self._state_listeners.append(listener)
+
+    def add_services_listener(self, listener):
+        """Register a callback for service registry changes.
+
+        Args:
+            listener (callable): Called with the new service listing
+        """
+        self._services_listeners.append(listener)
+
+    def poll(self):
+        """Fetch states and services and notify listeners of changes.
+
+        The first poll only records the current states. A fetch that fails
+        keeps the previous snapshot, so an unreachable API is not mistaken for
+        every entity or service being removed.
+
+        Returns:
+            int: Number of entities whose state changed
+        """
+        with self._poll_lock:
+            states = self.ha_client.get_entity_states()
+            services = self.ha_client.get_services()
+            self.polls += 1
+            if states is None:
+                self.failures += 1
+                logger.warning("Entity states unavailable, keeping the previous snapshot")
+                return 0
+            previous_states, self._states = self._states, states
+            if services is None:
+                previous_services = services = self._services
+            else:
+                previous_services, self._services = self._services, services
+
+        if previous_states is None:
+            return 0
+
+        changed = [(entity_id, state) for entity_id, state in states.items()
+                   if previous_states.get(entity_id) != state]
+        changed.extend((entity_id, None) for entity_id in previous_states if entity_id not in states)
+        for entity_id, state in changed:
+            self._notify(self._state_listeners, entity_id, state)
+        self.changes += len(changed)
+
+        if services != previous_services:
+            self._notify(self._services_listeners, services)
+
+        if changed:
+            logger.debug(f"State poll found {len(changed)} changed entities")
+        return len(changed)
+
+    def start(self):
+        """Start polling in a background thread; its first poll is one interval away."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="state-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Get watcher statistics.
+
+        Returns:
+            dict: Poll interval, number of polls, failed polls and reported changes
+        """
+        return {"interval": self.interval, "polls": self.polls, "failures": self.failures,
+                "changes": self.changes}
+
+    def _run(self):
+        """Poll until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Error polling Home Assistant states")
+
+    @staticmethod
+    def _notify(listeners, *args):
+        """Call each listener, logging rather than propagating its errors."""
+        for listener in list(listeners):
+            try:
+                listener(*args)
+            except Exception:
+                logger.exception(f"Error in state listener {listener}")
+
+
+# Helper function to create state watcher instance
+def create_state_watcher(ha_client, interval=DEFAULT_POLL_INTERVAL):
+    """Create a new StateWatcher instance.
+
+    Args:
+        ha_client (HomeAssistantAPIClient): Home Assistant API client
+        interval (float): Seconds between polls
+
+    Returns:
+        StateWatcher: New state watcher instance
+    """
+    return StateWatcher(ha_client, interval)
@@ -0,0 +1,74 @@
+"""
+Unit tests for the LRU cache.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test cases for the LRUCache class."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.cache = LRUCache(maxsize=2)
+    
+    def test_get_and_put(self):
+        """Test storing and retrieving values."""
+        self.cache.put("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+    
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is evicted."""
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        
+        self.assertIn("a", self.cache)
+        self.assertNotIn("b", self.cache)
+        self.assertIn("c", self.cache)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+    
+    def test_entries_expire(self):
+        """Test that entries expire after the TTL."""
+        now = [100.0]
+        evicted = []
+        cache = LRUCache(maxsize=2, ttl=10, on_evict=lambda key, value: evicted.append(key),
+                         clock=lambda: now[0])
+        cache.put("a", 1)
+        
+        now[0] = 109.0
+        self.assertEqual(cache.get("a"), 1)
+        
+        now[0] = 110.0
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(evicted, ["a"])
+        self.assertEqual(cache.stats()["expirations"], 1)
+    
+    def test_eviction_callback(self):
+        """Test that the callback sees entries evicted for space but not popped ones."""
+        evicted = []
+        cache = LRUCache(maxsize=1, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.pop("b")
+        
+        self.assertEqual(evicted, [("a", 1)])
+    
+    def test_invalid_size(self):
+        """Test that a non-positive size is rejected."""
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize=0)
+        with self.assertRaises(ValueError):
+            LRUCache(ttl=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
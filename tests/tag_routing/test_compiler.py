@@ -0,0 +1,89 @@
+"""
+Unit tests for the Tag Expression Compiler.
+"""
+
+import random
+import unittest
+from smart_notification_router.tag_routing.parser import TagExpressionParser, TagLiteral
+from smart_notification_router.tag_routing.compiler import (
+    CompiledExpression, compile_tree, compile_expression
+)
+
+
+class TestTagExpressionCompiler(unittest.TestCase):
+    """Test cases for compiling parse trees into flat evaluators."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.parser = TagExpressionParser(max_length=100000)
+    
+    def test_compile_and_expression(self):
+        """Test compiling an AND expression."""
+        compiled = compile_tree(self.parser.parse("user:john+device:mobile"))
+        
+        self.assertTrue(compiled.matches(frozenset(["user:john", "device:mobile"])))
+        self.assertFalse(compiled.matches(frozenset(["user:john"])))
+        self.assertEqual(compiled.tags, frozenset(["user:john", "device:mobile"]))
+    
+    def test_evaluate_accepts_lists(self):
+        """Test that evaluate() accepts plain tag lists."""
+        compiled = compile_tree(self.parser.parse("area:home-area:bedroom"))
+        
+        self.assertTrue(compiled.evaluate(["area:home", "area:kitchen"]))
+        self.assertFalse(compiled.evaluate(["area:home", "area:bedroom"]))
+    
+    def test_wildcard_literal(self):
+        """Test that the '*' literal matches every entity."""
+        compiled = compile_tree(TagLiteral("*"))
+        self.assertTrue(compiled.matches(frozenset()))
+    
+    def test_matches_reference_evaluation(self):
+        """Test that compiled results equal TagNode.evaluate() on random input."""
+        rng = random.Random(7)
+        tags = [f"tag:t{i}" for i in range(6)]
+        
+        def generate(depth):
+            if depth == 0 or rng.random() < 0.3:
+                return rng.choice(tags)
+            left, right = generate(depth - 1), generate(depth - 1)
+            if rng.random() < 0.3:
+                right = f"({right})"
+            return f"{left}{rng.choice('+|-')}{right}"
+        
+        for _ in range(200):
+            tree = self.parser.parse(generate(4))
+            compiled = compile_tree(tree)
+            for _ in range(10):
+                entity_tags = [tag for tag in tags if rng.random() < 0.5]
+                self.assertEqual(
+                    compiled.evaluate(entity_tags), tree.evaluate(entity_tags)
+                )
+    
+    def test_long_expression(self):
+        """Test compiling an expression with thousands of terms."""
+        expression = "|".join(f"user:u{i}" for i in range(3000))
+        compiled = compile_tree(self.parser.parse(expression))
+        
+        self.assertTrue(compiled.matches(frozenset(["user:u2999"])))
+        self.assertFalse(compiled.matches(frozenset(["user:other"])))
+    
+    def test_compile_expression_is_cached(self):
+        """Test that compiled expressions are cached by normalized string."""
+        first = compile_expression("user:john|device:compiled_cache")
+        second = compile_expression(" user:john|device:compiled_cache")
+        
+        self.assertIsInstance(first, CompiledExpression)
+        self.assertIs(first, second)
+    
+    def test_empty_plan_does_not_accept_bang(self):
+        """Test that a cached expression matching nothing does not make "!" valid."""
+        empty = compile_expression("user:john-*")
+        
+        self.assertFalse(empty.matches(frozenset(["user:john"])))
+        self.assertIs(compile_expression("user:jane-*"), empty)
+        with self.assertRaises(ValueError):
+            compile_expression("!")
+
+
+if __name__ == "__main__":
+    unittest.main()
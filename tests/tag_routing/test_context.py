@@ -0,0 +1,170 @@
+"""
+Unit tests for the per-notification routing context snapshot.
+"""
+
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.compiler import compile_expression
+from smart_notification_router.tag_routing.context import RoutingContext
+from smart_notification_router.tag_routing.resolution import ContextResolver
+from smart_notification_router.tag_routing.routing import RoutingEngine
+
+
+class FakeClient:
+    """API client stub with one user owning many devices."""
+
+    def __init__(self, device_count):
+        self.tags = {"person.john": ["user:john"]}
+        for i in range(device_count):
+            self.tags[f"mobile_app.john_{i}"] = ["user:john", "device:mobile"]
+        self.bulk_requests = 0
+        self.single_requests = 0
+        self.expression_lookups = 0
+
+    def _state(self, entity_id):
+        return {
+            "entity_id": entity_id,
+            "state": "home",
+            "attributes": {"tags": self.tags[entity_id]}
+        }
+
+    def get_entities_by_tag_expression(self, expression):
+        self.expression_lookups += 1
+        compiled = compile_expression(expression)
+        return sorted(entity_id for entity_id, tags in self.tags.items() if compiled.evaluate(tags))
+
+    def get_entity_states(self, entity_ids=None):
+        self.bulk_requests += 1
+        return {entity_id: self._state(entity_id) for entity_id in entity_ids if entity_id in self.tags}
+
+    def get_entity_state(self, entity_id):
+        self.single_requests += 1
+        return self._state(entity_id) if entity_id in self.tags else None
+
+
+class TestRoutingContext(unittest.TestCase):
+    """Test cases for the RoutingContext snapshot."""
+
+    def test_states_fetched_once(self):
+        """Test that states are fetched in bulk and only once."""
+        client = FakeClient(3)
+        context = RoutingContext(client)
+
+        context.prefetch_states(["person.john", "mobile_app.john_0", "person.unknown"])
+        context.prefetch_states(["person.john"])
+
+        self.assertEqual(context.get_state("person.john")["state"], "home")
+        self.assertIsNone(context.get_state("person.unknown"))
+        self.assertEqual(client.bulk_requests, 1)
+        self.assertEqual(context.state_requests, 1)
+
+    def test_expressions_resolved_once(self):
+        """Test that repeated expressions are resolved from the snapshot."""
+        client = FakeClient(3)
+        context = RoutingContext(client)
+
+        first = context.resolve("user:john+device:mobile")
+        second = context.resolve("user:john+device:mobile")
+
+        self.assertIs(first, second)
+        self.assertEqual(client.expression_lookups, 1)
+
+
+class TestRoutingRoundTrips(unittest.TestCase):
+    """Test cases for the number of Home Assistant requests per notification."""
+
+    def route(self, device_count):
+        client = FakeClient(device_count)
+        engine = RoutingEngine(None, ContextResolver(client), client, {"enable_deduplication": False})
+        result = engine.route_notification(
+            {"title": "Test", "message": "Hello", "severity": "high"}, "user:john"
+        )
+        return client, result
+
+    def test_constant_requests(self):
+        """Test that state requests do not grow with the number of devices."""
+        small_client, small = self.route(2)
+        large_client, large = self.route(50)
+
+        self.assertTrue(large["success"])
+        self.assertEqual(len(large["services"]), 50)
+        self.assertEqual(small_client.bulk_requests, large_client.bulk_requests)
+        self.assertEqual(large_client.single_requests, 0)
+        self.assertLessEqual(large["state_requests"], 2)
+
+
+class HouseholdClient(FakeClient):
+    """API client stub with several users owning one phone each."""
+
+    def __init__(self, users):
+        super().__init__(0)
+        self.tags = {}
+        for user in users:
+            self.tags[f"person.{user}"] = [f"user:{user}"]
+            self.tags[f"mobile_app.{user}_phone"] = [f"user:{user}", "device:mobile", "priority:high"]
+
+
+class SlowContextResolver(ContextResolver):
+    """Context resolver taking a fixed time per user, or longer for some users."""
+
+    def __init__(self, client, delay, slow_users=(), slow_delay=0):
+        super().__init__(client)
+        self.delay = delay
+        self.slow_users = slow_users
+        self.slow_delay = slow_delay
+        self.threads = set()
+
+    def get_best_notification_targets(self, user_id, severity, context=None):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.slow_delay if user_id in self.slow_users else self.delay)
+        return super().get_best_notification_targets(user_id, severity, context)
+
+
+class TestParallelUserResolution(unittest.TestCase):
+    """Test cases for resolving the targets of several users concurrently."""
+
+    users = ["zoe", "adam", "mia", "bob", "eve", "liam"]
+
+    def route(self, resolver, config=None):
+        config = dict(config or {}, enable_deduplication=False)
+        engine = RoutingEngine(None, resolver, resolver.ha_client, config)
+        self.addCleanup(engine.shutdown)
+        return engine.route_notification(
+            {"title": "Test", "message": "Hello", "severity": "high"}, "priority:high"
+        )
+
+    def test_matches_sequential_order(self):
+        """Test that services are merged in the order users were found."""
+        client = HouseholdClient(self.users)
+        parallel = self.route(SlowContextResolver(client, 0.01))
+        sequential = self.route(SlowContextResolver(client, 0.01), {"resolution_workers": 1})
+
+        self.assertEqual(parallel["services"], sequential["services"])
+        self.assertEqual(parallel["services"],
+                         [f"mobile_app_{user}_phone" for user in sorted(self.users)])
+
+    def test_users_resolved_concurrently(self):
+        """Test that latency follows the slowest user, not the sum over users."""
+        resolver = SlowContextResolver(HouseholdClient(self.users), 0.2)
+
+        started = time.monotonic()
+        result = self.route(resolver)
+
+        self.assertTrue(result["success"])
+        self.assertLess(time.monotonic() - started, 0.2 * len(self.users) / 2)
+        self.assertGreater(len(resolver.threads), 1)
+
+    def test_deadline_skips_slow_users(self):
+        """Test that users missing the deadline are skipped and reported."""
+        resolver = SlowContextResolver(HouseholdClient(self.users), 0, ["mia"], 1.0)
+
+        result = self.route(resolver, {"resolution_deadline": 0.3})
+
+        self.assertEqual(result["timed_out_users"], ["mia"])
+        self.assertNotIn("mobile_app_mia_phone", result["services"])
+        self.assertEqual(len(result["services"]), len(self.users) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
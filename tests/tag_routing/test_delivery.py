@@ -0,0 +1,163 @@
+"""
+Unit tests for the asynchronous delivery queue.
+"""
+
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.delivery import DeliveryQueue
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+
+
+class TestDeliveryQueue(unittest.TestCase):
+    """Test cases for the DeliveryQueue class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.release = threading.Event()
+        self.release.set()
+        self.completed = []
+        self.queue = DeliveryQueue(self.deliver, workers=2, max_records=3,
+                                   on_complete=self.completed.append)
+        self.addCleanup(self.queue.shutdown)
+        self.addCleanup(self.release.set)
+
+    def deliver(self, services, payload):
+        self.release.wait()
+        if "notify.crash" in services:
+            raise RuntimeError("connection reset")
+        return {service: {"error": "unavailable"} if service == "notify.broken" else {"result": "ok"}
+                for service in services}
+
+    def submit(self, services, **kwargs):
+        return self.queue.submit(services, NotificationPayload("Door", "Opened"), **kwargs)
+
+    def test_submit_returns_immediately(self):
+        """Test that submission does not wait for delivery."""
+        self.release.clear()
+
+        tracking_id = self.submit(["notify.phone"])
+
+        self.assertEqual(self.queue.get_status(tracking_id)["status"], "queued")
+        self.assertEqual(self.queue.get_status(tracking_id)["services"],
+                         {"notify.phone": {"status": "pending"}})
+        self.release.set()
+        self.queue.join()
+        self.assertEqual(self.queue.get_status(tracking_id)["status"], "delivered")
+
+    def test_per_service_results(self):
+        """Test partial delivery with per-service results."""
+        tracking_id = self.submit(["notify.phone", "notify.broken"], tracking_id="abc")
+        self.queue.join()
+
+        status = self.queue.get_status("abc")
+        self.assertEqual(tracking_id, "abc")
+        self.assertEqual(status["status"], "partial")
+        self.assertEqual(status["services"]["notify.phone"], {"status": "sent"})
+        self.assertEqual(status["services"]["notify.broken"], {"status": "failed", "error": "unavailable"})
+        self.assertIsNotNone(status["completed_at"])
+        self.assertEqual([record.tracking_id for record in self.completed], ["abc"])
+
+    def test_delivery_exception(self):
+        """Test that an exception fails every service of the notification."""
+        tracking_id = self.submit(["notify.crash", "notify.phone"])
+        self.queue.join()
+
+        status = self.queue.get_status(tracking_id)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["services"]["notify.phone"]["error"], "connection reset")
+
+    def test_unknown_tracking_id(self):
+        """Test looking up an unknown tracking ID."""
+        self.assertIsNone(self.queue.get_status("missing"))
+
+    def test_records_are_bounded(self):
+        """Test that only the newest finished records are kept."""
+        tracking_ids = [self.submit(["notify.phone"]) for _ in range(5)]
+        self.queue.join()
+        self.submit(["notify.phone"])
+        self.queue.join()
+
+        self.assertIsNone(self.queue.get_status(tracking_ids[0]))
+        self.assertIsNotNone(self.queue.get_status(tracking_ids[-1]))
+        self.assertLessEqual(self.queue.stats()["records"], 3)
+        self.assertEqual(self.queue.stats()["completed"], 6)
+
+    def test_invalid_workers(self):
+        """Test that a queue needs at least one worker."""
+        with self.assertRaises(ValueError):
+            DeliveryQueue(self.deliver, workers=0)
+
+
+
+class TestPriorityScheduling(unittest.TestCase):
+    """Test cases for severity-ordered delivery."""
+
+    RANKS = {"low": 0, "medium": 1, "high": 2, "emergency": 3}
+
+    def setUp(self):
+        """Set up test environment."""
+        self.release = threading.Event()
+        self.order = []
+
+    def deliver(self, services, payload):
+        self.release.wait()
+        self.order.append(payload.title)
+        return {service: {"result": "ok"} for service in services}
+
+    def open_queue(self, **kwargs):
+        delivery_queue = DeliveryQueue(self.deliver, workers=1, rank=self.RANKS.get, **kwargs)
+        self.addCleanup(delivery_queue.shutdown)
+        self.addCleanup(self.release.set)
+        return delivery_queue
+
+    def submit(self, delivery_queue, title, severity):
+        delivery_queue.submit(["notify.phone"], NotificationPayload(title, "message"), severity=severity)
+
+    def test_most_severe_first(self):
+        """Test that queued emergencies overtake queued low-severity work."""
+        delivery_queue = self.open_queue()
+        self.submit(delivery_queue, "blocking", "low")
+        time.sleep(0.05)
+        for n in range(3):
+            self.submit(delivery_queue, f"low-{n}", "low")
+        self.submit(delivery_queue, "high", "high")
+        self.submit(delivery_queue, "emergency", "emergency")
+        self.submit(delivery_queue, "unknown", "urgent")
+
+        self.release.set()
+        delivery_queue.join()
+
+        self.assertEqual(self.order, ["blocking", "emergency", "high", "low-0", "low-1", "low-2", "unknown"])
+        latency = delivery_queue.stats()["latency"]
+        self.assertEqual(latency["low"]["count"], 4)
+        self.assertLessEqual(latency["emergency"]["p99_ms"], latency["low"]["max_ms"])
+
+    def test_aging(self):
+        """Test that work waiting long enough is not overtaken."""
+        delivery_queue = self.open_queue(aging_interval=0.01)
+        self.submit(delivery_queue, "blocking", "low")
+        time.sleep(0.05)
+        self.submit(delivery_queue, "old", "low")
+        time.sleep(0.1)
+        self.submit(delivery_queue, "emergency", "emergency")
+
+        self.release.set()
+        delivery_queue.join()
+
+        self.assertEqual(self.order, ["blocking", "old", "emergency"])
+
+    def test_fifo_without_ranks(self):
+        """Test that notifications are delivered in order without a rank function."""
+        delivery_queue = DeliveryQueue(self.deliver, workers=1)
+        self.addCleanup(delivery_queue.shutdown)
+        self.release.set()
+        for title, severity in [("a", "low"), ("b", "emergency"), ("c", None)]:
+            self.submit(delivery_queue, title, severity)
+        delivery_queue.join()
+
+        self.assertEqual(self.order, ["a", "b", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
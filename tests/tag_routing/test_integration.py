@@ -0,0 +1,124 @@
+"""
+Unit tests for wiring the tag routing components together.
+"""
+
+import unittest
+from unittest import mock
+from smart_notification_router.tag_routing import integration
+from smart_notification_router.tag_routing.delivery import DeliveryQueue
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+
+
+class RecordingRouter:
+    """Notification router stub recording service calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def call_services(self, services, payload, max_wait=None):
+        self.calls.append(list(services))
+        return {service: {"result": "ok"} for service in services}
+
+
+class TestInitializeTagRouting(unittest.TestCase):
+    """Test cases for initialize_tag_routing."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.components = integration.initialize_tag_routing({"state_poll_interval": 3600})
+        self.addCleanup(self.components["delivery_queue"].shutdown)
+        self.addCleanup(self.components["state_watcher"].stop)
+        self.context_resolver = self.components["context_resolver"]
+
+    def test_tag_changes_refresh_targets(self):
+        """Test that retagging a user's device drops their targets."""
+        version = self.context_resolver.presence_version
+
+        self.components["entity_manager"].add_tag_to_entity("device_tracker.john_phone", "device:watch")
+
+        self.assertGreater(self.context_resolver.presence_version, version)
+
+    def test_routing_plans_are_cached(self):
+        """Test that expressions resolve against the entity manager's tag index."""
+        self.assertIsNotNone(self.components["tag_resolver"].version)
+
+        self.components["entity_manager"].add_tag_to_entity("device_tracker.john_phone", "device:watch")
+
+        self.assertIn("device_tracker.john_phone",
+                      self.components["tag_resolver"].resolve_expression("device:watch"))
+
+    def test_presence_changes_refresh_targets(self):
+        """Test that a polled person state change drops that user's targets."""
+        ha_client = self.components["ha_client"]
+        states = ha_client.get_entity_states()
+        states["person.john"] = dict(states["person.john"], state="not_home")
+        ha_client.get_entity_states = lambda entity_ids=None: dict(states)
+        version = self.context_resolver.presence_version
+
+        self.components["state_watcher"].poll()
+
+        self.assertGreater(self.context_resolver.presence_version, version)
+
+    def test_new_entities_join_tag_index(self):
+        """Test that an entity first seen by a poll is resolved by tag expressions."""
+        ha_client = self.components["ha_client"]
+        states = ha_client.get_entity_states()
+        states["sensor.hall_tablet"] = {"entity_id": "sensor.hall_tablet", "state": "on", "attributes": {}}
+        ha_client.get_entity_states = lambda entity_ids=None: dict(states)
+
+        self.components["state_watcher"].poll()
+
+        self.assertIn("sensor.hall_tablet", self.components["tag_resolver"].resolve_expression("*-user:john"))
+    
+    def test_state_changes_update_service_map(self):
+        """Test that polled entity and service changes remap entities."""
+        ha_client = self.components["ha_client"]
+        service_map = self.components["routing_engine"].service_map
+        states = ha_client.get_entity_states()
+        states["sensor.hall_tablet"] = {"entity_id": "sensor.hall_tablet", "state": "on", "attributes": {}}
+        services = [{"domain": "notify", "services": {"hall_tablet": {}}}]
+        ha_client.get_entity_states = lambda entity_ids=None: dict(states)
+        ha_client.get_services = lambda: list(services)
+
+        self.components["state_watcher"].poll()
+        self.assertEqual(service_map.get("sensor.hall_tablet"), "hall_tablet")
+
+        del states["sensor.hall_tablet"]
+        self.components["state_watcher"].poll()
+        self.assertNotIn("sensor.hall_tablet", service_map)
+
+
+class TestSharedNotificationRouter(unittest.TestCase):
+    """Test cases for delivering queued notifications through the application's router."""
+
+    def test_app_router_is_used(self):
+        """Test that queued notifications are sent by the router passed in."""
+        router = RecordingRouter()
+        components = integration.initialize_tag_routing({"state_poll_interval": 3600}, router)
+        self.addCleanup(components["delivery_queue"].shutdown)
+        self.addCleanup(components["state_watcher"].stop)
+
+        components["delivery_queue"].submit(["notify.phone"], NotificationPayload("Door", "Opened"))
+        components["delivery_queue"].join()
+
+        self.assertIs(components["notification_router"], router)
+        self.assertEqual(router.calls, [["notify.phone"]])
+
+    def test_app_queue_is_used(self):
+        """Test that the queue passed in is shared rather than a second one replayed."""
+        router = RecordingRouter()
+        queue = DeliveryQueue(router.call_services, workers=1)
+        self.addCleanup(queue.shutdown)
+        with mock.patch.object(integration, "DeliveryStore") as store, \
+                mock.patch.object(DeliveryQueue, "replay") as replay:
+            components = integration.initialize_tag_routing(
+                {"state_poll_interval": 3600, "delivery_store": "unused.db"}, router, queue)
+        self.addCleanup(components["state_watcher"].stop)
+
+        self.assertIs(components["delivery_queue"], queue)
+        store.assert_not_called()
+        replay.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
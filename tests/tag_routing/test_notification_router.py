@@ -0,0 +1,127 @@
+"""
+Unit tests for the Notification Router.
+"""
+
+import json
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.ha_client import HomeAssistantAPIClient, NotificationPayload
+from smart_notification_router.tag_routing.notification_router import NotificationRouter
+
+CONFIG = {
+    "severity_levels": ["low", "medium", "high", "emergency"],
+    "audiences": {
+        "mobile": {"services": ["notify.phone", "notify.watch", "notify.slow"], "min_severity": "low"},
+        "home": {"services": ["notify.watch", "notify.broken", "persistent_notification.create"],
+                 "min_severity": "low"}
+    }
+}
+
+
+class SlowClient:
+    """API client stub with configurable delays and failures per service."""
+
+    def __init__(self, delays=None, failures=()):
+        self.delays = delays or {}
+        self.failures = failures
+        self.calls = []
+        self.payloads = set()
+        self.lock = threading.Lock()
+
+    def send_notification(self, service_name, title, message, data=None, payload=None):
+        with self.lock:
+            self.calls.append(service_name)
+            self.payloads.add(id(payload))
+        time.sleep(self.delays.get(service_name, 0))
+        if service_name in self.failures:
+            return {"error": "unavailable"}
+        return {"result": "ok"}
+
+
+class TestNotificationPayload(unittest.TestCase):
+    """Test cases for the NotificationPayload class."""
+
+    def test_shapes(self):
+        """Test notify and non-notify payload shapes."""
+        payload = NotificationPayload("Door", "Opened", {"priority": "high"})
+
+        notify_data, notify_body = payload.for_domain("notify")
+        other_data, other_body = payload.for_domain("persistent_notification")
+
+        self.assertEqual(notify_data, {"title": "Door", "message": "Opened", "data": {"priority": "high"}})
+        self.assertEqual(other_data, {"title": "Door", "message": "Opened", "priority": "high"})
+        self.assertEqual(json.loads(notify_body), notify_data)
+        self.assertIs(payload.for_domain("notify")[1], notify_body)
+        self.assertEqual(json.loads(other_body), other_data)
+
+    def test_demo_client(self):
+        """Test sending through the demo client with a shared payload."""
+        client = HomeAssistantAPIClient(demo_mode=True)
+        payload = NotificationPayload("Door", "Opened")
+
+        self.assertEqual(client.send_notification("notify.phone", "Door", "Opened", payload=payload)["result"], "ok")
+        self.assertIn("error", client.send_notification("invalid", "Door", "Opened"))
+
+
+class TestConcurrentFanOut(unittest.TestCase):
+    """Test cases for calling the services of one notification concurrently."""
+
+    def route(self, client, audiences=("mobile", "home")):
+        router = NotificationRouter(client, CONFIG)
+        self.addCleanup(router.shutdown)
+        return router.route_notification("Door", "Opened", "high", list(audiences))
+
+    def test_latency_bounded_by_slowest_call(self):
+        """Test that services are called concurrently."""
+        client = SlowClient({"notify.phone": 0.2, "notify.watch": 0.2, "notify.slow": 0.3,
+                             "notify.broken": 0.2, "persistent_notification.create": 0.2})
+
+        started = time.monotonic()
+        result = self.route(client)
+
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertTrue(result["success"])
+
+    def test_result_shape(self):
+        """Test the result with duplicates and failures across audiences."""
+        client = SlowClient({"notify.phone": 0.05}, failures=("notify.broken",))
+
+        result = self.route(client)
+
+        self.assertEqual(result["sent_to_services"],
+                         ["notify.phone", "notify.watch", "notify.slow", "persistent_notification.create"])
+        self.assertEqual(result["failed_services"], [{"service": "notify.broken", "error": "unavailable"}])
+        self.assertEqual(result["audiences_processed"][0]["services_called"],
+                         ["notify.phone", "notify.watch", "notify.slow"])
+        self.assertEqual(result["audiences_processed"][1]["services_called"],
+                         ["persistent_notification.create"])
+        self.assertEqual(result["audiences_processed"][1]["services_skipped"], ["notify.watch"])
+        self.assertEqual(sorted(client.calls), sorted(set(client.calls)))
+        self.assertEqual(len(client.payloads), 1)
+
+    def test_all_failed(self):
+        """Test that the result reports failure when every call fails."""
+        client = SlowClient(failures=("notify.phone", "notify.watch", "notify.slow"))
+
+        result = self.route(client, ["mobile"])
+
+        self.assertFalse(result["success"])
+        self.assertEqual(len(result["failed_services"]), 3)
+
+    def test_exceptions_reported(self):
+        """Test that a raising service call is reported as failed."""
+        class RaisingClient(SlowClient):
+            def send_notification(self, service_name, *args, **kwargs):
+                if service_name == "notify.watch":
+                    raise RuntimeError("boom")
+                return super().send_notification(service_name, *args, **kwargs)
+
+        result = self.route(RaisingClient(), ["mobile"])
+
+        self.assertEqual(result["failed_services"], [{"service": "notify.watch", "error": "boom"}])
+        self.assertEqual(result["sent_to_services"], ["notify.phone", "notify.slow"])
+
+
+if __name__ == '__main__':
+    unittest.main()
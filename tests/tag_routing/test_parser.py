@@ -4,7 +4,8 @@ Unit tests for the Tag Expression Parser.
 
 import unittest
 from smart_notification_router.tag_routing.parser import (
-    TagExpressionParser, TagLiteral, TagOperator, OperatorType
+    TagExpressionParser, TagLiteral, TagOperator, TagPrefix, OperatorType,
+    parse_expression, get_parse_cache
 )
 
 
@@ -126,6 +127,72 @@ class TestTagExpressionParser(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.parser.parse("+user:john")
     
+    def test_parse_whitespace_and_parentheses(self):
+        """Test parsing with whitespace and parenthesized groups."""
+        result = self.parser.parse(" ( user:john | user:jane ) + device:mobile ")
+        
+        self.assertIsInstance(result, TagOperator)
+        self.assertEqual(result.operator_type, OperatorType.AND)
+        self.assertEqual(result.left.operator_type, OperatorType.OR)
+        self.assertEqual(result.left.left.tag, "user:john")
+        self.assertEqual(result.left.right.tag, "user:jane")
+        self.assertEqual(result.right.tag, "device:mobile")
+    
+    def test_parse_is_left_associative(self):
+        """Test that chains of the same operator group from the left."""
+        result = self.parser.parse("area:home-area:bedroom-area:office")
+        
+        self.assertEqual(result.operator_type, OperatorType.NOT)
+        self.assertEqual(result.right.tag, "area:office")
+        self.assertEqual(result.left.operator_type, OperatorType.NOT)
+        self.assertEqual(result.left.left.tag, "area:home")
+        self.assertEqual(result.left.right.tag, "area:bedroom")
+    
+    def test_parse_long_expression(self):
+        """Test parsing an expression with hundreds of terms."""
+        tags = [f"user:u{i}" for i in range(300)]
+        result = self.parser.parse("|".join(tags))
+        
+        self.assertEqual(result.operator_type, OperatorType.OR)
+        self.assertEqual(result.right.tag, "user:u299")
+        self.assertTrue(result.evaluate(["user:u0"]))
+    
+    def test_invalid_structure(self):
+        """Test that malformed operator and parenthesis usage is rejected."""
+        for expression in ["user:john+|user:jane", "(user:john", "user:john)",
+                           "user:john user:jane", "()", "-user:john"]:
+            with self.assertRaises(ValueError, msg=expression):
+                self.parser.parse(expression)
+    
+    def test_length_and_depth_limits(self):
+        """Test that configured length and nesting limits are enforced."""
+        parser = TagExpressionParser(max_length=20, max_depth=2)
+        
+        with self.assertRaises(ValueError):
+            parser.parse("user:john+device:mobile")
+        
+        self.assertIsInstance(parser.parse("((user:john))"), TagLiteral)
+        with self.assertRaises(ValueError):
+            parser.parse("(((user:john)))")
+    
+    def test_parse_wildcard_tags(self):
+        """Test parsing namespace and value prefix wildcards."""
+        result = self.parser.parse("user:john+device:*")
+        
+        self.assertIsInstance(result.right, TagPrefix)
+        self.assertEqual(result.right.prefix, "device:")
+        self.assertEqual(result.right.to_dict(), {"type": "prefix", "value": "device:*"})
+        
+        result = self.parser.parse("area:bed*")
+        self.assertIsInstance(result, TagPrefix)
+        self.assertTrue(result.evaluate(["area:bedroom"]))
+        self.assertFalse(result.evaluate(["area:bathroom"]))
+        
+        self.assertIsInstance(self.parser.parse("*"), TagLiteral)
+        for expression in ["device*", "*:mobile", "device:mo*bile", "device:**"]:
+            with self.assertRaises(ValueError, msg=expression):
+                self.parser.parse(expression)
+    
     def test_evaluate_single_tag(self):
         """Test evaluating a single tag expression."""
         expression = "user:john"
@@ -237,5 +304,37 @@ class TestTagExpressionParser(unittest.TestCase):
         self.assertEqual(dict_repr["right"]["value"], "device:mobile")
 
 
+class TestParseCache(unittest.TestCase):
+    """Test cases for the process-wide parse tree cache."""
+    
+    def test_cached_tree_is_shared(self):
+        """Test that equivalent expressions reuse the same parse tree."""
+        first = parse_expression("user:john+device:cache_test")
+        second = parse_expression("  user:john+device:cache_test ")
+        self.assertIs(first, second)
+    
+    def test_cache_counts_hits(self):
+        """Test that repeated lookups are counted as hits."""
+        cache = get_parse_cache()
+        parse_expression("user:jane|user:cache_hits")
+        hits_before = cache.stats()["hits"]
+        parse_expression("user:jane|user:cache_hits")
+        self.assertEqual(cache.stats()["hits"], hits_before + 1)
+    
+    def test_invalid_expression_not_cached(self):
+        """Test that invalid expressions raise and are not cached."""
+        with self.assertRaises(ValueError):
+            parse_expression("user:john+")
+        self.assertNotIn("user:john+", get_parse_cache())
+    
+    def test_nodes_are_immutable(self):
+        """Test that shared parse trees cannot be modified."""
+        tree = parse_expression("user:john+device:mobile")
+        with self.assertRaises(AttributeError):
+            tree.left = TagLiteral("user:jane")
+        with self.assertRaises(AttributeError):
+            tree.left.tag = "user:jane"
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Unit tests for service rate limiting.
+"""
+
+import functools
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.delivery import DeliveryQueue
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+from smart_notification_router.tag_routing.notification_router import NotificationRouter
+from smart_notification_router.tag_routing.rate_limit import RateLimiter, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the TokenBucket class."""
+
+    def test_burst_then_paced(self):
+        """Test that reservations beyond the burst are spaced at the rate."""
+        bucket = TokenBucket(rate=10, burst=2)
+
+        delays = [bucket.reserve() for _ in range(4)]
+
+        self.assertEqual(delays[:2], [0.0, 0.0])
+        self.assertAlmostEqual(delays[2], 0.1, places=2)
+        self.assertAlmostEqual(delays[3], 0.2, places=2)
+
+    def test_refill(self):
+        """Test that tokens are refilled over time up to the burst."""
+        bucket = TokenBucket(rate=100, burst=1)
+        bucket.reserve()
+        time.sleep(0.05)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertGreater(bucket.reserve(), 0.0)
+
+    def test_configure_keeps_tokens(self):
+        """Test that changing the limit does not refill the bucket."""
+        bucket = TokenBucket(rate=10, burst=2)
+        bucket.reserve()
+        bucket.reserve()
+
+        bucket.configure(rate=20, burst=4)
+
+        self.assertAlmostEqual(bucket.wait_time(), 0.05, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.05, places=2)
+
+    def test_invalid_rate(self):
+        """Test that a bucket needs a positive rate."""
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the RateLimiter class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.limiter = RateLimiter({
+            "domains": {"tts": {"rate": 10, "burst": 1}},
+            "services": {"notify.telegram": {"rate": 10, "burst": 1}, "notify.bad": {"burst": 1}}
+        })
+
+    def test_unlimited_services(self):
+        """Test that services without limits are never delayed or tracked."""
+        self.assertEqual([self.limiter.reserve("notify.phone") for _ in range(5)], [0.0] * 5)
+        self.assertEqual(self.limiter.reserve("notify.bad"), 0.0)
+        self.assertEqual(self.limiter.stats(), {})
+
+    def test_domain_limit_shared(self):
+        """Test that services of a limited domain share its bucket."""
+        self.assertEqual(self.limiter.reserve("tts.google_say"), 0.0)
+        self.assertGreater(self.limiter.reserve("tts.cloud_say"), 0.0)
+
+    def test_stats(self):
+        """Test waiting counts and wait times per service."""
+        self.limiter.reserve("notify.telegram")
+        self.limiter.reserve("notify.telegram")
+        self.limiter.reserve("notify.telegram")
+        self.limiter.started("notify.telegram")
+
+        stats = self.limiter.stats()["notify.telegram"]
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["delayed"], 2)
+        self.assertEqual(stats["waiting"], 1)
+        self.assertAlmostEqual(stats["max_wait_ms"], 200, delta=5)
+
+    def test_reservations_capped(self):
+        """Test that slots beyond max_delay are not reserved."""
+        limiter = RateLimiter({"max_delay": 0.25, "services": {"notify.telegram": {"rate": 10, "burst": 1}}})
+
+        delays = [limiter.reserve("notify.telegram") for _ in range(5)]
+
+        self.assertEqual(delays[0], 0.0)
+        self.assertLessEqual(max(delays[:3]), 0.25)
+        self.assertGreater(delays[3], 0.25)
+        # Refused reservations leave the next slot where it was
+        self.assertAlmostEqual(delays[4], delays[3], places=2)
+        self.assertGreater(limiter.reserve("notify.telegram", max_delay=0), 0.0)
+        stats = limiter.stats()["notify.telegram"]
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["deferred"], 3)
+
+    def test_update_config_keeps_buckets(self):
+        """Test that reloading the configuration keeps the state of unchanged limits."""
+        self.limiter.reserve("notify.telegram")
+
+        self.limiter.update_config({
+            "domains": {"tts": {"rate": 10, "burst": 1}},
+            "services": {"notify.telegram": {"rate": 10, "burst": 1}}
+        })
+        self.assertGreater(self.limiter.reserve("notify.telegram"), 0.0)
+
+        self.limiter.update_config({"services": {"notify.telegram": {"rate": 10, "burst": 1}}})
+        self.assertEqual([self.limiter.reserve("tts.google_say") for _ in range(2)], [0.0, 0.0])
+
+
+class TestRateLimitedRouting(unittest.TestCase):
+    """Test cases for rate-limited service calls in the NotificationRouter."""
+
+    def test_burst_delayed_not_failed(self):
+        """Test that a burst to a limited service is paced and fully delivered."""
+        calls = []
+        lock = threading.Lock()
+
+        class Client:
+            def send_notification(self, service_name, title, message, data=None, payload=None):
+                with lock:
+                    calls.append((service_name, time.monotonic()))
+                return {"result": "ok"}
+
+        router = NotificationRouter(Client(), {
+            "rate_limits": {"services": {"notify.telegram": {"rate": 20, "burst": 1}}}
+        })
+        self.addCleanup(router.shutdown)
+        payload = NotificationPayload("Door", "Opened")
+
+        started = time.monotonic()
+        results = [router.call_services(["notify.telegram", "notify.phone"], payload) for _ in range(4)]
+
+        self.assertTrue(all("error" not in response for result in results for response in result.values()))
+        telegram = [at for service_name, at in calls if service_name == "notify.telegram"]
+        self.assertGreaterEqual(telegram[-1] - started, 0.14)
+        self.assertEqual(router.get_rate_limit_stats()["notify.telegram"]["delayed"], 3)
+        self.assertEqual(router.get_rate_limit_stats()["notify.telegram"]["waiting"], 0)
+        self.assertNotIn("notify.phone", router.get_rate_limit_stats())
+
+    def test_deferred_calls(self):
+        """Test that calls without a slot within max_wait are not made."""
+        calls = []
+
+        class Client:
+            def send_notification(self, service_name, title, message, data=None, payload=None):
+                calls.append(service_name)
+                return {"result": "ok"}
+
+        router = NotificationRouter(Client(), {"rate_limits": {"domains": {"tts": {"rate": 1, "burst": 1}}}})
+        self.addCleanup(router.shutdown)
+        payload = NotificationPayload("Door", "Opened")
+        router.call_services(["tts.speak"], payload, max_wait=0)
+
+        responses = router.call_services(["tts.speak", "notify.phone"], payload, max_wait=0)
+
+        self.assertEqual(calls, ["tts.speak", "notify.phone"])
+        self.assertEqual(responses["notify.phone"], {"result": "ok"})
+        self.assertEqual(responses["tts.speak"]["error"], "Rate limited")
+        self.assertAlmostEqual(responses["tts.speak"]["retry_after"], 1.0, places=1)
+
+    def test_reload_keeps_buckets(self):
+        """Test that a configuration reload does not refill the buckets."""
+        config = {"rate_limits": {"domains": {"tts": {"rate": 1, "burst": 1}}}}
+        router = NotificationRouter(None, config)
+        router.rate_limiter.reserve("tts.speak")
+
+        router.update_config(dict(config))
+
+        self.assertGreater(router.rate_limiter.reserve("tts.speak", max_delay=0), 0.0)
+
+
+class TestRateLimitedDeliveryQueue(unittest.TestCase):
+    """Test cases for rate-limited calls made by DeliveryQueue workers."""
+
+    def test_backlog_does_not_block_workers(self):
+        """Test that a paced backlog leaves the worker free for other notifications."""
+        calls = []
+        lock = threading.Lock()
+
+        class Client:
+            def send_notification(self, service_name, title, message, data=None, payload=None):
+                with lock:
+                    calls.append(service_name)
+                return {"result": "ok"}
+
+        router = NotificationRouter(Client(), {
+            "severity_levels": ["low", "emergency"],
+            "rate_limits": {"domains": {"tts": {"rate": 20, "burst": 1}}}
+        })
+        self.addCleanup(router.shutdown)
+        delivery_queue = DeliveryQueue(functools.partial(router.call_services, max_wait=0), workers=1,
+                                       rank=router.get_severity_level_index)
+        self.addCleanup(delivery_queue.shutdown)
+
+        tracking_ids = [delivery_queue.submit(["tts.speak"], NotificationPayload("Laundry", "Done"),
+                                              severity="low") for _ in range(5)]
+        delivery_queue.submit(["notify.phone"], NotificationPayload("Smoke", "Kitchen"), severity="emergency")
+        delivery_queue.join()
+
+        self.assertEqual(calls.count("tts.speak"), 5)
+        self.assertLess(calls.index("notify.phone"), 3)
+        for tracking_id in tracking_ids:
+            self.assertEqual(delivery_queue.get_status(tracking_id)["services"], {"tts.speak": {"status": "sent"}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+"""
+Unit tests for the Tag Resolution Service cache.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing.resolution import (
+    ContextResolver, TagResolutionService, create_resolution_service
+)
+from smart_notification_router.tag_routing.entity_manager import EntityManager
+
+
+class CountingClient:
+    """API client stub counting expression lookups."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    def get_entities_by_tag_expression(self, expression):
+        self.lookups += 1
+        return []
+
+
+class TestResolutionCache(unittest.TestCase):
+    """Test cases for the bounded, TTL-aware resolution cache."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.client = CountingClient()
+        self.service = TagResolutionService(self.client, cache_size=2)
+
+    def test_empty_results_are_cached(self):
+        """Test that empty results are served from the cache."""
+        self.service.resolve_expression("user:nobody")
+        self.service.resolve_expression("user:nobody")
+
+        self.assertEqual(self.client.lookups, 1)
+
+    def test_equivalent_expressions_share_entry(self):
+        """Test that equivalent expressions are resolved once."""
+        self.service.resolve_expression("user:john+device:mobile")
+        self.service.resolve_expression("device:mobile+user:john")
+
+        self.assertEqual(self.client.lookups, 1)
+        self.assertEqual(len(self.service.cache), 1)
+
+    def test_invalid_expressions_are_cached(self):
+        """Test that invalid expressions are rejected from the negative cache."""
+        self.assertEqual(self.service.resolve_expression("user:john+"), [])
+        self.assertEqual(self.service.resolve_expression("user:john+"), [])
+
+        self.assertEqual(self.service.invalid_cache.stats()["hits"], 1)
+        self.assertEqual(self.client.lookups, 0)
+
+    def test_valid_expressions_count_once(self):
+        """Test that resolving a valid expression adds one hit or miss to the result cache."""
+        self.service.resolve_expression("user:john")
+        self.service.resolve_expression("user:john")
+
+        stats = self.service.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_eviction_keeps_fresh_subscription(self):
+        """Test that a late eviction callback does not unsubscribe a view cached after it."""
+        self.service.resolve_expression("user:john")
+        view = self.service.cache.get("user:john")
+
+        # The expired entry was dropped and a fresh view cached before its callback ran
+        self.service._on_evict("user:john", view)
+
+        self.assertIn("user:john", self.service.subscriptions)
+        self.service.cache.pop("user:john")
+        self.service._on_evict("user:john", view)
+        self.assertNotIn("user:john", self.service.subscriptions)
+
+    def test_cache_is_bounded(self):
+        """Test that the cache evicts old entries and stops tracking them."""
+        for user in ["a", "b", "c"]:
+            self.service.resolve_expression(f"user:{user}")
+
+        self.assertEqual(len(self.service.cache), 2)
+        self.assertNotIn("user:a", self.service.subscriptions)
+        self.assertIn("user:c", self.service.subscriptions)
+
+
+class TestIncrementalViews(unittest.TestCase):
+    """Test cases for maintaining cached views on entity tag writes."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.manager = EntityManager(demo_mode=True)
+        self.service = create_resolution_service(self.manager.ha_client, entity_manager=self.manager)
+
+    def test_batch_update_updates_views_in_place(self):
+        """Test that a batch tag write updates affected views without re-evaluation."""
+        first = self.service.resolve_expression("user:batch_a")
+        self.service.resolve_expression("user:batch_b")
+
+        self.manager.batch_update_tags(["light.batch_1", "light.batch_2"], ["user:batch_a"], "add")
+
+        self.assertEqual(first, [])
+        self.assertEqual(self.service.resolve_expression("user:batch_a"),
+                         ["light.batch_1", "light.batch_2"])
+        self.assertEqual(self.service.get_view_version("user:batch_a"), 2)
+        self.assertEqual(self.service.get_view_version("user:batch_b"), 0)
+
+    def test_views_match_full_evaluation(self):
+        """Test that maintained views match a fresh resolution after several writes."""
+        expressions = ["user:view_a+device:*", "user:view_a|user:view_b", "*-user:view_a"]
+        for expression in expressions:
+            self.service.resolve_expression(expression)
+
+        self.manager.set_entity_tags("light.view_1", ["user:view_a", "device:lamp"])
+        self.manager.set_entity_tags("light.view_2", ["user:view_b"])
+        self.manager.set_entity_tags("light.view_1", ["user:view_b"])
+
+        fresh = TagResolutionService(self.manager.ha_client, tag_index=self.manager.tag_index)
+        for expression in expressions:
+            self.assertEqual(self.service.resolve_expression(expression),
+                             fresh.resolve_expression(expression), expression)
+
+    def test_unknown_view_version(self):
+        """Test that uncached and invalid expressions have no view version."""
+        self.assertIsNone(self.service.get_view_version("user:never_resolved"))
+        self.assertIsNone(self.service.get_view_version("user:john+"))
+
+
+class PresenceClient:
+    """API client stub with settable person states."""
+
+    def __init__(self):
+        self.states = {"person.john": {"entity_id": "person.john", "state": "home"}}
+
+    def get_entity_states(self, entity_ids=None):
+        return {entity_id: self.states[entity_id] for entity_id in entity_ids
+                if entity_id in self.states}
+
+
+class TestTargetTable(unittest.TestCase):
+    """Test cases for the materialized per-user target table."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.tag_index = TagIndex()
+        self.tag_index.rebuild({
+            "mobile_app.john_phone": ["user:john", "device:mobile"],
+            "media_player.john_speaker": ["user:john", "device:speaker", "area:home"],
+        })
+        self.client = PresenceClient()
+        self.service = TagResolutionService(self.client, tag_index=self.tag_index)
+        self.resolver = ContextResolver(self.client, self.service)
+
+    def change_tags(self, entity_id, tags):
+        old_tags = self.tag_index.update_entity(entity_id, tags)
+        self.service.on_entity_tags_changed(entity_id, old_tags, tags)
+        self.resolver.on_entity_tags_changed(entity_id, old_tags, frozenset(tags))
+
+    def test_targets_are_reused(self):
+        """Test that repeated lookups are served from the table."""
+        first = self.resolver.get_best_notification_targets("user:john", "normal")
+        second = self.resolver.get_best_notification_targets("user:john", "normal")
+
+        self.assertEqual(first, {"primary": ["media_player.john_speaker"],
+                                 "secondary": ["mobile_app.john_phone"]})
+        self.assertEqual(first, second)
+        self.assertEqual(self.resolver.target_builds, 1)
+        self.assertEqual(self.resolver.target_hits, 1)
+
+    def test_presence_change_rebuilds(self):
+        """Test that a presence change selects the targets for the new presence."""
+        self.resolver.get_best_notification_targets("user:john", "normal")
+        self.client.states["person.john"] = {"entity_id": "person.john", "state": "not_home"}
+
+        targets = self.resolver.get_best_notification_targets("user:john", "normal")
+
+        self.assertEqual(targets, {"primary": ["mobile_app.john_phone"], "secondary": []})
+        self.assertEqual(self.resolver.target_builds, 2)
+
+    def test_high_priority_ignores_presence(self):
+        """Test that high priority targets survive presence changes."""
+        self.resolver.get_best_notification_targets("user:john", "critical")
+        self.client.states["person.john"] = {"entity_id": "person.john", "state": "not_home"}
+        self.resolver.get_best_notification_targets("user:john", "high")
+
+        self.assertEqual(self.resolver.target_builds, 1)
+
+    def test_device_tag_change_rebuilds(self):
+        """Test that retagging one of the user's devices refreshes their targets."""
+        self.resolver.get_best_notification_targets("user:john", "high")
+        self.change_tags("mobile_app.john_tablet", ["user:john", "device:mobile"])
+
+        targets = self.resolver.get_best_notification_targets("user:john", "high")
+
+        self.assertEqual(targets["primary"], ["mobile_app.john_phone", "mobile_app.john_tablet"])
+        self.assertEqual(self.resolver.target_builds, 2)
+
+    def test_other_users_are_kept(self):
+        """Test that changes to another user's devices keep the table entry."""
+        self.resolver.get_best_notification_targets("user:john", "high")
+        self.change_tags("mobile_app.jane_phone", ["user:jane", "device:mobile"])
+        self.resolver.on_presence_changed("person.jane")
+        self.resolver.get_best_notification_targets("user:john", "high")
+
+        self.assertEqual(self.resolver.target_builds, 1)
+
+    def test_returned_targets_are_copies(self):
+        """Test that callers cannot modify the table through the result."""
+        targets = self.resolver.get_best_notification_targets("user:john", "high")
+        targets["primary"].append("mobile_app.other")
+
+        self.assertEqual(self.resolver.get_best_notification_targets("user:john", "high")["primary"],
+                         ["mobile_app.john_phone"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Unit tests for delivery retries.
+"""
+
+import random
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.delivery import DeliveryQueue
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+from smart_notification_router.tag_routing.retry import RetryPolicy, RetryScheduler, TimingWheel
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimingWheel(unittest.TestCase):
+    """Test cases for the TimingWheel class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.clock = FakeClock()
+        self.wheel = TimingWheel(tick=0.1, slots=8, clock=self.clock)
+
+    def test_due_order(self):
+        """Test that items become due at their tick, including after full rotations."""
+        for delay, item in [(0.5, "b"), (0.05, "a"), (2.0, "d"), (0.8, "c")]:
+            self.wheel.schedule(delay, item)
+
+        self.assertEqual(len(self.wheel), 4)
+        self.clock.now += 0.1
+        self.assertEqual(self.wheel.advance(), ["a"])
+        self.clock.now += 0.75
+        self.assertEqual(self.wheel.advance(), ["b", "c"])
+        self.clock.now += 1.0
+        self.assertEqual(self.wheel.advance(), [])
+        self.clock.now += 0.2
+        self.assertEqual(self.wheel.advance(), ["d"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_idle_ticks_skipped(self):
+        """Test scheduling after the wheel has been idle for a long time."""
+        self.clock.now += 3600
+        self.wheel.schedule(0.3, "late")
+
+        self.clock.now += 0.2
+        self.assertEqual(self.wheel.advance(), [])
+        self.clock.now += 0.1
+        self.assertEqual(self.wheel.advance(), ["late"])
+
+    def test_many_timers(self):
+        """Test tens of thousands of pending timers."""
+        rng = random.Random(7)
+        delays = [rng.uniform(0, 60) for _ in range(20_000)]
+        for index, delay in enumerate(delays):
+            self.wheel.schedule(delay, index)
+
+        self.clock.now += 30
+        due = self.wheel.advance()
+
+        self.assertTrue(all(delays[index] <= 30 for index in due))
+        self.assertLessEqual({index for index, delay in enumerate(delays) if delay <= 29.9}, set(due))
+        self.assertEqual(len(self.wheel) + len(due), 20_000)
+
+    def test_invalid_size(self):
+        """Test that a wheel needs slots and a positive tick."""
+        with self.assertRaises(ValueError):
+            TimingWheel(tick=0)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Test cases for the RetryPolicy class."""
+
+    def test_backoff(self):
+        """Test exponential growth, jitter bounds and the cap."""
+        policy = RetryPolicy(max_retries=5, retry_interval=2, max_interval=10, jitter=0.5,
+                             rng=random.Random(1))
+
+        for attempts, backoff in [(1, 2), (2, 4), (3, 8), (4, 10), (5, 10)]:
+            delay = policy.delay(attempts)
+            self.assertGreaterEqual(delay, backoff / 2)
+            self.assertLessEqual(delay, backoff)
+        self.assertTrue(policy.should_retry(5))
+        self.assertFalse(policy.should_retry(6))
+
+    def test_from_config(self):
+        """Test reading the retry configuration section."""
+        policy = RetryPolicy.from_config({"max_retries": 2, "retry_interval": 30})
+
+        self.assertEqual(policy.max_retries, 2)
+        self.assertEqual(policy.retry_interval, 30)
+        self.assertIsNone(RetryPolicy.from_config({"max_retries": 0}))
+        self.assertIsNone(RetryPolicy.from_config({"enabled": False}))
+
+
+class TestRetryScheduler(unittest.TestCase):
+    """Test cases for the RetryScheduler class."""
+
+    def test_callback(self):
+        """Test that due items are handed to the callback."""
+        fired = threading.Event()
+        items = []
+        scheduler = RetryScheduler(lambda item: (items.append(item), fired.set()), tick=0.01)
+        self.addCleanup(scheduler.stop)
+
+        scheduler.schedule(0.02, "retry")
+
+        self.assertTrue(fired.wait(1))
+        self.assertEqual(items, ["retry"])
+        self.assertEqual(scheduler.stats(), {"pending": 0, "scheduled": 1, "fired": 1})
+
+    def test_stopped(self):
+        """Test that a stopped scheduler rejects items and reports what it dropped."""
+        scheduler = RetryScheduler(lambda item: None)
+        scheduler.schedule(60, "retry")
+        self.assertEqual(scheduler.stop(), 1)
+        self.assertEqual(scheduler.stop(), 0)
+
+        with self.assertRaises(RuntimeError):
+            scheduler.schedule(1, "retry")
+
+
+class TestDeliveryRetries(unittest.TestCase):
+    """Test cases for retrying failed services in the DeliveryQueue."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.failures = {"notify.flaky": 2, "notify.down": 100}
+        self.calls = []
+        self.completed = []
+        self.queue = DeliveryQueue(self.deliver, workers=2, on_complete=self.completed.append,
+                                   retry_policy=RetryPolicy(max_retries=2, retry_interval=0.01, jitter=0))
+        self.addCleanup(self.queue.shutdown)
+
+    def deliver(self, services, payload):
+        responses = {}
+        for service in services:
+            self.calls.append(service)
+            if self.failures.get(service, 0) > 0:
+                self.failures[service] -= 1
+                responses[service] = {"error": "unavailable"}
+            else:
+                responses[service] = {"result": "ok"}
+        return responses
+
+    def test_retried_until_sent(self):
+        """Test that a failing service is retried and sent services are not called again."""
+        tracking_id = self.queue.submit(["notify.phone", "notify.flaky"], NotificationPayload("Door", "Opened"))
+        self.queue.join()
+
+        status = self.queue.get_status(tracking_id)
+        self.assertEqual(status["status"], "delivered")
+        self.assertEqual(status["services"]["notify.flaky"], {"status": "sent", "attempts": 3})
+        self.assertEqual(status["services"]["notify.phone"], {"status": "sent"})
+        self.assertEqual(self.calls.count("notify.phone"), 1)
+        self.assertEqual(len(self.completed), 1)
+        self.assertEqual(self.queue.stats()["retries"]["scheduled"], 2)
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a service is failed once its retries are used up."""
+        tracking_id = self.queue.submit(["notify.down"], NotificationPayload("Door", "Opened"))
+        self.queue.join()
+
+        status = self.queue.get_status(tracking_id)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["services"]["notify.down"],
+                         {"status": "failed", "error": "unavailable", "attempts": 3})
+        self.assertEqual(self.calls.count("notify.down"), 3)
+
+    def test_retry_failures_from_elsewhere(self):
+        """Test scheduling retries of calls that failed outside the queue."""
+        self.failures["notify.flaky"] = 0
+
+        tracking_id = self.queue.retry({"notify.flaky": "timeout"}, NotificationPayload("Door", "Opened"))
+        self.assertEqual(self.queue.get_status(tracking_id)["status"], "retrying")
+        self.queue.join()
+
+        self.assertEqual(self.queue.get_status(tracking_id)["services"]["notify.flaky"],
+                         {"status": "sent", "attempts": 2})
+        self.assertIsNone(self.queue.retry({}, NotificationPayload("Door", "Opened")))
+
+    def test_join_after_shutdown(self):
+        """Test that pending retries dropped by shutdown are not waited for."""
+        delivery_queue = DeliveryQueue(self.deliver, workers=1,
+                                       retry_policy=RetryPolicy(max_retries=2, retry_interval=60, jitter=0))
+        tracking_id = delivery_queue.submit(["notify.down"], NotificationPayload("Door", "Opened"))
+        while delivery_queue.get_status(tracking_id)["status"] != "retrying":
+            time.sleep(0.01)
+
+        delivery_queue.shutdown()
+        joined = threading.Thread(target=delivery_queue.join, daemon=True)
+        joined.start()
+        joined.join(2)
+
+        self.assertFalse(joined.is_alive())
+
+    def test_no_retries_without_policy(self):
+        """Test that failures are final without a retry policy."""
+        delivery_queue = DeliveryQueue(self.deliver, workers=1)
+        self.addCleanup(delivery_queue.shutdown)
+
+        tracking_id = delivery_queue.submit(["notify.flaky"], NotificationPayload("Door", "Opened"))
+        delivery_queue.join()
+
+        self.assertEqual(delivery_queue.get_status(tracking_id)["status"], "failed")
+        self.assertIsNone(delivery_queue.retry({"notify.flaky": "timeout"}, NotificationPayload("a", "b")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Unit tests for the Routing Engine.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing.resolution import ContextResolver, TagResolutionService
+from smart_notification_router.tag_routing.routing import RoutingEngine
+
+
+class IndexedClient:
+    """API client stub serving states for the entities of a tag index."""
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.presence = {"john": "home"}
+        self.bulk_requests = 0
+
+    def get_entity_states(self, entity_ids=None):
+        self.bulk_requests += 1
+        states = {}
+        for entity_id in entity_ids:
+            if entity_id.startswith("person."):
+                presence = self.presence.get(entity_id.split(".", 1)[1])
+                if presence:
+                    states[entity_id] = {"entity_id": entity_id, "state": presence}
+            elif entity_id in self.tags:
+                states[entity_id] = {"entity_id": entity_id, "state": "on",
+                                     "attributes": {"tags": self.tags[entity_id]}}
+        return states
+
+
+class TestRoutingPlanCache(unittest.TestCase):
+    """Test cases for reusing routing decisions while their inputs are unchanged."""
+
+    def setUp(self):
+        """Set up test environment."""
+        tags = {
+            "mobile_app.john_phone": ["user:john", "device:mobile"],
+            "notify.john_speaker": ["user:john", "device:speaker", "area:home"],
+        }
+        self.tag_index = TagIndex()
+        self.tag_index.rebuild(tags)
+        self.client = IndexedClient(tags)
+        self.tag_resolver = TagResolutionService(self.client, tag_index=self.tag_index)
+        self.context_resolver = ContextResolver(self.client, self.tag_resolver)
+        self.engine = RoutingEngine(self.tag_resolver, self.context_resolver, self.client, {
+            "enable_deduplication": False,
+            "audiences": {"dashboard": {"services": ["persistent_notification"], "min_severity": "low"}}
+        })
+
+    def route(self, target="user:john", severity="normal"):
+        return self.engine.route_notification(
+            {"title": "Door", "message": "Front door opened", "severity": severity}, target
+        )
+
+    def test_repeated_routing_is_cached(self):
+        """Test that a repeated target and severity reuse the earlier decision."""
+        first = self.route()
+        requests = self.client.bulk_requests
+        second = self.route()
+
+        self.assertEqual(first["services"], ["john_speaker"])
+        self.assertEqual(second["services"], first["services"])
+        self.assertTrue(second["cached"])
+        self.assertNotEqual(second["tracking_id"], first["tracking_id"])
+        # Only the person states are read to check the users' presence
+        self.assertEqual(second["state_requests"], 1)
+        self.assertEqual(self.client.bulk_requests, requests + 1)
+
+    def test_severity_is_part_of_key(self):
+        """Test that a different severity is routed separately."""
+        self.route(severity="normal")
+
+        self.assertNotIn("cached", self.route(severity="high"))
+
+    def test_tag_change_invalidates(self):
+        """Test that a tag index change forces a fresh decision."""
+        self.route()
+        new_tags = frozenset(["user:john", "device:speaker"])
+        old_tags = self.tag_index.update_entity("notify.john_speaker", new_tags)
+        for listener in (self.tag_resolver, self.context_resolver):
+            listener.on_entity_tags_changed("notify.john_speaker", old_tags, new_tags)
+
+        result = self.route()
+
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["services"], ["mobile_app_john_phone"])
+
+    def test_presence_change_invalidates(self):
+        """Test that a presence change forces a fresh decision."""
+        self.route()
+        self.client.presence["john"] = "not_home"
+        self.context_resolver.on_presence_changed("person.john")
+
+        result = self.route()
+
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["services"], ["mobile_app_john_phone"])
+
+    def test_unreported_presence_change_invalidates(self):
+        """Test that a presence change is seen without on_presence_changed()."""
+        self.route()
+        self.client.presence["john"] = "not_home"
+
+        result = self.route()
+
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["services"], ["mobile_app_john_phone"])
+        self.assertTrue(self.route()["cached"])
+
+    def test_config_change_invalidates(self):
+        """Test that replacing the configuration forces a fresh decision."""
+        self.route("dashboard")
+        self.assertTrue(self.route("dashboard")["cached"])
+
+        self.engine.update_config({
+            "enable_deduplication": False,
+            "audiences": {"dashboard": {"services": ["notify.tv"], "min_severity": "low"}}
+        })
+
+        result = self.route("dashboard")
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["services"], ["notify.tv"])
+
+    def test_unversioned_resolution_not_cached(self):
+        """Test that decisions are not cached without a versioned tag index."""
+        engine = RoutingEngine(None, self.context_resolver, self.client, {"enable_deduplication": False})
+        notification = {"title": "Door", "message": "Front door opened", "severity": "normal"}
+
+        engine.route_notification(notification, "user:john")
+
+        self.assertNotIn("cached", engine.route_notification(notification, "user:john"))
+        self.assertEqual(engine.get_plan_cache_stats()["size"], 0)
+
+
+class TestSeverityFallback(unittest.TestCase):
+    """Test cases for replacing a missing or unknown severity."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.client = IndexedClient({})
+        self.engine = RoutingEngine(None, None, self.client, {
+            "enable_deduplication": False,
+            "severity_levels": ["info", "warning", "critical"],
+            "audiences": {"dashboard": {"services": ["persistent_notification"], "min_severity": "info"}}
+        })
+
+    def test_custom_levels_without_normal(self):
+        """Test that the least severe level is used when "normal" is not configured."""
+        for notification in ({"title": "Door", "message": "Opened", "severity": "bogus"},
+                             {"title": "Door", "message": "Opened"}):
+            result = self.engine.route_notification(notification, "dashboard")
+
+            self.assertTrue(result["success"])
+            self.assertEqual(notification["severity"], "info")
+            self.assertEqual(result["services"], ["persistent_notification"])
+
+
+if __name__ == '__main__':
+    unittest.main()
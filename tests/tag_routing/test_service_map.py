@@ -0,0 +1,155 @@
+"""
+Unit tests for the entity to service mapping table.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.service_map import (
+    ServiceMappingTable, map_entity, notify_service_names
+)
+from smart_notification_router.tag_routing.routing import RoutingEngine
+
+
+def state(entity_id, **attributes):
+    return {"entity_id": entity_id, "state": "home", "attributes": attributes}
+
+
+class TestMapEntity(unittest.TestCase):
+    """Test cases for the mapping rules."""
+
+    def test_rules(self):
+        """Test each mapping rule in order of precedence."""
+        mappings = {"light.porch": "porch_display", "media_player": "tts_speaker"}
+
+        self.assertEqual(map_entity("light.porch", mappings)[0], "porch_display")
+        self.assertEqual(map_entity("media_player.kitchen", mappings)[0], "tts_speaker")
+        self.assertEqual(map_entity("mobile_app.pixel", {})[0], "mobile_app_pixel")
+        self.assertEqual(map_entity("notify.telegram", {})[0], "telegram")
+        self.assertEqual(map_entity("device_tracker.john_mobile", {})[0], "mobile_app_johnmobile")
+        self.assertEqual(
+            map_entity("device_tracker.pixel", {},
+                       {"source_type": "mobile_app", "friendly_name": "Pixel 9"})[0],
+            "mobile_app_pixel9"
+        )
+        self.assertEqual(map_entity("light.kitchen", {})[0], None)
+
+    def test_discovered_services(self):
+        """Test falling back to a discovered notify service named after the entity."""
+        services = frozenset(["mobile_app_pixel_9", "living_room_tv"])
+
+        self.assertEqual(map_entity("device_tracker.pixel_9", {}, None, services),
+                         ("mobile_app_pixel_9", True))
+        self.assertEqual(map_entity("media_player.living_room_tv", {}, None, services),
+                         ("living_room_tv", True))
+
+    def test_notify_service_names(self):
+        """Test extracting notify service names from a service listing."""
+        services = [{"domain": "notify", "services": {"a": {}, "b": {}}},
+                    {"domain": "light", "services": {"turn_on": {}}}]
+
+        self.assertEqual(notify_service_names(services), frozenset(["a", "b"]))
+
+
+class TestServiceMappingTable(unittest.TestCase):
+    """Test cases for the ServiceMappingTable class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.table = ServiceMappingTable()
+        self.table.rebuild({
+            "mobile_app.pixel": state("mobile_app.pixel"),
+            "device_tracker.tablet": state("device_tracker.tablet"),
+            "light.kitchen": state("light.kitchen"),
+        }, ["kitchen"])
+
+    def test_rebuild(self):
+        """Test mapped and unmappable entities after a rebuild."""
+        self.assertEqual(self.table.get("mobile_app.pixel"), "mobile_app_pixel")
+        self.assertEqual(self.table.get("light.kitchen"), "kitchen")
+        self.assertEqual(self.table.get_unmappable(), {"device_tracker.tablet"})
+        self.assertEqual(self.table.stats()["entities"], 3)
+
+    def test_update_entity(self):
+        """Test that a state change remaps only that entity."""
+        version = self.table.version
+
+        service = self.table.update_entity(
+            "device_tracker.tablet",
+            state("device_tracker.tablet", source_type="mobile_app", friendly_name="Tab S9")
+        )
+
+        self.assertEqual(service, "mobile_app_tabs9")
+        self.assertEqual(self.table.get_unmappable(), set())
+        self.assertGreater(self.table.version, version)
+
+    def test_unchanged_state_keeps_version(self):
+        """Test that state changes not affecting the mapping keep the version."""
+        version = self.table.version
+        self.table.update_entity("mobile_app.pixel", {"state": "not_home", "attributes": {}})
+
+        self.assertEqual(self.table.version, version)
+
+    def test_update_services(self):
+        """Test that service changes remap entities depending on them."""
+        self.table.update_services(["tablet"])
+
+        self.assertEqual(self.table.get("device_tracker.tablet"), "tablet")
+        self.assertIsNone(self.table.get("light.kitchen"))
+        self.assertEqual(self.table.get_unmappable(), {"light.kitchen"})
+
+    def test_set_entity_mappings(self):
+        """Test that configured mappings take precedence after a change."""
+        self.table.set_entity_mappings({"light": "hue_notify"})
+
+        self.assertEqual(self.table.get("light.kitchen"), "hue_notify")
+
+    def test_remove_entity(self):
+        """Test removing an entity."""
+        self.table.remove_entity("device_tracker.tablet")
+
+        self.assertNotIn("device_tracker.tablet", self.table)
+        self.assertEqual(self.table.get_unmappable(), set())
+
+
+class RecordingClient:
+    """API client stub recording single state requests."""
+
+    def __init__(self):
+        self.single_requests = 0
+
+    def get_entity_states(self, entity_ids=None):
+        return {"device_tracker.pixel": state("device_tracker.pixel",
+                                              source_type="mobile_app", friendly_name="Pixel")}
+
+    def get_entity_state(self, entity_id):
+        self.single_requests += 1
+        return None
+
+    def get_services(self):
+        return [{"domain": "notify", "services": {"mobile_app_pixel": {}}}]
+
+
+class TestEngineServiceMap(unittest.TestCase):
+    """Test cases for the routing engine's use of the mapping table."""
+
+    def test_no_requests_after_refresh(self):
+        """Test that mapping known entities makes no Home Assistant requests."""
+        client = RecordingClient()
+        engine = RoutingEngine(None, None, client, {})
+        engine.refresh_service_map()
+
+        self.assertEqual(engine._entity_to_service("device_tracker.pixel"), "mobile_app_pixel")
+        self.assertEqual(client.single_requests, 0)
+
+    def test_unknown_entity_recorded(self):
+        """Test that an unmappable entity is looked up only once."""
+        client = RecordingClient()
+        engine = RoutingEngine(None, None, client, {})
+
+        self.assertIsNone(engine._entity_to_service("light.garage"))
+        self.assertIsNone(engine._entity_to_service("light.garage"))
+        self.assertEqual(client.single_requests, 1)
+        self.assertEqual(engine.service_map.get_unmappable(), {"light.garage"})
+
+
+if __name__ == '__main__':
+    unittest.main()
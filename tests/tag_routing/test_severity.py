@@ -0,0 +1,123 @@
+"""
+Unit tests for the severity model and audience routing table.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.severity import (
+    AudienceRoutingTable, SeverityModel, compile_routing_table
+)
+from smart_notification_router.tag_routing.notification_router import NotificationRouter
+from smart_notification_router.tag_routing.routing import RoutingEngine
+
+CONFIG = {
+    "severity_levels": ["low", "medium", "high", "emergency"],
+    "audiences": {
+        "mobile": {"services": ["notify.phone", "notify.watch", "notify.phone"], "min_severity": "high"},
+        "dashboard": {"services": ["persistent_notification.create"], "min_severity": "low"},
+        "broken": {"services": ["notify.tv"], "min_severity": "urgent"}
+    }
+}
+
+
+class TestSeverityModel(unittest.TestCase):
+    """Test cases for the SeverityModel class."""
+
+    def test_ranks(self):
+        """Test ranks of configured levels and aliases."""
+        model = SeverityModel(["low", "medium", "high", "emergency"])
+
+        self.assertEqual(model.rank("low"), 0)
+        self.assertEqual(model.rank("emergency"), 3)
+        self.assertEqual(model.rank("normal"), model.rank("medium"))
+        self.assertEqual(model.rank("critical"), model.rank("emergency"))
+        self.assertEqual(model.rank(" HIGH "), 2)
+        self.assertIsNone(model.rank("urgent"))
+        self.assertIsNone(model.rank(None))
+
+    def test_configured_levels_take_precedence(self):
+        """Test that aliases never shadow a configured level."""
+        model = SeverityModel(["low", "normal", "high", "critical"])
+
+        self.assertEqual(model.rank("normal"), 1)
+        self.assertEqual(model.rank("critical"), 3)
+        self.assertEqual(model.canonical("info"), "low")
+
+    def test_custom_aliases(self):
+        """Test aliases from the configuration."""
+        model = SeverityModel(["minor", "major"], {"p2": "minor", "p1": "major", "p0": "unknown"})
+
+        self.assertEqual(model.canonical("p1"), "major")
+        self.assertIsNone(model.rank("p0"))
+        self.assertIsNone(model.rank("normal"))
+
+    def test_empty_levels(self):
+        """Test that an empty level list falls back to the defaults."""
+        self.assertEqual(len(SeverityModel([])), 4)
+
+
+class TestAudienceRoutingTable(unittest.TestCase):
+    """Test cases for the AudienceRoutingTable class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.table = compile_routing_table(CONFIG)
+
+    def test_threshold(self):
+        """Test that services are only returned at or above the minimum severity."""
+        self.assertEqual(self.table.services("mobile", "medium"), ())
+        self.assertEqual(self.table.services("mobile", "high"), ("notify.phone", "notify.watch"))
+        self.assertEqual(self.table.services("mobile", "critical"), ("notify.phone", "notify.watch"))
+        self.assertEqual(self.table.services("dashboard", "info"), ("persistent_notification.create",))
+
+    def test_unknown_inputs(self):
+        """Test unknown audiences, severities and minimum severities."""
+        self.assertEqual(self.table.services("nobody", "high"), ())
+        self.assertEqual(self.table.services("mobile", "urgent"), ())
+        self.assertEqual(self.table.services("broken", "emergency"), ())
+        self.assertIn("broken", self.table)
+        self.assertEqual(self.table.min_severity("mobile"), "high")
+
+    def test_empty_configuration(self):
+        """Test a configuration without audiences."""
+        table = AudienceRoutingTable({}, SeverityModel())
+
+        self.assertNotIn("mobile", table)
+
+
+class TestRoutersShareSeverityModel(unittest.TestCase):
+    """Test cases for consistent audience routing in both routers."""
+
+    def test_same_decisions(self):
+        """Test that both routers select the same audience services."""
+        router = NotificationRouter(None, CONFIG)
+        engine = RoutingEngine(None, None, None, dict(CONFIG, enable_deduplication=False))
+
+        for severity in ["low", "normal", "medium", "high", "critical", "emergency"]:
+            for audience in ["mobile", "dashboard"]:
+                result = engine.route_notification(
+                    {"title": severity, "message": audience, "severity": severity}, audience
+                )
+                self.assertEqual(result["services"], router.get_audience_services(audience, severity),
+                                 (audience, severity))
+
+    def test_unknown_severity_routed_as_normal(self):
+        """Test that the routing engine still treats unknown severities as normal."""
+        engine = RoutingEngine(None, None, None, dict(CONFIG, enable_deduplication=False))
+
+        result = engine.route_notification({"title": "a", "message": "b", "severity": "urgent"}, "dashboard")
+
+        self.assertEqual(result["severity"], "normal")
+        self.assertEqual(result["services"], ["persistent_notification.create"])
+
+    def test_update_config(self):
+        """Test that a configuration update recompiles the table."""
+        router = NotificationRouter(None, CONFIG)
+        router.update_config(dict(CONFIG, severity_levels=["low", "high"]))
+
+        self.assertEqual(router.get_severity_level_index("high"), 1)
+        self.assertEqual(router.get_audience_services("mobile", "high"), ["notify.phone", "notify.watch"])
+        self.assertEqual(router.get_audience_services("mobile", "medium"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
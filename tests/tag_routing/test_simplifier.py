@@ -0,0 +1,139 @@
+"""
+Unit tests for the Tag Expression Simplifier.
+"""
+
+import itertools
+import random
+import unittest
+from smart_notification_router.tag_routing.parser import TagExpressionParser, TagEmpty
+from smart_notification_router.tag_routing.simplifier import (
+    EMPTY_CANONICAL, canonical_string, simplify
+)
+from smart_notification_router.tag_routing.compiler import compile_expression
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing.resolution import TagResolutionService
+
+
+class TestTagExpressionSimplifier(unittest.TestCase):
+    """Test cases for simplifying expressions into canonical form."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.parser = TagExpressionParser()
+
+    def canonical(self, expression):
+        return canonical_string(simplify(self.parser.parse(expression)))
+
+    def test_duplicate_terms(self):
+        """Test that repeated terms are removed."""
+        self.assertEqual(self.canonical("user:john+user:john"), "user:john")
+        self.assertEqual(self.canonical("(area:a|area:b)|area:a"), "area:a|area:b")
+
+    def test_operand_order(self):
+        """Test that AND and OR operands are sorted."""
+        self.assertEqual(self.canonical("user:john+device:mobile"), "device:mobile+user:john")
+        self.assertEqual(
+            self.canonical("user:john+device:mobile"),
+            self.canonical("device:mobile+user:john+device:mobile")
+        )
+
+    def test_wildcard_folding(self):
+        """Test that '*' is folded into its parent."""
+        self.assertEqual(self.canonical("*+user:john"), "user:john")
+        self.assertEqual(self.canonical("user:john|*"), "*")
+        self.assertEqual(self.canonical("user:john-*"), EMPTY_CANONICAL)
+
+    def test_contradictions(self):
+        """Test that provably empty expressions become TagEmpty."""
+        for expression in ["user:john-user:john",
+                           "(user:john+device:mobile)-user:john",
+                           "user:john+(device:mobile-user:john)",
+                           "user:john-(user:john|user:jane)"]:
+            self.assertIsInstance(simplify(self.parser.parse(expression)), TagEmpty, expression)
+
+    def test_absorption(self):
+        """Test that terms implied by a sibling are dropped."""
+        self.assertEqual(self.canonical("user:john|(user:john+device:mobile)"), "user:john")
+        self.assertEqual(self.canonical("user:john|(user:john-device:mobile)"), "user:john")
+
+    def test_wildcard_implication(self):
+        """Test that wildcard tags absorb the tags they match."""
+        self.assertEqual(self.canonical("device:mobile|device:*"), "device:*")
+        self.assertEqual(self.canonical("device:mobile+device:*"), "device:mobile")
+        self.assertEqual(self.canonical("area:bed*|area:b*"), "area:b*")
+        self.assertEqual(self.canonical("device:mobile-device:*"), EMPTY_CANONICAL)
+
+    def test_not_chains(self):
+        """Test that chains of NOT are merged regardless of order."""
+        self.assertEqual(self.canonical("area:home-area:a-area:b"), "area:home-(area:a|area:b)")
+        self.assertEqual(self.canonical("area:home-area:b-area:a"), "area:home-(area:a|area:b)")
+
+    def test_long_not_chain(self):
+        """Test that long NOT chains do not recurse per term."""
+        expression = "area:home-" + "-".join(f"area:r{i}" for i in range(600))
+        parser = TagExpressionParser(max_length=100000)
+        tree = simplify(parser.parse(expression))
+        self.assertTrue(tree.evaluate(["area:home"]))
+        self.assertFalse(tree.evaluate(["area:home", "area:r599"]))
+
+    def test_equivalence_with_original(self):
+        """Test that simplified trees match the original on random expressions."""
+        rng = random.Random(7)
+        tags = ["a:a", "b:b", "c:c", "d:d"]
+
+        def generate(depth):
+            if depth == 0 or rng.random() < 0.3:
+                return rng.choice(tags + ["*"])
+            left, right = generate(depth - 1), generate(depth - 1)
+            return f"({left}){rng.choice('+|-')}({right})"
+
+        tag_sets = [set(combination) for size in range(len(tags) + 1)
+                    for combination in itertools.combinations(tags, size)]
+
+        for _ in range(500):
+            expression = generate(4)
+            tree = self.parser.parse(expression)
+            simplified = simplify(tree)
+            for tag_set in tag_sets:
+                self.assertEqual(tree.evaluate(tag_set), simplified.evaluate(tag_set), expression)
+
+            # The canonical string parses back into the same canonical form
+            canonical = canonical_string(simplified)
+            if canonical != EMPTY_CANONICAL:
+                self.assertEqual(self.canonical(canonical), canonical)
+
+
+class TestSharedPlans(unittest.TestCase):
+    """Test cases for sharing compiled plans between equivalent expressions."""
+
+    def test_equivalent_expressions_share_plan(self):
+        """Test that equivalent expressions compile to the same plan."""
+        first = compile_expression("user:sim1+device:mobile")
+        second = compile_expression("device:mobile + user:sim1 + device:mobile")
+
+        self.assertIs(first, second)
+        self.assertEqual(first.expression, "device:mobile+user:sim1")
+
+    def test_empty_plan(self):
+        """Test that provably empty expressions compile to an empty plan."""
+        compiled = compile_expression("user:sim2-user:sim2")
+
+        self.assertTrue(compiled.is_empty)
+        self.assertFalse(compiled.evaluate(["user:sim2"]))
+
+        index = TagIndex()
+        index.rebuild({"light.a": ["user:sim2"]})
+        self.assertEqual(index.resolve(compiled), set())
+
+    def test_empty_expression_skips_lookups(self):
+        """Test that resolving a provably empty expression never queries Home Assistant."""
+        class FailingClient:
+            def get_entities_by_tag_expression(self, expression):
+                raise AssertionError("Home Assistant must not be queried")
+
+        service = TagResolutionService(FailingClient())
+        self.assertEqual(service.resolve_expression("user:sim3+(device:x-user:sim3)"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Unit tests for single-flight call coalescing.
+"""
+
+import threading
+import time
+import unittest
+from smart_notification_router.tag_routing.singleflight import SingleFlight
+from smart_notification_router.tag_routing.resolution import TagResolutionService
+
+
+def run_concurrently(function, count):
+    """Call a function from several threads at once and collect the results."""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = function()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SlowClient:
+    """API client stub with a slow expression lookup."""
+
+    def __init__(self):
+        self.lookups = 0
+
+    def get_entities_by_tag_expression(self, expression):
+        self.lookups += 1
+        time.sleep(0.1)
+        return ["mobile_app.john_phone"]
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for the SingleFlight class."""
+
+    def test_concurrent_calls_coalesced(self):
+        """Test that concurrent calls with one key run the function once."""
+        flight = SingleFlight()
+        executions = []
+
+        def load():
+            executions.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        results = run_concurrently(lambda: flight.do("key", load), 8)
+
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(flight.stats(), {"in_flight": 0, "calls": 1, "coalesced": 7})
+
+    def test_different_keys_not_coalesced(self):
+        """Test that calls with different keys run independently."""
+        flight = SingleFlight()
+
+        self.assertEqual(flight.do("a", lambda: 1), 1)
+        self.assertEqual(flight.do("b", lambda: 2), 2)
+        self.assertEqual(flight.do("a", lambda: 3), 3)
+        self.assertEqual(flight.coalesced, 0)
+
+    def test_errors_shared(self):
+        """Test that waiters receive the error of the call they waited on."""
+        flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError("unavailable")
+
+        results = run_concurrently(lambda: flight.do("key", fail), 4)
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(flight.calls, 1)
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+
+class TestCoalescedResolution(unittest.TestCase):
+    """Test cases for coalescing concurrent resolutions of one expression."""
+
+    def test_cold_cache_burst(self):
+        """Test that a burst on a cold cache queries Home Assistant once."""
+        client = SlowClient()
+        service = TagResolutionService(client)
+
+        results = run_concurrently(lambda: service.resolve_expression("user:john+device:mobile"), 6)
+
+        self.assertEqual(results, [["mobile_app.john_phone"]] * 6)
+        self.assertEqual(client.lookups, 1)
+        self.assertEqual(service.inflight.coalesced, 5)
+
+    def test_equivalent_expressions_coalesced(self):
+        """Test that equivalent spellings share one in-flight lookup."""
+        client = SlowClient()
+        service = TagResolutionService(client)
+        expressions = iter(["user:john+device:mobile", "device:mobile+user:john"] * 2)
+        lock = threading.Lock()
+
+        def resolve():
+            with lock:
+                expression = next(expressions)
+            return service.resolve_expression(expression)
+
+        run_concurrently(resolve, 4)
+
+        self.assertEqual(client.lookups, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+"""
+Unit tests for the durable delivery store.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from smart_notification_router.tag_routing.delivery import DeliveryQueue, DeliveryRecord
+from smart_notification_router.tag_routing.ha_client import NotificationPayload
+from smart_notification_router.tag_routing.retry import RetryPolicy
+from smart_notification_router.tag_routing.store import DeliveryStore
+
+
+class TestDeliveryStore(unittest.TestCase):
+    """Test cases for the DeliveryStore class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "queue", "deliveries.db")
+
+    def open(self, **kwargs):
+        store = DeliveryStore(self.path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def record(self, tracking_id, services=("notify.phone", "notify.watch")):
+        return DeliveryRecord(tracking_id, list(services), NotificationPayload("Door", "Opened", {"tag": "door"}),
+                              {"severity": "high"})
+
+    def test_add_survives_reopen(self):
+        """Test that an added record is pending after reopening the store."""
+        store = self.open()
+        store.add(self.record("abc"))
+        store.close()
+
+        pending = self.open().pending()
+
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0]["tracking_id"], "abc")
+        self.assertEqual(pending[0]["data"], {"tag": "door"})
+        self.assertEqual(pending[0]["context"], {"severity": "high"})
+        self.assertEqual(list(pending[0]["services"]), ["notify.phone", "notify.watch"])
+
+    def test_update(self):
+        """Test that finished records are no longer pending."""
+        store = self.open()
+        record = self.record("abc")
+        store.add(record)
+        record.services["notify.watch"] = {"status": "failed", "error": "unavailable"}
+        record.status = "partial"
+        record.completed_at = record.submitted_at + 1
+        store.update(record, wait=True)
+
+        self.assertEqual(store.pending(), [])
+        status = store.get("abc")
+        self.assertEqual(status["status"], "partial")
+        self.assertEqual(status["services"]["notify.watch"], {"status": "failed", "error": "unavailable"})
+        self.assertIsNone(store.get("missing"))
+
+    def test_group_commit(self):
+        """Test that concurrent writers share commits."""
+        store = self.open(commit_delay=0.01)
+        threads = [threading.Thread(target=store.add, args=(self.record(f"id-{n}"),)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(store.pending()), 20)
+        self.assertEqual(store.stats()["writes"], 20)
+        self.assertLess(store.stats()["commits"], 20)
+
+    def test_prune(self):
+        """Test that only the newest finished records are retained."""
+        store = self.open(retain=2)
+        for n in range(4):
+            record = self.record(f"id-{n}")
+            store.add(record)
+            record.status = "delivered"
+            record.completed_at = record.submitted_at + n
+            store.update(record, wait=True)
+        store.commits = 0
+        store.flush()
+
+        self.assertIsNone(store.get("id-0"))
+        self.assertIsNotNone(store.get("id-3"))
+
+    def test_closed(self):
+        """Test that writes to a closed store are rejected."""
+        store = self.open()
+        store.close()
+
+        with self.assertRaises(RuntimeError):
+            store.add(self.record("abc"))
+
+    def test_failed_write_raises(self):
+        """Test that a waiting writer gets the error of its failed write, and only that writer."""
+        store = self.open(commit_delay=0.05)
+        commit = store._commit
+
+        def failing_commit(operations):
+            if any(operation[0] == "add" and operation[1][0] == "bad" for operation in operations):
+                raise sqlite3.OperationalError("disk I/O error")
+            commit(operations)
+
+        store._commit = failing_commit
+        errors = {}
+
+        def add(tracking_id):
+            try:
+                store.add(self.record(tracking_id))
+            except sqlite3.Error as e:
+                errors[tracking_id] = e
+
+        threads = [threading.Thread(target=add, args=(tracking_id,)) for tracking_id in ("good", "bad")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(errors), ["bad"])
+        self.assertIsNotNone(store.get("good"))
+        self.assertIsNone(store.get("bad"))
+
+    def test_attempts_survive_reopen(self):
+        """Test that each service's attempts are stored."""
+        store = self.open()
+        record = self.record("abc")
+        store.add(record)
+        record.services["notify.watch"] = {"status": "pending", "error": "unavailable", "attempts": 2}
+        store.update(record)
+        store.close()
+
+        pending = self.open().pending()
+
+        self.assertEqual(pending[0]["services"]["notify.watch"],
+                         {"status": "pending", "error": "unavailable", "attempts": 2})
+        self.assertEqual(pending[0]["services"]["notify.phone"], {"status": "pending"})
+
+
+class TestDurableDeliveryQueue(unittest.TestCase):
+    """Test cases for a DeliveryQueue backed by a DeliveryStore."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "deliveries.db")
+        self.calls = []
+
+    def deliver(self, services, payload):
+        self.calls.append(list(services))
+        return {service: {"result": "ok"} for service in services}
+
+    def open_queue(self, deliver):
+        store = DeliveryStore(self.path)
+        delivery_queue = DeliveryQueue(deliver, workers=1, store=store)
+        self.addCleanup(store.close)
+        self.addCleanup(delivery_queue.shutdown)
+        return delivery_queue
+
+    def test_replay_after_restart(self):
+        """Test that notifications accepted before a crash are delivered after restart."""
+        blocked = threading.Event()
+        crashed = self.open_queue(lambda services, payload: blocked.wait() and {})
+        self.addCleanup(blocked.set)
+        tracking_id = crashed.submit(["notify.phone"], NotificationPayload("Door", "Opened"))
+        # The first process never finishes its delivery; a second one opens the same file
+
+        restarted = self.open_queue(self.deliver)
+        self.assertEqual(restarted.replay(), 1)
+        restarted.join()
+
+        self.assertEqual(self.calls, [["notify.phone"]])
+        self.assertEqual(restarted.get_status(tracking_id)["status"], "delivered")
+
+    def test_replay_skips_sent_services(self):
+        """Test that services sent before the restart are not called again."""
+        store = DeliveryStore(self.path)
+        record = DeliveryRecord("abc", ["notify.phone", "notify.watch"], NotificationPayload("Door", "Opened"))
+        store.add(record)
+        record.services["notify.phone"] = {"status": "sent"}
+        store.update(record)
+        store.close()
+
+        delivery_queue = self.open_queue(self.deliver)
+        delivery_queue.replay()
+        delivery_queue.join()
+
+        self.assertEqual(self.calls, [["notify.watch"]])
+        self.assertEqual(delivery_queue.get_status("abc")["status"], "delivered")
+        delivery_queue.store.flush()
+        self.assertEqual(delivery_queue.replay(), 0)
+
+    def test_status_from_store(self):
+        """Test status lookups of records no longer held in memory."""
+        delivery_queue = self.open_queue(self.deliver)
+        tracking_id = delivery_queue.submit(["notify.phone"], NotificationPayload("Door", "Opened"))
+        delivery_queue.join()
+        delivery_queue.store.flush()
+        delivery_queue._records.clear()
+
+        self.assertEqual(delivery_queue.get_status(tracking_id)["services"], {"notify.phone": {"status": "sent"}})
+
+    def test_retry_budget_survives_restart(self):
+        """Test that retries used before a restart count against the retry limit."""
+        store = DeliveryStore(self.path)
+        record = DeliveryRecord("abc", ["notify.down"], NotificationPayload("Door", "Opened"))
+        store.add(record)
+        record.services["notify.down"] = {"status": "pending", "error": "unavailable", "attempts": 3}
+        store.update(record)
+        store.close()
+
+        store = DeliveryStore(self.path)
+        delivery_queue = DeliveryQueue(lambda services, payload: {service: {"error": "unavailable"}
+                                                                  for service in services},
+                                       workers=1, store=store,
+                                       retry_policy=RetryPolicy(max_retries=3, retry_interval=0.01, jitter=0))
+        self.addCleanup(store.close)
+        self.addCleanup(delivery_queue.shutdown)
+        delivery_queue.replay()
+        delivery_queue.join()
+
+        self.assertEqual(delivery_queue.get_status("abc")["services"]["notify.down"],
+                         {"status": "failed", "error": "unavailable", "attempts": 4})
+
+    def test_submit_fails_when_not_stored(self):
+        """Test that a notification that could not be stored is neither acknowledged nor queued."""
+        delivery_queue = self.open_queue(self.deliver)
+
+        commit = delivery_queue.store._commit
+
+        def failing_commit(operations):
+            if any(operation[0] == "add" for operation in operations):
+                raise sqlite3.OperationalError("database is locked")
+            commit(operations)
+
+        delivery_queue.store._commit = failing_commit
+
+        with self.assertRaises(sqlite3.Error):
+            delivery_queue.submit(["notify.phone"], NotificationPayload("Door", "Opened"))
+        delivery_queue.join()
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
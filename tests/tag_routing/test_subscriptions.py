@@ -0,0 +1,146 @@
+"""
+Unit tests for the Subscription Index.
+"""
+
+import itertools
+import random
+import unittest
+from smart_notification_router.tag_routing.compiler import compile_expression
+from smart_notification_router.tag_routing.subscriptions import SubscriptionIndex, to_conjunctions
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing.resolution import TagResolutionService
+from smart_notification_router.tag_routing.entity_manager import EntityManager
+
+
+class TestSubscriptionIndex(unittest.TestCase):
+    """Test cases for reverse matching of registered expressions."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.index = SubscriptionIndex()
+        self.index.add("john_mobile", "user:john+device:mobile")
+        self.index.add("family", "user:john|user:jane")
+        self.index.add("not_bedroom", "area:home-area:bedroom")
+        self.index.add("everyone", "*")
+
+    def test_match(self):
+        """Test matching an entity's tags against registered expressions."""
+        self.assertEqual(self.index.match(["user:john", "device:mobile"]),
+                         {"john_mobile", "family", "everyone"})
+        self.assertEqual(self.index.match(["area:home"]), {"not_bedroom", "everyone"})
+        self.assertEqual(self.index.match(["area:home", "area:bedroom"]), {"everyone"})
+
+    def test_remove(self):
+        """Test unregistering an expression."""
+        self.index.remove("family")
+
+        self.assertEqual(self.index.match(["user:jane"]), {"everyone"})
+        self.assertNotIn("family", self.index)
+        self.assertEqual(len(self.index), 3)
+
+    def test_affected(self):
+        """Test finding expressions whose membership changes."""
+        self.assertEqual(
+            self.index.affected(["user:john"], ["user:john", "device:mobile"]),
+            {"john_mobile"}
+        )
+        self.assertEqual(self.index.affected(["area:home"], ["area:home"]), set())
+        self.assertEqual(self.index.affected(None, ["user:jane"]), {"family", "everyone"})
+        self.assertEqual(self.index.affected(["user:jane"], None), {"family", "everyone"})
+
+    def test_wildcard_expressions(self):
+        """Test matching expressions with wildcard tags."""
+        self.index.add("john_devices", "user:john+device:*")
+        self.index.add("no_bed", "area:*-area:bed*")
+
+        self.assertIn("john_devices", self.index.match(["user:john", "device:tablet"]))
+        self.assertNotIn("john_devices", self.index.match(["user:john"]))
+        self.assertIn("no_bed", self.index.match(["area:kitchen"]))
+        self.assertNotIn("no_bed", self.index.match(["area:kitchen", "area:bedroom"]))
+
+        self.index.remove("john_devices")
+        self.index.remove("no_bed")
+        self.assertEqual(self.index._prefix_lengths, {})
+
+    def test_negated_conjunction(self):
+        """Test expressions with negated AND terms."""
+        conjunctions = to_conjunctions(compile_expression("area:home-(user:john+device:mobile)").tree)
+
+        self.assertEqual(len(conjunctions), 2)
+
+    def test_unindexed_expressions(self):
+        """Test that expressions with very large normal forms are still matched."""
+        groups = ["(" + "|".join(f"g{group}:t{i}" for i in range(3)) + ")" for group in range(5)]
+        self.index.add("large", "+".join(groups))
+
+        self.assertIn("large", self.index._unindexed)
+        self.assertIn("large", self.index.match([f"g{group}:t1" for group in range(5)]))
+        self.assertNotIn("large", self.index.match(["g0:t1"]))
+
+    def test_matches_reference_evaluation(self):
+        """Test reverse matching against direct evaluation on random expressions."""
+        rng = random.Random(11)
+        tags = ["a:a", "b:b", "c:c", "d:d"]
+
+        def generate(depth):
+            if depth == 0 or rng.random() < 0.3:
+                return rng.choice(tags + ["*"])
+            left, right = generate(depth - 1), generate(depth - 1)
+            return f"({left}){rng.choice('+|-')}({right})"
+
+        index = SubscriptionIndex()
+        expressions = {}
+        for i in range(200):
+            expression = generate(3)
+            expressions[i] = compile_expression(expression)
+            index.add(i, expression)
+
+        for size in range(len(tags) + 1):
+            for tag_set in itertools.combinations(tags, size):
+                expected = {i for i, compiled in expressions.items() if compiled.evaluate(tag_set)}
+                self.assertEqual(index.match(tag_set), expected, tag_set)
+
+
+class TestResolutionInvalidation(unittest.TestCase):
+    """Test cases for invalidating only the affected cached resolutions."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.tag_index = TagIndex()
+        self.tag_index.rebuild({
+            "device_tracker.john_phone": ["user:john", "device:mobile"],
+            "device_tracker.jane_phone": ["user:jane", "device:mobile"],
+        })
+        self.service = TagResolutionService(ha_client=None, tag_index=self.tag_index)
+
+    def change_tags(self, entity_id, tags):
+        old_tags = self.tag_index.update_entity(entity_id, tags)
+        return self.service.on_entity_tags_changed(entity_id, old_tags, tags)
+
+    def test_only_affected_entries_updated(self):
+        """Test that only views the entity joins or leaves change."""
+        self.service.resolve_expression("user:john+device:mobile")
+        self.service.resolve_expression("user:jane")
+
+        affected = self.change_tags("device_tracker.john_phone", ["user:john"])
+
+        self.assertEqual(affected, {"device:mobile+user:john"})
+        self.assertEqual(self.service.get_view_version("user:john+device:mobile"), 1)
+        self.assertEqual(self.service.get_view_version("user:jane"), 0)
+        self.assertEqual(self.service.resolve_expression("user:john+device:mobile"), [])
+
+    def test_entity_manager_listener(self):
+        """Test wiring the service to entity manager tag changes."""
+        manager = EntityManager(demo_mode=True)
+        service = TagResolutionService(manager.ha_client, tag_index=manager.tag_index)
+        manager.add_tag_listener(service.on_entity_tags_changed)
+
+        before = service.resolve_expression("user:listener")
+        manager.set_entity_tags("light.listener_test", ["user:listener"])
+
+        self.assertEqual(before, [])
+        self.assertEqual(service.resolve_expression("user:listener"), ["light.listener_test"])
+
+
+if __name__ == '__main__':
+    unittest.main()
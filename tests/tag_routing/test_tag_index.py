@@ -0,0 +1,251 @@
+"""
+Unit tests for the inverted Tag Index.
+"""
+
+import random
+import unittest
+from smart_notification_router.tag_routing.parser import TagExpressionParser, TagLiteral
+from smart_notification_router.tag_routing.compiler import chain_operands, compile_expression
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing.entity_manager import EntityManager
+
+
+class TestTagIndex(unittest.TestCase):
+    """Test cases for the TagIndex class."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.parser = TagExpressionParser()
+        self.index = TagIndex()
+        self.index.rebuild({
+            "device_tracker.john_phone": ["user:john", "device:mobile"],
+            "media_player.john_speaker": ["user:john", "device:speaker", "area:bedroom"],
+            "device_tracker.jane_phone": ["user:jane", "device:mobile", "area:home"],
+        }, entity_ids=["light.kitchen"])
+    
+    def resolve(self, expression):
+        return self.index.resolve(self.parser.parse(expression))
+    
+    def test_resolve_operators(self):
+        """Test resolving AND, OR and NOT expressions."""
+        self.assertEqual(self.resolve("user:john+device:mobile"), {"device_tracker.john_phone"})
+        self.assertEqual(
+            self.resolve("user:john|user:jane"),
+            {"device_tracker.john_phone", "media_player.john_speaker", "device_tracker.jane_phone"}
+        )
+        self.assertEqual(self.resolve("user:john-area:bedroom"), {"device_tracker.john_phone"})
+        self.assertEqual(self.resolve("user:nobody"), set())
+    
+    def test_wildcard_is_universe(self):
+        """Test that '*' resolves to every known entity."""
+        self.assertEqual(len(self.index.resolve(TagLiteral("*"))), 4)
+        self.assertIn("light.kitchen", self.index.universe)
+    
+    def test_update_entity(self):
+        """Test that updates move entities between postings."""
+        old_tags = self.index.update_entity("device_tracker.john_phone", ["user:john", "area:home"])
+        
+        self.assertEqual(old_tags, frozenset(["user:john", "device:mobile"]))
+        self.assertEqual(self.index.entities_with_tag("device:mobile"), {"device_tracker.jane_phone"})
+        self.assertEqual(self.index.cardinality("area:home"), 2)
+    
+    def test_remove_entity(self):
+        """Test removing an entity from the index."""
+        self.index.remove_entity("device_tracker.jane_phone")
+        
+        self.assertNotIn("device_tracker.jane_phone", self.index.universe)
+        self.assertNotIn("user:jane", self.index.get_all_tags())
+    
+    def test_results_are_copies(self):
+        """Test that callers cannot modify the index through results."""
+        self.resolve("user:john").clear()
+        self.assertEqual(self.index.cardinality("user:john"), 2)
+    
+    def test_matches_reference_evaluation(self):
+        """Test set-algebra results against TagNode.evaluate() on random data."""
+        rng = random.Random(3)
+        tags = [f"tag:t{i}" for i in range(8)]
+        entity_tags = {
+            f"sensor.e{i}": [tag for tag in tags if rng.random() < 0.3] for i in range(100)
+        }
+        index = TagIndex()
+        index.rebuild(entity_tags)
+        
+        for _ in range(100):
+            expression = rng.choice(tags)
+            for _ in range(rng.randint(1, 5)):
+                expression += rng.choice("+|-") + rng.choice(tags)
+            tree = self.parser.parse(expression)
+            expected = {entity_id for entity_id, t in entity_tags.items() if tree.evaluate(t)}
+            self.assertEqual(index.resolve(tree), expected, expression)
+            self.assertEqual(set(index.entities_in_mask(index.match_mask(tree))), expected)
+            self.assertEqual(set(index._resolve(tree)), expected)
+    
+    def test_bitmaps_follow_updates(self):
+        """Test that bitmaps stay consistent with updates and removals."""
+        tree = self.parser.parse("device:mobile|area:bedroom")
+        self.index.update_entity("light.kitchen", ["device:mobile"])
+        self.index.remove_entity("device_tracker.john_phone")
+        
+        self.assertEqual(
+            set(self.index.entities_in_mask(self.index.match_mask(tree))),
+            {"light.kitchen", "device_tracker.jane_phone", "media_player.john_speaker"}
+        )
+        self.assertEqual(
+            self.index.entities_in_mask(self.index.match_mask(TagLiteral("*"))),
+            ["light.kitchen", "media_player.john_speaker", "device_tracker.jane_phone"]
+        )
+
+
+class TestPrefixWildcards(unittest.TestCase):
+    """Test cases for resolving wildcard tags through the sorted tag dictionary."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.parser = TagExpressionParser()
+        self.index = TagIndex()
+        self.index.rebuild({
+            "device_tracker.john_phone": ["user:john", "device:mobile"],
+            "media_player.bedroom": ["device:speaker", "area:bedroom"],
+            "media_player.bath": ["device:speaker", "area:bathroom"],
+            "light.bed": ["area:bed"],
+            "light.kitchen": ["area:kitchen"],
+        })
+    
+    def resolve(self, expression):
+        return self.index.resolve(self.parser.parse(expression))
+    
+    def test_expand_prefix(self):
+        """Test expanding a prefix to the matching tags."""
+        self.assertEqual(self.index.expand_prefix("area:bed"), ["area:bed", "area:bedroom"])
+        self.assertEqual(self.index.expand_prefix("device:"), ["device:mobile", "device:speaker"])
+        self.assertEqual(self.index.expand_prefix("zone:"), [])
+    
+    def test_resolve_prefix(self):
+        """Test resolving namespace and value prefix wildcards."""
+        self.assertEqual(self.resolve("area:bed*"), {"media_player.bedroom", "light.bed"})
+        self.assertEqual(self.resolve("user:john+device:*"), {"device_tracker.john_phone"})
+        self.assertEqual(self.resolve("area:*-device:*"), {"light.bed", "light.kitchen"})
+        self.assertEqual(self.index.cardinality("device:*"), 3)
+    
+    def test_prefix_follows_updates(self):
+        """Test that the tag dictionary follows tag additions and removals."""
+        self.index.update_entity("light.kitchen", ["area:bedroom_2"])
+        self.index.update_entity("light.bed", [])
+        
+        self.assertEqual(self.index.expand_prefix("area:bed"), ["area:bedroom", "area:bedroom_2"])
+        self.assertEqual(self.resolve("area:bed*"), {"media_player.bedroom", "light.kitchen"})
+        mask = self.index.match_mask(self.parser.parse("area:bed*"))
+        self.assertEqual(set(self.index.entities_in_mask(mask)), {"media_player.bedroom", "light.kitchen"})
+
+
+class TestSelectivity(unittest.TestCase):
+    """Test cases for selectivity-aware ordering and cardinality estimates."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        entity_tags = {}
+        for i in range(100):
+            tags = ["area:home"]
+            if i < 10:
+                tags.append("device:mobile")
+            if i < 2:
+                tags.append("user:john")
+            entity_tags[f"sensor.s{i}"] = tags
+        self.index = TagIndex()
+        self.index.rebuild(entity_tags)
+    
+    def test_and_orders_most_selective_first(self):
+        """Test that AND operands are ordered from fewest to most matches."""
+        plan = self.index.optimize(compile_expression("area:home+device:mobile+user:john"))
+        
+        operands = [operand.tag for operand in chain_operands(plan.tree, plan.tree.operator_type)]
+        self.assertEqual(operands, ["user:john", "device:mobile", "area:home"])
+        self.assertTrue(plan.source.startswith("('user:john' in t"))
+    
+    def test_or_orders_most_inclusive_first(self):
+        """Test that OR operands are ordered from most to fewest matches."""
+        plan = self.index.optimize(compile_expression("user:john|device:mobile|area:home"))
+        
+        operands = [operand.tag for operand in chain_operands(plan.tree, plan.tree.operator_type)]
+        self.assertEqual(operands, ["area:home", "device:mobile", "user:john"])
+    
+    def test_reordering_preserves_results(self):
+        """Test that optimized plans give the same results as the original."""
+        for expression in ["area:home+device:mobile-user:john",
+                           "(user:john|device:mobile)+area:home",
+                           "area:home-(device:mobile|user:john)"]:
+            compiled = compile_expression(expression)
+            plan = self.index.optimize(compiled)
+            self.assertEqual(plan.expression, compiled.expression)
+            for tags in [["area:home"], ["area:home", "device:mobile"],
+                         ["area:home", "device:mobile", "user:john"]]:
+                self.assertEqual(plan.evaluate(tags), compiled.evaluate(tags), expression)
+    
+    def test_estimate_cardinality(self):
+        """Test cardinality estimates without evaluation."""
+        estimate = lambda expression: self.index.estimate_cardinality(compile_expression(expression))
+        
+        self.assertEqual(estimate("device:mobile"), 10)
+        self.assertEqual(estimate("*"), 100)
+        self.assertEqual(estimate("user:nobody"), 0)
+        self.assertEqual(estimate("area:home+device:mobile"), 10)
+        self.assertEqual(estimate("area:home-area:home"), 0)
+        self.assertEqual(estimate("device:mobile|area:home"), 100)
+        self.assertLessEqual(estimate("device:mobile+user:john"), 2)
+
+
+class TestEntityManagerIndex(unittest.TestCase):
+    """Test cases for keeping the tag index in sync with EntityManager writes."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.manager = EntityManager(demo_mode=True)
+    
+    def test_set_entity_tags_updates_index(self):
+        """Test that set_entity_tags keeps the index current."""
+        self.assertIn("person.john", self.manager.find_entities_by_tag("user:john"))
+        
+        self.manager.set_entity_tags("person.john", ["user:johnny"])
+        
+        self.assertNotIn("person.john", self.manager.find_entities_by_tag("user:john"))
+        self.assertEqual(self.manager.resolve_expression("user:johnny"), ["person.john"])
+    
+    def test_batch_update_tags_updates_index(self):
+        """Test that batch updates keep the index current."""
+        self.manager.tag_index
+        self.manager.batch_update_tags(["light.kitchen", "light.bedroom"], ["area:indexed"])
+        
+        self.assertEqual(
+            self.manager.resolve_expression("area:indexed"),
+            ["light.bedroom", "light.kitchen"]
+        )
+    
+    def test_remove_entity_updates_index_and_evaluator(self):
+        """Test that a removed entity leaves the index and an already built batch evaluator."""
+        self.assertIn("person.john", self.manager.resolve_expressions(["user:john"])["user:john"])
+        removed = []
+        self.manager.add_tag_listener(lambda entity_id, old_tags, new_tags: removed.append((entity_id, new_tags)))
+        
+        self.manager.remove_entity("person.john")
+        
+        self.assertNotIn("person.john", self.manager.tag_index)
+        self.assertNotIn("person.john", self.manager.resolve_expressions(["user:john"])["user:john"])
+        self.assertEqual(removed, [("person.john", None)])
+    
+    def test_new_entities_join_index(self):
+        """Test that entities reported after the index was built are added to it."""
+        self.assertNotIn("sensor.hall_tablet", self.manager.resolve_expression("*"))
+        
+        self.manager.on_entity_state_changed("sensor.hall_tablet", {"entity_id": "sensor.hall_tablet", "state": "on"})
+        
+        self.assertIn("sensor.hall_tablet", self.manager.resolve_expression("*"))
+        self.assertIn("sensor.hall_tablet", self.manager.resolve_expressions(["*"])["*"])
+        
+        self.manager.on_entity_state_changed("sensor.hall_tablet", None)
+        
+        self.assertNotIn("sensor.hall_tablet", self.manager.resolve_expression("*"))
+
+
+if __name__ == "__main__":
+    unittest.main()
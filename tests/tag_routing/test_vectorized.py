@@ -0,0 +1,130 @@
+"""
+Unit tests for vectorized batch evaluation.
+"""
+
+import random
+import unittest
+import pytest
+from smart_notification_router.tag_routing.compiler import compile_expression
+from smart_notification_router.tag_routing.entity_manager import EntityManager
+from smart_notification_router.tag_routing.tag_index import TagIndex
+from smart_notification_router.tag_routing import vectorized
+from smart_notification_router.tag_routing.vectorized import BatchEvaluator
+
+
+class BatchEvaluatorTests:
+    """Shared test cases for both batch evaluation backends."""
+    
+    use_numpy = True
+    
+    def setUp(self):
+        """Set up test environment."""
+        rng = random.Random(11)
+        self.tags = [f"tag:t{i}" for i in range(6)]
+        self.entity_tags = {
+            f"sensor.e{i}": [tag for tag in self.tags if rng.random() < 0.4] for i in range(200)
+        }
+        self.index = TagIndex()
+        self.index.rebuild(self.entity_tags, entity_ids=["light.untagged"])
+        self.evaluator = BatchEvaluator(self.index, use_numpy=self.use_numpy)
+        self.expressions = ["tag:t0", "tag:t1+tag:t2", "tag:t3|tag:t4-tag:t5", "(tag:t0|tag:t1)-tag:t2"]
+    
+    def test_matches_index_resolution(self):
+        """Test that batch results equal single-expression index resolution."""
+        results = self.evaluator.evaluate(self.expressions)
+        
+        for expression in self.expressions:
+            self.assertEqual(results[expression], sorted(self._resolve(expression)))
+    
+    def test_membership_vectors(self):
+        """Test that membership vectors line up with entity IDs."""
+        entity_ids, vectors = self.evaluator.evaluate_vectors(["tag:t0"])
+        
+        matched = {entity_id for entity_id, member in zip(entity_ids, vectors["tag:t0"]) if member}
+        self.assertEqual(matched, self._resolve("tag:t0"))
+        self.assertEqual(len(entity_ids), 201)
+    
+    def test_incremental_updates(self):
+        """Test that tag changes after the first batch are reflected."""
+        self.evaluator.evaluate(["tag:t0"])
+        
+        self.index.update_entity("light.untagged", ["tag:t0", "tag:new"])
+        self.evaluator.update_entity("light.untagged", ["tag:t0", "tag:new"])
+        
+        results = self.evaluator.evaluate(["tag:t0", "tag:new"])
+        self.assertIn("light.untagged", results["tag:t0"])
+        self.assertEqual(results["tag:new"], ["light.untagged"])
+    
+    def test_removed_entity(self):
+        """Test that an entity removed after the first batch no longer matches."""
+        self.evaluator.evaluate(["tag:t0"])
+        removed = sorted(self._resolve("tag:t0"))[0]
+        
+        self.index.remove_entity(removed)
+        self.evaluator.remove_entity(removed)
+        
+        self.assertNotIn(removed, self.evaluator.evaluate(["tag:t0", "*"])["tag:t0"])
+        entity_ids, _ = self.evaluator.evaluate_vectors(["*"])
+        self.assertNotIn(removed, entity_ids)
+    
+    def _resolve(self, expression):
+        return self.index.resolve(compile_expression(expression))
+
+
+@unittest.skipUnless(vectorized.np is not None, "NumPy is not installed")
+class TestNumpyBatchEvaluator(BatchEvaluatorTests, unittest.TestCase):
+    """Test cases for the NumPy backend."""
+    
+    use_numpy = True
+    
+    def test_backend(self):
+        """Test that the NumPy backend is selected."""
+        self.assertEqual(self.evaluator.backend, vectorized.BACKEND_NUMPY)
+
+
+class TestBitsetBatchEvaluator(BatchEvaluatorTests, unittest.TestCase):
+    """Test cases for the pure-Python bitset fallback."""
+    
+    use_numpy = False
+    
+    def test_backend(self):
+        """Test that the bitset backend is selected."""
+        self.assertEqual(self.evaluator.backend, vectorized.BACKEND_BITSET)
+
+
+class TestBackendsAgree(unittest.TestCase):
+    """Test cases comparing the NumPy backend with the bitset fallback."""
+    
+    def test_same_results(self):
+        """Test that both backends give the same results through tag changes and removals."""
+        pytest.importorskip("numpy")
+        manager = EntityManager(demo_mode=True)
+        expressions = ["user:john", "device:mobile|area:home", "*-user:john", "user:*+device:*"]
+        numpy_evaluator = BatchEvaluator(manager.tag_index, use_numpy=True)
+        bitset_evaluator = BatchEvaluator(manager.tag_index, use_numpy=False)
+        manager._batch_evaluator = numpy_evaluator
+        
+        def check():
+            self.assertEqual(numpy_evaluator.evaluate(expressions), bitset_evaluator.evaluate(expressions))
+            numpy_vectors = self._memberships(*numpy_evaluator.evaluate_vectors(expressions))
+            self.assertEqual(numpy_vectors, self._memberships(*bitset_evaluator.evaluate_vectors(expressions)))
+        
+        check()
+        manager.set_entity_tags("light.kitchen", ["user:john", "device:mobile"])
+        manager.set_entity_tags("sensor.new", ["area:home"])
+        check()
+        manager.remove_entity("person.john")
+        manager.remove_entity("light.kitchen")
+        check()
+        self.assertNotIn("light.kitchen", numpy_evaluator.evaluate(["user:john"])["user:john"])
+    
+    @staticmethod
+    def _memberships(entity_ids, vectors):
+        return {
+            expression: {entity_id: bool(member) for entity_id, member in zip(entity_ids, vector)}
+            for expression, vector in vectors.items()
+        }
+
+
+if __name__ == "__main__":
+    unittest.main()
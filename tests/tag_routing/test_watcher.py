@@ -0,0 +1,111 @@
+"""
+Unit tests for the Home Assistant state watcher.
+"""
+
+import unittest
+from smart_notification_router.tag_routing.watcher import StateWatcher
+
+
+class FakeClient:
+    """API client stub with editable states and services."""
+
+    def __init__(self):
+        self.states = {
+            "person.john": {"entity_id": "person.john", "state": "home"},
+            "person.jane": {"entity_id": "person.jane", "state": "home"},
+        }
+        self.services = [{"domain": "notify", "services": {"john_phone": {}}}]
+        self.available = True
+
+    def get_entity_states(self, entity_ids=None):
+        return dict(self.states) if self.available else None
+
+    def get_services(self):
+        return list(self.services) if self.available else None
+
+
+class TestStateWatcher(unittest.TestCase):
+    """Test cases for the StateWatcher class."""
+
+    def setUp(self):
+        """Set up test environment."""
+        self.client = FakeClient()
+        self.watcher = StateWatcher(self.client, interval=60)
+        self.state_changes = []
+        self.service_changes = []
+        self.watcher.add_state_listener(lambda entity_id, state: self.state_changes.append((entity_id, state)))
+        self.watcher.add_services_listener(self.service_changes.append)
+
+    def test_first_poll_is_baseline(self):
+        """Test that the first poll reports nothing."""
+        self.assertEqual(self.watcher.poll(), 0)
+        self.assertEqual(self.watcher.poll(), 0)
+
+        self.assertEqual(self.state_changes, [])
+        self.assertEqual(self.service_changes, [])
+
+    def test_changed_and_removed_states(self):
+        """Test that changed, new and removed entities are reported."""
+        self.watcher.poll()
+        self.client.states["person.john"] = {"entity_id": "person.john", "state": "not_home"}
+        self.client.states["person.guest"] = {"entity_id": "person.guest", "state": "home"}
+        del self.client.states["person.jane"]
+
+        self.assertEqual(self.watcher.poll(), 3)
+
+        self.assertEqual(dict(self.state_changes), {
+            "person.john": {"entity_id": "person.john", "state": "not_home"},
+            "person.guest": {"entity_id": "person.guest", "state": "home"},
+            "person.jane": None,
+        })
+        self.assertEqual(self.watcher.stats(), {"interval": 60, "polls": 2, "failures": 0, "changes": 3})
+
+    def test_services_changed(self):
+        """Test that a changed service registry is reported once."""
+        self.watcher.poll()
+        self.client.services = self.client.services + [{"domain": "tts", "services": {"speak": {}}}]
+
+        self.watcher.poll()
+        self.watcher.poll()
+
+        self.assertEqual(self.service_changes, [self.client.services])
+
+    def test_failed_fetch_keeps_snapshot(self):
+        """Test that an unreachable API is not reported as removed entities and services."""
+        self.watcher.poll()
+        self.client.available = False
+
+        self.assertEqual(self.watcher.poll(), 0)
+        self.assertEqual(self.state_changes, [])
+        self.assertEqual(self.service_changes, [])
+
+        self.client.available = True
+        self.client.states["person.john"] = {"entity_id": "person.john", "state": "not_home"}
+        self.assertEqual(self.watcher.poll(), 1)
+        self.assertEqual([entity_id for entity_id, _ in self.state_changes], ["person.john"])
+        self.assertEqual(self.service_changes, [])
+        self.assertEqual(self.watcher.stats()["failures"], 1)
+
+    def test_listener_errors_are_contained(self):
+        """Test that a failing listener does not stop the others."""
+        def failing(entity_id, state):
+            raise RuntimeError("boom")
+
+        self.watcher._state_listeners.insert(0, failing)
+        self.watcher.poll()
+        self.client.states["person.john"] = {"entity_id": "person.john", "state": "not_home"}
+
+        self.watcher.poll()
+
+        self.assertEqual([entity_id for entity_id, _ in self.state_changes], ["person.john"])
+
+    def test_start_stop(self):
+        """Test that the background thread stops promptly."""
+        self.watcher.start()
+        self.watcher.stop()
+
+        self.assertEqual(self.watcher.stats()["polls"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()